@@ -0,0 +1,168 @@
+"""
+Loading of columnar exports (Parquet, Arrow IPC / Feather).
+
+Columnar files are read one record batch at a time and never turned into Python rows: sensor names and
+units are mapped to ids with Arrow compute kernels against arrays built once from the preloaded dimension
+lookups, invalid rows are dropped with a single mask, and the batch is encoded to CSV by Arrow itself and
+streamed into the same COPY loader the CSV strategies use.
+
+pyarrow is an optional dependency (`poetry install --extras parquet`).
+"""
+import datetime
+import io
+import typing
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from app.utils.datetime import generate_utc_dt
+from ETL.loader import LoadReport, copy_csv, get_engine
+from ETL.strategies import SENSORS, STRATEGIES, UNITS
+from ETL.validate import INTEGER_RANGE
+
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc", ".arrows")
+COLUMNAR_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+
+def is_columnar(file_path: str) -> bool:
+    return file_path.lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def iter_record_batches(file_path: str, batch_size: int) -> typing.Iterator[pa.RecordBatch]:
+    if file_path.lower().endswith(PARQUET_EXTENSIONS):
+        yield from pq.ParquetFile(file_path).iter_batches(batch_size=batch_size)
+        return
+    # Feather v2 is the Arrow IPC file format; fall back to the streaming format otherwise
+    with pa.memory_map(file_path) as source:
+        try:
+            reader = pyarrow.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pyarrow.ipc.open_stream(source)
+        for batch in batches:
+            # IPC batches are as large as the writer made them, slice them to bound the COPY size
+            for offset in range(0, batch.num_rows, batch_size):
+                yield batch.slice(offset, batch_size)
+
+
+class ColumnLookup:
+    """A dimension lookup as Arrow arrays: the keys, and one array per selected column."""
+
+    def __init__(self, cache: dict[typing.Any, typing.Any], columns: typing.Sequence[str]) -> None:
+        rows = [row for row in cache.values() if row is not None]
+        self.keys = pa.array([row[0] for row in rows], type=pa.string())
+        self.columns = {name: pa.array([getattr(row, name) for row in rows], type=pa.int64()) for name in columns}
+
+    def indices(self, keys: pa.Array) -> pa.Array:
+        # Unknown keys get a null index, and therefore a null id
+        return pc.index_in(pc.cast(keys, pa.string()), value_set=self.keys)
+
+    def take(self, column: str, indices: pa.Array) -> pa.Array:
+        return pc.take(self.columns[column], indices)
+
+
+def _to_float(column: pa.Array) -> pa.Array:
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        # Values that are not numbers become null instead of failing the whole batch
+        column = pc.utf8_trim_whitespace(column)
+        is_number = pc.match_substring_regex(column, r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+        column = pc.if_else(is_number, column, pa.scalar(None, column.type))
+    return pc.cast(column, pa.float64())
+
+
+def _to_value(values: pa.Array) -> pa.Array:
+    # reading.value is a 32-bit integer column, but loggers export measurements as decimals.
+    # NaN, infinities and values out of range become null, the cast would fail the batch on them.
+    values = pc.round(values)
+    in_range = pc.and_kleene(
+        pc.is_finite(values),
+        pc.and_kleene(pc.greater_equal(values, INTEGER_RANGE[0]), pc.less_equal(values, INTEGER_RANGE[1])),
+    )
+    return pc.cast(pc.if_else(in_range, values, pa.scalar(None, values.type)), pa.int64())
+
+
+def _parse_timestamp(value: str | None) -> datetime.datetime | None:
+    try:
+        # Like the CSV strategies: PostgreSQL ignores the offset of timestamps loaded into reading.time
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_timestamp(column: pa.Array) -> pa.Array:
+    if pa.types.is_timestamp(column.type):
+        # reading.time is stored without time zone
+        return pc.local_timestamp(column) if column.type.tz else column
+    column = pc.cast(column, pa.string())
+    try:
+        # Drop the zone offset, which the cast refuses for a timestamp without time zone
+        return pc.cast(pc.replace_substring_regex(column, r"(Z|[+-]\d{2}:?\d{2})$", ""), pa.timestamp("us"))
+    except pa.ArrowInvalid:
+        # Some value is not a timestamp: parse value by value, so only those rows are rejected
+        return pa.array([_parse_timestamp(value) for value in column.to_pylist()], type=pa.timestamp("us"))
+
+
+def transform_structure2(batch: pa.RecordBatch, sensors: ColumnLookup, units: ColumnLookup) -> pa.Table:
+    """The columnar twin of `ETL.strategies.load_structure2`."""
+    sensor_indices = sensors.indices(batch.column("Identifier"))
+    unit_indices = units.indices(batch.column("MeasurementUnit"))
+    values = _to_float(batch.column("Measurement"))
+    now = pa.scalar(generate_utc_dt(), pa.timestamp("us", tz="UTC"))
+    table = pa.table({
+        "crossection_id": sensors.take("crossection_id", sensor_indices),
+        "location_in_topology_id": sensors.take("location_in_topology_id", sensor_indices),
+        "unit_id": units.take("id", unit_indices),
+        "sensor_type_id": sensors.take("sensor_type_id", sensor_indices),
+        "sensor_id": sensors.take("id", sensor_indices),
+        "value": _to_value(values),
+        "time": _to_timestamp(batch.column("Time")),
+    })
+    valid = pc.and_kleene(
+        pc.and_kleene(pc.is_valid(table["crossection_id"]), pc.is_valid(table["unit_id"])),
+        pc.and_kleene(pc.is_valid(table["value"]), pc.is_valid(table["time"])),
+    )
+    table = table.filter(valid)
+    return table.append_column("created_at", pa.repeat(now, table.num_rows)).append_column(
+        "updated_at", pa.repeat(now, table.num_rows)
+    )
+
+
+COLUMNAR_STRATEGIES = {
+    "structure2": transform_structure2,
+}
+
+
+def load_columnar(file_path: str, strategy_name: str, batch_size: int) -> LoadReport:
+    """Stream a Parquet or Arrow file through a columnar strategy into the database."""
+    if strategy_name not in COLUMNAR_STRATEGIES:
+        msg = f"Strategy {strategy_name} cannot load columnar files"
+        raise ValueError(msg)
+    transform = COLUMNAR_STRATEGIES[strategy_name]
+    strategy = STRATEGIES[strategy_name]
+    report = LoadReport()
+    engine = get_engine()
+    with engine.connect() as connection:
+        for lookup in (SENSORS, UNITS):
+            lookup.preload(connection)
+    sensors = ColumnLookup(SENSORS.cache, ("id", "sensor_type_id", "location_in_topology_id", "crossection_id"))
+    units = ColumnLookup(UNITS.cache, ("id",))
+    write_options = pyarrow.csv.WriteOptions(include_header=False)
+
+    for batch in iter_record_batches(file_path, batch_size):
+        table = transform(batch, sensors, units).select(list(strategy.columns))
+        if table.num_rows:
+            buffer = io.BytesIO()
+            pyarrow.csv.write_csv(table, buffer, write_options)
+            with engine.begin() as connection:
+                copy_csv(connection, strategy.table, strategy.columns, buffer.getvalue())
+        report.rows_read += batch.num_rows
+        report.rows_loaded += table.num_rows
+        report.rows_rejected += batch.num_rows - table.num_rows
+        report.chunks += 1
+    return report
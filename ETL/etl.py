@@ -1,26 +1,24 @@
-import csv
-from app.apps.dykes.models import Dyke, Crossection, Reading, Sensor, SensorType, UnitOfMeasure, LocationInTopology, Topology
-
-import sqlalchemy as sa
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-
-# import settings from fastAPI module
-from app.settings import Settings
+import argparse
+import datetime
+import glob
+import os
 
 from dotenv import load_dotenv
-import argparse
 
-load_dotenv()
+from ETL.incremental import SCHEDULE_INTERVALS, load_incremental, run_scheduler
+from ETL.loader import LoadReport, copy_rows, get_engine, iter_csv_chunks
+from ETL.parallel import load_parallel
+from ETL.strategies import STRATEGIES
+from ETL.validate import VALIDATORS
 
-settings = Settings()
+try:
+    from ETL import columnar
+except ImportError:  # pyarrow is optional, without it only CSV files can be loaded
+    columnar = None
 
-DATABASE_URL = settings.db_dsn  # Adjust your database URL accordingly
+load_dotenv()
 
-# create a session
-engine = sa.create_engine(DATABASE_URL, echo=True)
-Session = sessionmaker(bind=engine)
-session = Session()
+DEFAULT_CHUNK_SIZE = 50_000
 
 # FILTERS TO PREPROCESS DATASET AND RENAME SENSORS
 def get_sensor_name(current_sensor_name):
@@ -47,78 +45,96 @@ def gen_sensor_code(sensor_batch: list) -> str:
     # The list of sensors in a measurement vertical
     pass
 
-# STRATEGY FUNCTIONS TO APPLY TO DIFFERENT CSV FILES
-# Dyke strategy func
-def load_dyke(row, session):
-    pass
-
-# Crossection strategy function
-def load_crossection():
-    pass
-
-# Unit strategy function
-
-# Sensor type strategy function
-
-# Strategy function to create sensor and its location
+# General loader function that takes a strategy
+def load_data(file_path, strategy, chunk_size=DEFAULT_CHUNK_SIZE) -> LoadReport:
+    """ A routine to stream a csv file through a strategy into the database.
 
-# Strategy function to load reading ...
-
-# Strategy for loading data with structure 1
-def load_sensor(row, session):
-    '''
-    A note on the row:
-    The row should have the proper name of the
-    
-    '''
-    # Get sensor type id based on name provided in 
-    location = "" # gets the location from the name
-
-    sensor = Sensor(name=row["Sensor ID"],
-                    sensor_type_id=row["Type"], # How do we get the id by name (Maybe create a method in model)
-                    location_in_tpology_id="",
-                    is_active=True) # True by default
-    
-    session.add(sensor)
-    session.commit()
-
-# Strategy for loading data with structure 2
-def load_structure2(row):
-    return {
-        "id": row["Identifier"],
-        "value": row["Measurement"],
-        "timestamp": row["Time"],
-        "unit": row["MeasurementUnit"]
-    }
-
-# General loader function that takes a strategy function
-def load_data(file_path, strategy_func):
-    """ A routine to apply a strategy function to a csv file
+    Every chunk is transformed and loaded with COPY in its own transaction, so memory use is bounded
+    by `chunk_size` no matter how large the file is.
+    """
+    report = LoadReport()
+    engine = get_engine()
+    for chunk, _ in iter_csv_chunks(file_path, chunk_size):
+        with engine.begin() as connection:
+            rows, rejected = strategy.transform(chunk, connection)
+            report.rows_loaded += copy_rows(connection, strategy.table, strategy.columns, rows)
+        report.rows_read += rows_in_chunk(chunk)
+        report.rows_rejected += rejected
+        report.chunks += 1
+    return report
+
+
+def rows_in_chunk(chunk: dict[str, list[str]]) -> int:
+    return len(next(iter(chunk.values()), []))
+
+
+def expand_sources(path: str) -> list[str]:
+    """ The files to load for a path: the file itself, every csv (or, with pyarrow, columnar) file in a
+    directory, or the matches of a glob pattern. Files are sorted, so readings of a sensor spread over several
+    files are loaded in order.
     """
-    loaded_data = []
-    with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            data = strategy_func(row)
-            loaded_data.append(data)
-            # Process each loaded data
-            print(f"Processing data: {data}")
-            # Add your specific processing logic here
-    return loaded_data
+    if os.path.isdir(path):
+        extensions = (".csv", *(columnar.COLUMNAR_EXTENSIONS if columnar is not None else ()))
+        return sorted(
+            file_path for file_path in glob.glob(os.path.join(path, "*")) if file_path.lower().endswith(extensions)
+        )
+    if glob.has_magic(path):
+        return sorted(glob.glob(path, recursive=True))
+    return [path]
+
 
 # Example usage
 if __name__ == "__main__":
     # Create a command line interface where we pass the file path and the strategy function
     parser = argparse.ArgumentParser(description='ETL Command Line Interface')
-    parser.add_argument('file_path', type=str, help='Path to the CSV file')
-    parser.add_argument('strategy', type=str, choices=['dyke', 'sensor', 'structure2'], help='Strategy function to apply')
+    parser.add_argument('file_path', type=str,
+                        help='Path to the CSV (or Parquet/Arrow) file, a directory of such files or a glob pattern')
+    parser.add_argument('strategy', type=str, choices=list(STRATEGIES), help='Strategy function to apply')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows read and loaded per chunk')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only load what was added to the file since the previous incremental load')
+    parser.add_argument('--schedule', choices=list(SCHEDULE_INTERVALS),
+                        help='Keep running and load incrementally every hour or every day')
+    parser.add_argument('--at', type=datetime.time.fromisoformat, default=datetime.time(0, 0),
+                        help='Time of day (daily) or minute of the hour (hourly) to load at, e.g. 00:00')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes parsing files in parallel (default: one per CPU)')
+    parser.add_argument('--loaders', type=int, default=4,
+                        help='Database connections loading parsed files in parallel')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only validate the files and write rejected rows to a reject file, without loading')
+    parser.add_argument('--reject-file', type=str, default=None,
+                        help='Where a dry run writes rejected rows (default: <file>.rejects.csv)')
+    parser.add_argument('--value-range', type=float, nargs=2, metavar=('MIN', 'MAX'), default=None,
+                        help='Measurements outside this range are rejected by a dry run')
     args = parser.parse_args()
-
-    if args.strategy == 'dyke':
-        load_data(args.file_path, load_dyke)
-    elif args.strategy == 'sensor':
-        load_data(args.file_path, load_sensor)
-    elif args.strategy == 'structure2':
-        load_data(args.file_path, load_structure2)
+    strategy = STRATEGIES[args.strategy]
+    file_paths = expand_sources(args.file_path)
+    if not file_paths:
+        parser.error(f"no files to load at {args.file_path}")
+    columnar_paths = [file_path for file_path in file_paths if columnar is not None and columnar.is_columnar(file_path)]
+    csv_paths = [file_path for file_path in file_paths if file_path not in columnar_paths]
+    if columnar_paths and (args.dry_run or args.incremental or args.schedule):
+        parser.error("--dry-run, --incremental and --schedule only support CSV files")
+    if args.reject_file and len(file_paths) > 1:
+        parser.error("--reject-file needs a single file, several files get <file>.rejects.csv each")
+
+    if args.dry_run:
+        if args.strategy not in VALIDATORS:
+            parser.error(f"strategy {args.strategy} has no dry-run validation")
+        for file_path in file_paths:
+            reject_path = args.reject_file or f"{file_path}.rejects.csv"
+            report = VALIDATORS[args.strategy](file_path, args.chunk_size, reject_path, args.value_range)
+            print(f"{file_path}: {report.summary()}\n  rejected rows written to {reject_path}")
+    elif args.schedule:
+        run_scheduler(file_paths, strategy, args.chunk_size, args.schedule, args.at)
+    elif args.incremental:
+        for file_path in file_paths:
+            print(f"{file_path}: {load_incremental(file_path, strategy, args.chunk_size).summary()}")
     else:
-         print("Invalid strategy. Please choose 'dyke', 'sensor', or 'structure2'.")
\ No newline at end of file
+        for file_path in columnar_paths:
+            print(f"{file_path}: {columnar.load_columnar(file_path, args.strategy, args.chunk_size).summary()}")
+        if len(csv_paths) > 1 or (csv_paths and args.workers):
+            print(load_parallel(csv_paths, args.strategy, args.chunk_size, args.workers, args.loaders).summary())
+        elif csv_paths:
+            print(load_data(csv_paths[0], strategy, args.chunk_size).summary())
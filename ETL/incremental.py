@@ -0,0 +1,181 @@
+"""
+Incremental and scheduled loading.
+
+Loggers keep appending to the same export files, so reloading a whole archive every night takes longer
+every day. Instead an incremental load only reads a source file from the byte offset reached by the
+previous load. Everything behind that offset is new, including readings that arrive late or out of order.
+
+When the file was rotated or rewritten from the start (it is smaller than the offset, or its first bytes
+changed) it is read again from the beginning. Only then are rows dropped that are not newer than the
+latest reading loaded for their sensor, since those were loaded from the previous file.
+
+Offsets, a hash of the start of the file and the per-sensor marks are stored in `etl_source` /
+`etl_sensor_mark` (see ETL/models.py) and written in the same transaction as each chunk of readings. A
+load that crashes halfway can simply be run again: it resumes after the last committed chunk without
+loading anything twice. Rows rejected by the strategy (e.g. for a sensor that is not registered yet) are
+not retried by later runs; find them beforehand with a dry run (`--dry-run`).
+"""
+import datetime
+import hashlib
+import os
+import time
+import typing
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.utils.datetime import generate_utc_dt
+from ETL.loader import LoadReport, Strategy, copy_rows, get_engine, iter_csv_chunks
+from ETL.models import EtlSensorMark, EtlSource
+from ETL.strategies import LOOKUPS
+
+
+# Bytes at the start of a file that identify it
+IDENTITY_BYTES = 4096
+
+SCHEDULE_INTERVALS = {
+    "hourly": datetime.timedelta(hours=1),
+    "daily": datetime.timedelta(days=1),
+}
+
+
+def _get_source(connection: sa.Connection, name: str) -> sa.Row[typing.Any]:
+    now = generate_utc_dt()
+    connection.execute(
+        postgresql.insert(EtlSource.__table__)
+        .values(name=name, file_offset=0, created_at=now, updated_at=now)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    return connection.execute(
+        sa.select(EtlSource.id, EtlSource.file_offset, EtlSource.file_identity).where(EtlSource.name == name)
+    ).one()
+
+
+def file_identity(file_path: str, file_offset: int) -> str:
+    """Hash of the start of the file, up to what was loaded from it, which changes when the file is rotated."""
+    with open(file_path, "rb") as file:
+        return hashlib.sha1(file.read(min(IDENTITY_BYTES, file_offset))).hexdigest()
+
+
+def _save_marks(
+    connection: sa.Connection,
+    source_id: int,
+    file_offset: int,
+    identity: str,
+    sensor_marks: dict[int, datetime.datetime],
+) -> None:
+    now = generate_utc_dt()
+    if sensor_marks:
+        statement = postgresql.insert(EtlSensorMark.__table__)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["source_id", "sensor_id"],
+                set_={
+                    "last_time": sa.func.greatest(EtlSensorMark.__table__.c.last_time, statement.excluded.last_time),
+                    "updated_at": now,
+                },
+            ),
+            [
+                {"source_id": source_id, "sensor_id": sensor_id, "last_time": last_time,
+                 "created_at": now, "updated_at": now}
+                for sensor_id, last_time in sensor_marks.items()
+            ],
+        )
+    connection.execute(
+        sa.update(EtlSource.__table__)
+        .where(EtlSource.__table__.c.id == source_id)
+        .values(file_offset=file_offset, file_identity=identity, updated_at=now)
+    )
+
+
+def load_incremental(file_path: str, strategy: Strategy, chunk_size: int) -> LoadReport:
+    """Load whatever was added to `file_path` since the previous incremental load."""
+    report = LoadReport()
+    name = os.path.realpath(file_path)
+    engine = get_engine()
+
+    # Two loads of the same source at once would both load the new rows, so the source is locked for
+    # the whole run. The lock belongs to this connection and is released if the process dies.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        if not lock_connection.execute(sa.select(sa.func.pg_try_advisory_lock(sa.func.hashtext(name)))).scalar():
+            print(f"Skipping {file_path}: it is being loaded by another process")
+            return report
+        try:
+            # Sensors and units may have been registered since the previous (scheduled) run
+            for lookup in LOOKUPS:
+                lookup.clear()
+            with engine.begin() as connection:
+                source = _get_source(connection, name)
+                marks = dict(connection.execute(
+                    sa.select(EtlSensorMark.sensor_id, EtlSensorMark.last_time)
+                    .where(EtlSensorMark.source_id == source.id)
+                ).all())
+
+            start_offset = source.file_offset
+            rotated = os.path.getsize(file_path) < start_offset or (
+                source.file_identity is not None and file_identity(file_path, start_offset) != source.file_identity
+            )
+            if rotated:
+                start_offset = 0
+            sensor_index = strategy.columns.index(strategy.sensor_column) if strategy.sensor_column else None
+            time_index = strategy.columns.index(strategy.time_column) if strategy.time_column else None
+
+            for chunk, end_offset in iter_csv_chunks(file_path, chunk_size, start_offset, complete_lines_only=True):
+                chunk_marks: dict[int, datetime.datetime] = {}
+                with engine.begin() as connection:
+                    rows, rejected = strategy.transform(chunk, connection)
+                    if sensor_index is not None and time_index is not None:
+                        new_rows = []
+                        for row in rows:
+                            sensor_id, reading_time = row[sensor_index], row[time_index]
+                            mark = marks.get(sensor_id)
+                            # Only a rotated file can repeat readings that were loaded before
+                            if rotated and mark is not None and reading_time <= mark:
+                                continue
+                            new_rows.append(row)
+                            if sensor_id not in chunk_marks or reading_time > chunk_marks[sensor_id]:
+                                chunk_marks[sensor_id] = reading_time
+                        report.rows_skipped += len(rows) - len(new_rows)
+                        rows = new_rows
+                    report.rows_loaded += copy_rows(connection, strategy.table, strategy.columns, rows)
+                    _save_marks(connection, source.id, end_offset, file_identity(file_path, end_offset), chunk_marks)
+                for sensor_id, reading_time in chunk_marks.items():
+                    if sensor_id not in marks or reading_time > marks[sensor_id]:
+                        marks[sensor_id] = reading_time
+                report.rows_read += len(next(iter(chunk.values()), []))
+                report.rows_rejected += rejected
+                report.chunks += 1
+        finally:
+            lock_connection.execute(sa.select(sa.func.pg_advisory_unlock(sa.func.hashtext(name))))
+    return report
+
+
+def next_run(now: datetime.datetime, interval: str, at: datetime.time) -> datetime.datetime:
+    """The next moment after `now` to load at: every day at `at`, or every hour at the minute of `at`."""
+    if interval == "hourly":
+        candidate = now.replace(minute=at.minute, second=0, microsecond=0)
+    else:
+        candidate = now.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += SCHEDULE_INTERVALS[interval]
+    return candidate
+
+
+def run_scheduler(
+    file_paths: typing.Sequence[str],
+    strategy: Strategy,
+    chunk_size: int,
+    interval: str,
+    at: datetime.time,
+) -> typing.NoReturn:
+    """Load the files incrementally every hour or every day, until the process is stopped."""
+    while True:
+        scheduled = next_run(datetime.datetime.now(), interval, at)
+        print(f"Next load at {scheduled.isoformat(timespec='minutes')}")
+        time.sleep(max(0.0, (scheduled - datetime.datetime.now()).total_seconds()))
+        for file_path in file_paths:
+            try:
+                print(f"{file_path}: {load_incremental(file_path, strategy, chunk_size).summary()}")
+            except Exception as e:  # noqa: BLE001
+                # Keep the schedule running, the next run resumes from the last committed chunk
+                print(f"{file_path}: load failed: {e}")
@@ -0,0 +1,250 @@
+"""
+Streaming building blocks for the ETL pipeline.
+
+The loaders never hold more than one chunk of a file in memory:
+1. `iter_csv_chunks` reads a CSV file `chunk_size` rows at a time and hands them out column by column,
+   together with the byte offset reached so a later run can resume from there.
+2. Strategies convert whole columns at once (`convert_column`) and resolve names to ids with one
+   query per chunk for the names they have not seen yet (`DimensionLookup`).
+3. `copy_rows` streams the resulting rows into PostgreSQL with COPY, which is an order of magnitude
+   faster than INSERTs issued through the ORM.
+"""
+import csv
+import dataclasses
+import functools
+import io
+import time
+import typing
+
+import sqlalchemy as sa
+
+from app.settings import settings
+
+
+@functools.cache
+def get_engine() -> sa.Engine:
+    """Sync engine for the ETL, created on first use instead of at import time."""
+    # COPY is only exposed by the sync psycopg2 driver, the application itself runs on asyncpg.
+    return sa.create_engine(settings.db_dsn.set(drivername="postgresql+psycopg2"), echo=settings.db_echo)
+
+
+class _CountingLines:
+    """The lines of a binary file, decoded for `csv.reader`, counting the bytes handed out.
+
+    csv.reader pulls exactly the lines a record spans (more than one when a quoted field holds a line
+    break), so after every record `offset` is the position right behind it.
+    """
+
+    def __init__(self, file: typing.BinaryIO) -> None:
+        self.file = file
+        self.offset = file.tell()
+        self.record: list[bytes] = []  # Raw lines of the record being read
+
+    def __iter__(self) -> "_CountingLines":
+        return self
+
+    def __next__(self) -> str:
+        line = next(self.file)
+        self.offset += len(line)
+        self.record.append(line)
+        return line.decode()
+
+    def seek(self, offset: int) -> None:
+        self.file.seek(offset)
+        self.offset = offset
+
+    def take_record(self) -> bytes:
+        record, self.record = b"".join(self.record), []
+        return record
+
+    def at_end(self) -> bool:
+        return not self.file.peek(1)  # type: ignore[attr-defined]
+
+
+def iter_csv_chunks(
+    file_path: str,
+    chunk_size: int,
+    start_offset: int = 0,
+    complete_lines_only: bool = False,
+) -> typing.Iterator[tuple[dict[str, list[str]], int]]:
+    """Yield the file as chunks of at most `chunk_size` rows keyed by column name.
+
+    Every chunk comes with the byte offset where it ends, which can be passed back as `start_offset`
+    to resume reading right after it. With `complete_lines_only` a last record that is not finished yet
+    (no line break, or an open quoted field) is left for a later run, since a logger may still be writing it.
+    """
+    with open(file_path, "rb") as file:
+        lines = _CountingLines(file)
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        if header:
+            header[0] = header[0].removeprefix("\ufeff")
+        lines.take_record()
+        width = len(header)
+        if start_offset > lines.offset:
+            lines.seek(start_offset)
+        offset = lines.offset
+
+        rows: list[list[str]] = []
+        for row in reader:
+            record = lines.take_record()
+            if complete_lines_only and (
+                not record.endswith(b"\n") or (record.count(b'"') % 2 and lines.at_end())
+            ):
+                break
+            rows.append(row)
+            offset = lines.offset
+            if len(rows) == chunk_size:
+                yield _to_columns(header, width, rows), offset
+                rows = []
+        if rows:
+            yield _to_columns(header, width, rows), offset
+
+
+def _to_columns(header: list[str], width: int, rows: list[list[str]]) -> dict[str, list[str]]:
+    if any(len(row) != width for row in rows):
+        # Pad short rows and cut long ones, so one bad line does not shift the whole chunk.
+        rows = [(row + [""] * width)[:width] for row in rows]
+    return dict(zip(header, map(list, zip(*rows)), strict=True))
+
+
+def convert_column(
+    values: list[str],
+    converter: typing.Callable[[str], typing.Any],
+) -> tuple[list[typing.Any], set[int]]:
+    """Convert a whole column, returning the converted values and the positions that failed.
+
+    The fast path maps the converter over the column in one go; only when that fails do we fall
+    back to converting value by value to find out which rows are broken.
+    """
+    try:
+        return list(map(converter, values)), set()
+    except (ValueError, TypeError, OverflowError):
+        pass
+    converted: list[typing.Any] = []
+    failed = set()
+    for index, value in enumerate(values):
+        try:
+            converted.append(converter(value))
+        except (ValueError, TypeError, OverflowError):
+            converted.append(None)
+            failed.add(index)
+    return converted, failed
+
+
+class DimensionLookup:
+    """Cache of a dimension table keyed by its natural key (e.g. a sensor name).
+
+    `query` selects the key as its first column followed by whatever the strategy needs. Keys that are
+    not cached yet are fetched with a single `IN` query per chunk, unknown keys are cached as None.
+    Once the whole table is preloaded the lookup no longer needs a connection at all, and keys missing
+    from the returned mapping are unknown.
+    """
+
+    def __init__(self, query: sa.Select[typing.Any]) -> None:
+        self.query = query
+        self.key_column = query.selected_columns[0]
+        self.cache: dict[typing.Any, sa.Row[typing.Any] | None] = {}
+        self.complete = False
+
+    def clear(self) -> None:
+        """Forget everything cached, e.g. before a scheduled run that should see newly registered sensors."""
+        self.cache = {}
+        self.complete = False
+
+    def preload(self, connection: sa.Connection) -> None:
+        self.cache = {row[0]: row for row in connection.execute(self.query)}
+        self.complete = True
+
+    def resolve(
+        self,
+        connection: sa.Connection | None,
+        keys: typing.Iterable[typing.Any],
+    ) -> dict[typing.Any, typing.Any]:
+        if self.complete:
+            return self.cache
+        missing = set(keys) - self.cache.keys()
+        if missing:
+            for row in connection.execute(self.query.where(self.key_column.in_(missing))):
+                self.cache[row[0]] = row
+            for key in missing:
+                self.cache.setdefault(key, None)
+        return self.cache
+
+
+def copy_rows(
+    connection: sa.Connection,
+    table: sa.Table,
+    columns: typing.Sequence[str],
+    rows: typing.Sequence[typing.Sequence[typing.Any]],
+) -> int:
+    """Load rows into `table` with COPY FROM STDIN and return how many were written."""
+    if not rows:
+        return 0
+    copy_csv(connection, table, columns, encode_csv(rows))
+    return len(rows)
+
+
+def encode_csv(rows: typing.Iterable[typing.Sequence[typing.Any]]) -> str:
+    """Encode rows in the CSV format COPY reads."""
+    buffer = io.StringIO()
+    # None is written as an empty unquoted field, which COPY reads as NULL
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def copy_csv(
+    connection: sa.Connection,
+    table: sa.Table,
+    columns: typing.Sequence[str],
+    data: str | bytes,
+) -> None:
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            io.BytesIO(data) if isinstance(data, bytes) else io.StringIO(data),
+        )
+    finally:
+        cursor.close()
+
+
+@dataclasses.dataclass(frozen=True)
+class Strategy:
+    """How to load one kind of CSV file.
+
+    `transform` turns a chunk (a dict of column name -> list of raw values) into rows for `columns` of
+    `table`, and reports how many rows of the chunk it had to reject. Strategies loading timeseries name
+    the sensor and time columns of their rows, so incremental loads can skip what was loaded before.
+    """
+
+    table: sa.Table
+    columns: tuple[str, ...]
+    transform: typing.Callable[[dict[str, list[str]], sa.Connection], tuple[list[tuple], int]]
+    sensor_column: str | None = None
+    time_column: str | None = None
+
+
+@dataclasses.dataclass
+class LoadReport:
+    rows_read: int = 0
+    rows_loaded: int = 0
+    rows_rejected: int = 0
+    rows_skipped: int = 0  # Rows that were loaded before, see ETL/incremental.py
+    chunks: int = 0
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        elapsed = self.elapsed
+        rate = self.rows_read / elapsed if elapsed else 0.0
+        return (
+            f"Read {self.rows_read} rows in {self.chunks} chunks, loaded {self.rows_loaded}, "
+            f"rejected {self.rows_rejected}, skipped {self.rows_skipped} already loaded "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/s)"
+        )
@@ -0,0 +1,29 @@
+"""
+Bookkeeping tables of the incremental ETL.
+
+For every source file we remember up to which byte it has been loaded, and for every sensor in that
+source the timestamp of the latest reading loaded from it. Both are updated in the same transaction
+as the readings they describe, so after a crash a re-run continues exactly where the last committed
+chunk ended.
+"""
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship
+
+from app.db.models import BaseModel
+
+
+class EtlSource(BaseModel):
+    __tablename__ = "etl_source"
+    name = sa.Column(sa.String, nullable=False, unique=True)  # Resolved path of the source file
+    file_offset = sa.Column(sa.BigInteger, nullable=False, default=0)  # Bytes of the file already loaded
+    file_identity = sa.Column(sa.String, nullable=True)  # Hash of the start of the file, to recognize rotation
+    sensor_marks = relationship("EtlSensorMark", back_populates="source")
+
+
+class EtlSensorMark(BaseModel):
+    __tablename__ = "etl_sensor_mark"
+    __table_args__ = (sa.UniqueConstraint("source_id", "sensor_id"),)
+    source_id = sa.Column(sa.Integer, sa.ForeignKey("etl_source.id"), nullable=False)
+    sensor_id = sa.Column(sa.Integer, sa.ForeignKey("sensor.id"), nullable=False)
+    last_time = sa.Column(sa.DateTime, nullable=False)  # Latest reading time loaded for the sensor
+    source = relationship("EtlSource", back_populates="sensor_marks")
@@ -0,0 +1,231 @@
+"""
+Parallel loading of many files, for historic backfills that arrive as one CSV export per logger.
+
+The work is split in two stages:
+1. Parsing: files are read, converted and encoded for COPY in a pool of worker processes, since this is
+   CPU-bound Python that would otherwise be serialized by the GIL. Workers never talk to the database;
+   the dimension lookups are preloaded once and handed to every worker.
+2. Loading: a fixed number of loader threads, each holding one database connection, COPY the encoded
+   chunks. psycopg2 releases the GIL while the server works, so the threads load concurrently.
+
+Rows are routed to loaders by sensor, and every loader handles its chunks in the order of the (sorted)
+files and of the chunks within them. All readings of a sensor are therefore loaded in file order by the
+same connection.
+
+Files are parsed in pieces of `chunks_per_task` chunks, and the next piece of a file is only parsed once
+the previous one was handed to the loaders. Memory use is therefore bounded by the pieces in flight
+(twice the number of workers) and the chunks queued per loader, however large the files are. A single
+huge file gains little from more workers this way; directories with a file per logger gain the most.
+
+When a loader fails the load stops as soon as possible, and the error reports how many rows of every
+file were committed before it.
+"""
+import collections
+import concurrent.futures
+import dataclasses
+import os
+import queue
+import threading
+import time
+import typing
+
+import sqlalchemy as sa
+
+from ETL.loader import copy_csv, encode_csv, get_engine, iter_csv_chunks
+from ETL.strategies import LOOKUPS, STRATEGIES
+
+
+@dataclasses.dataclass
+class ParsedPiece:
+    file_path: str
+    file_index: int
+    # Per chunk, the encoded rows and their count for every loader
+    chunks: list[list[tuple[str, int]]]
+    rows_read: int
+    rows_rejected: int
+    parse_time: float
+    end_offset: int
+    last: bool  # Whether the piece reached the end of the file
+
+
+@dataclasses.dataclass
+class StageReport:
+    rows: int = 0
+    busy: float = 0.0  # Summed over all workers or loaders
+
+    def rate(self) -> float:
+        return self.rows / self.busy if self.busy else 0.0
+
+
+@dataclasses.dataclass
+class ParallelReport:
+    files: int = 0
+    rows_read: int = 0
+    rows_rejected: int = 0
+    parse: StageReport = dataclasses.field(default_factory=StageReport)
+    load: StageReport = dataclasses.field(default_factory=StageReport)
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = self.load.rows / elapsed if elapsed else 0
+        return (
+            f"Loaded {self.load.rows} of {self.rows_read} rows from {self.files} files "
+            f"({self.rows_rejected} rejected) in {elapsed:.2f}s ({rate:,.0f} rows/s)\n"
+            f"  parse: {self.parse.rows} rows in {self.parse.busy:.2f} worker-s "
+            f"({self.parse.rate():,.0f} rows/s per worker)\n"
+            f"  load:  {self.load.rows} rows in {self.load.busy:.2f} loader-s "
+            f"({self.load.rate():,.0f} rows/s per loader)"
+        )
+
+
+class ParallelLoadError(Exception):
+    """A loader failed; `committed` holds the rows per file that were committed before the failure."""
+
+    def __init__(self, error: BaseException, committed: dict[str, int]) -> None:
+        self.committed = committed
+        lines = [f"{file_path}: {rows} rows" for file_path, rows in committed.items()] or ["nothing"]
+        super().__init__(f"Loading failed: {error!r}. Committed before the failure:\n  " + "\n  ".join(lines))
+
+
+def _init_worker(caches: list[dict[typing.Any, typing.Any]]) -> None:
+    for lookup, cache in zip(LOOKUPS, caches, strict=True):
+        lookup.cache = cache
+        lookup.complete = True
+
+
+def _parse_piece(
+    file_path: str,
+    file_index: int,
+    strategy_name: str,
+    chunk_size: int,
+    loaders: int,
+    start_offset: int,
+    chunks_per_task: int,
+) -> ParsedPiece:
+    started = time.perf_counter()
+    strategy = STRATEGIES[strategy_name]
+    sensor_index = strategy.columns.index(strategy.sensor_column) if strategy.sensor_column else None
+    piece = ParsedPiece(file_path, file_index, [], 0, 0, 0.0, start_offset, last=True)
+    for chunk, end_offset in iter_csv_chunks(file_path, chunk_size, start_offset):
+        rows, rejected = strategy.transform(chunk, None)
+        partitions: list[list[tuple]] = [[] for _ in range(loaders)]
+        if sensor_index is None:
+            partitions[file_index % loaders] = rows
+        else:
+            for row in rows:
+                partitions[row[sensor_index] % loaders].append(row)
+        piece.chunks.append([(encode_csv(partition), len(partition)) for partition in partitions])
+        piece.rows_read += len(next(iter(chunk.values()), []))
+        piece.rows_rejected += rejected
+        piece.end_offset = end_offset
+        if len(piece.chunks) == chunks_per_task:
+            piece.last = False  # The next piece may turn out to be empty
+            break
+    piece.parse_time = time.perf_counter() - started
+    return piece
+
+
+def _run_loader(engine: sa.Engine, table: sa.Table, columns: tuple[str, ...], jobs: queue.Queue,
+                stats: StageReport, committed: collections.Counter[str], errors: list[BaseException]) -> None:
+    with engine.connect() as connection:
+        while (job := jobs.get()) is not None:
+            if errors:
+                continue  # Keep draining so the producer never blocks on a failed loader
+            data, count, file_path = job
+            started = time.perf_counter()
+            try:
+                with connection.begin():
+                    copy_csv(connection, table, columns, data)
+            except BaseException as e:  # noqa: BLE001
+                errors.append(e)
+                continue
+            stats.busy += time.perf_counter() - started
+            stats.rows += count
+            committed[file_path] += count
+
+
+def load_parallel(
+    file_paths: typing.Sequence[str],
+    strategy_name: str,
+    chunk_size: int,
+    workers: int | None = None,
+    loaders: int = 4,
+    chunks_per_task: int = 4,
+) -> ParallelReport:
+    """Parse `file_paths` in `workers` processes and load them over `loaders` connections."""
+    report = ParallelReport()
+    strategy = STRATEGIES[strategy_name]
+    workers = workers or os.cpu_count() or 1
+    engine = get_engine()
+    with engine.connect() as connection:
+        for lookup in LOOKUPS:
+            lookup.preload(connection)
+
+    queues = [queue.Queue(maxsize=4) for _ in range(loaders)]
+    errors: list[BaseException] = []
+    # Each loader keeps its own counters, so the hot path needs no locking
+    loader_stats = [StageReport() for _ in range(loaders)]
+    loader_committed: list[collections.Counter[str]] = [collections.Counter() for _ in range(loaders)]
+    threads = [
+        threading.Thread(
+            target=_run_loader,
+            args=(engine, strategy.table, strategy.columns, jobs, stats, committed, errors),
+            daemon=True,
+        )
+        for jobs, stats, committed in zip(queues, loader_stats, loader_committed, strict=True)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=([lookup.cache for lookup in LOOKUPS],),
+        ) as executor:
+            def submit(file_index: int, file_path: str, start_offset: int) -> concurrent.futures.Future[ParsedPiece]:
+                return executor.submit(
+                    _parse_piece, file_path, file_index, strategy_name, chunk_size, loaders, start_offset,
+                    chunks_per_task,
+                )
+
+            pending: collections.deque[concurrent.futures.Future[ParsedPiece]] = collections.deque()
+            files = iter(enumerate(file_paths))
+            while not errors:
+                # Keep every worker busy, but only a bounded number of parsed pieces in memory
+                while len(pending) < 2 * workers and (item := next(files, None)) is not None:
+                    pending.append(submit(*item, 0))
+                if not pending:
+                    break
+                # Pieces are taken in file order, which keeps readings of a sensor in file order
+                piece = pending.popleft().result()
+                if not piece.last:
+                    pending.appendleft(submit(piece.file_index, piece.file_path, piece.end_offset))
+                for chunk in piece.chunks:
+                    if errors:
+                        break
+                    for jobs, (data, count) in zip(queues, chunk, strict=True):
+                        if count:
+                            jobs.put((data, count, piece.file_path))
+                report.files += piece.last
+                report.rows_read += piece.rows_read
+                report.rows_rejected += piece.rows_rejected
+                report.parse.rows += piece.rows_read
+                report.parse.busy += piece.parse_time
+            if errors:
+                # Stop parsing, only the pieces already running are finished
+                executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        for jobs in queues:
+            jobs.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        committed: collections.Counter[str] = sum(loader_committed, collections.Counter())
+        raise ParallelLoadError(errors[0], {file_path: committed[file_path] for file_path in file_paths}) from errors[0]
+    for stats in loader_stats:
+        report.load.rows += stats.rows
+        report.load.busy += stats.busy
+    return report
@@ -0,0 +1,135 @@
+"""
+Strategies to apply to the different CSV files we receive.
+
+A strategy turns one chunk of a file into rows for its target table (see `ETL.loader.Strategy`).
+Names are resolved to ids through the shared dimension lookups below, which are filled lazily while
+loading, or preloaded completely when chunks are transformed in worker processes without a database
+connection (see ETL/parallel.py).
+"""
+import datetime
+
+import sqlalchemy as sa
+
+from app.apps.dykes.models import Dyke, LocationInTopology, Reading, Sensor, SensorType, UnitOfMeasure
+from app.utils.datetime import generate_utc_dt
+from ETL.loader import DimensionLookup, Strategy, convert_column
+
+
+SENSOR_TYPES = DimensionLookup(sa.select(SensorType.name, SensorType.id))
+UNITS = DimensionLookup(sa.select(UnitOfMeasure.unit, UnitOfMeasure.id))
+# Sensors without a location are kept, with a null crossection, so they can be told apart from unknown ones
+SENSORS = DimensionLookup(
+    sa.select(
+        Sensor.name,
+        Sensor.id,
+        Sensor.sensor_type_id,
+        Sensor.location_in_topology_id,
+        LocationInTopology.crossection_id,
+    ).outerjoin(LocationInTopology, Sensor.location_in_topology_id == LocationInTopology.id)
+)
+
+
+def _to_int(value: str) -> int:
+    # reading.value is an integer column, but loggers export measurements as decimals
+    return round(float(value))
+
+
+# Dyke strategy function
+# Assumed structure: Name, Description
+def load_dyke(chunk, connection):
+    now = generate_utc_dt()
+    rows = [
+        (name, description or None, now, now)
+        for name, description in zip(chunk["Name"], chunk.get("Description", [""] * len(chunk["Name"])))
+        if name
+    ]
+    return rows, len(chunk["Name"]) - len(rows)
+
+
+# Crossection strategy function
+def load_crossection():
+    pass
+
+# Unit strategy function
+
+# Sensor type strategy function
+
+# Strategy function to create sensor and its location
+
+# Strategy for loading data with structure 1
+def load_sensor(chunk, connection):
+    '''
+    A note on the chunk:
+    The "Sensor ID" column should have the proper name of the sensor, and "Type" the name of an
+    existing sensor type. The location is not part of this export, so it is left empty.
+    '''
+    sensor_types = SENSOR_TYPES.resolve(connection, chunk["Type"])
+    now = generate_utc_dt()
+    rows = [
+        (name, sensor_types[type_name].id, None, True, now, now)  # Active by default
+        for name, type_name in zip(chunk["Sensor ID"], chunk["Type"])
+        if sensor_types.get(type_name) is not None
+    ]
+    return rows, len(chunk["Sensor ID"]) - len(rows)
+
+# Strategy for loading data with structure 2
+# Structure: Identifier (sensor name), Measurement, Time, MeasurementUnit
+def load_structure2(chunk, connection):
+    values, bad_values = convert_column(chunk["Measurement"], _to_int)
+    times, bad_times = convert_column(chunk["Time"], datetime.datetime.fromisoformat)
+    bad = bad_values | bad_times
+    sensors = SENSORS.resolve(connection, chunk["Identifier"])
+    units = UNITS.resolve(connection, chunk["MeasurementUnit"])
+    now = generate_utc_dt()
+
+    rows = []
+    for index, (sensor_name, unit_name, value, time) in enumerate(
+        zip(chunk["Identifier"], chunk["MeasurementUnit"], values, times)
+    ):
+        sensor = sensors.get(sensor_name)
+        unit = units.get(unit_name)
+        # A reading needs a crossection, which we can only derive from a sensor placed in a topology
+        if index in bad or sensor is None or unit is None or sensor.crossection_id is None:
+            continue
+        rows.append((
+            sensor.crossection_id,
+            sensor.location_in_topology_id,
+            unit.id,
+            sensor.sensor_type_id,
+            sensor.id,
+            value,
+            time,
+            now,
+            now,
+        ))
+    return rows, len(chunk["Identifier"]) - len(rows)
+
+
+BASE_COLUMNS = ("created_at", "updated_at")
+
+STRATEGIES = {
+    "dyke": Strategy(Dyke.__table__, ("name", "description", *BASE_COLUMNS), load_dyke),
+    "sensor": Strategy(
+        Sensor.__table__,
+        ("name", "sensor_type_id", "location_in_topology_id", "is_active", *BASE_COLUMNS),
+        load_sensor,
+    ),
+    "structure2": Strategy(
+        Reading.__table__,
+        (
+            "crossection_id",
+            "location_in_topology_id",
+            "unit_id",
+            "sensor_type_id",
+            "sensor_id",
+            "value",
+            "time",
+            *BASE_COLUMNS,
+        ),
+        load_structure2,
+        sensor_column="sensor_id",
+        time_column="time",
+    ),
+}
+
+LOOKUPS = (SENSOR_TYPES, UNITS, SENSORS)
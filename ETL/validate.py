@@ -0,0 +1,178 @@
+"""
+Dry-run validation of reading files.
+
+Before loading a large archive we want to know what would be rejected, and why. A dry run reads the file
+in chunks exactly like a load, but instead of writing readings it checks every column of a chunk at once
+and writes the rejected rows, with the reason, to a side file:
+- timestamps and values that cannot be parsed, or values outside the allowed range
+- sensors and units that do not exist, resolved against lookups preloaded from the database
+- readings that appear twice in the file, or that are already stored
+
+Duplicates are found by keeping, per sensor, the times seen as one sorted array of 64-bit integers.
+That costs about 8 bytes per key, so a dry run over 100 million readings needs under a gigabyte for the
+keys of the file, plus as much for the stored keys of the sensors in it. Those are fetched once per
+sensor, the first time the sensor shows up in the file. Nothing is ever written to the database.
+"""
+import array
+import bisect
+import collections
+import csv
+import dataclasses
+import datetime
+import time
+import typing
+
+import sqlalchemy as sa
+
+from app.apps.dykes.models import Reading
+from ETL.loader import convert_column, get_engine, iter_csv_chunks
+from ETL.strategies import SENSORS, UNITS
+
+
+# reading.value is a 32-bit integer column
+INTEGER_RANGE = (-(2**31), 2**31 - 1)
+
+
+@dataclasses.dataclass
+class ValidationReport:
+    rows_read: int = 0
+    rows_valid: int = 0
+    rejected: collections.Counter[str] = dataclasses.field(default_factory=collections.Counter)
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        lines = [
+            f"Validated {self.rows_read} rows in {elapsed:.2f}s "
+            f"({self.rows_read / elapsed if elapsed else 0:,.0f} rows/s): "
+            f"{self.rows_valid} valid, {sum(self.rejected.values())} rejected",
+        ]
+        lines.extend(f"  {reason}: {count}" for reason, count in self.rejected.most_common())
+        return "\n".join(lines)
+
+
+class KeySet:
+    """Set of (sensor, time) keys, with the times of every sensor in a sorted array of microseconds.
+
+    Readings of a sensor mostly come in time order, from files and from the database alike, so adding a
+    key is usually an append; keys arriving out of order are inserted in place.
+    """
+
+    EPOCH = datetime.datetime(1970, 1, 1)
+
+    def __init__(self) -> None:
+        self.times: dict[int, array.array[int]] = {}
+
+    @classmethod
+    def key(cls, sensor_id: int, reading_time: datetime.datetime) -> tuple[int, int]:
+        # reading.time has no time zone, PostgreSQL ignores the offset of the timestamps we load
+        return sensor_id, (reading_time.replace(tzinfo=None) - cls.EPOCH) // datetime.timedelta(microseconds=1)
+
+    def add(self, key: tuple[int, int]) -> bool:
+        """Add a key, returning False when it was already there."""
+        sensor_id, time_key = key
+        times = self.times.setdefault(sensor_id, array.array("q"))
+        if not times or time_key > times[-1]:
+            times.append(time_key)
+            return True
+        index = bisect.bisect_left(times, time_key)
+        if times[index] == time_key:
+            return False
+        times.insert(index, time_key)
+        return True
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        sensor_id, time_key = key
+        times = self.times.get(sensor_id)
+        if not times:
+            return False
+        index = bisect.bisect_left(times, time_key)
+        return index < len(times) and times[index] == time_key
+
+
+def _load_stored_keys(connection: sa.Connection, sensor_ids: set[int], stored: KeySet) -> None:
+    # In time order, so every key is appended to the array of its sensor
+    result = connection.execution_options(stream_results=True, yield_per=100_000).execute(
+        sa.select(Reading.sensor_id, Reading.time)
+        .where(Reading.sensor_id.in_(sensor_ids))
+        .order_by(Reading.sensor_id, Reading.time)
+    )
+    for sensor_id, reading_time in result:
+        stored.add(KeySet.key(sensor_id, reading_time))
+
+
+def validate_structure2(
+    file_path: str,
+    chunk_size: int,
+    reject_path: str,
+    value_range: tuple[float, float] | None = None,
+) -> ValidationReport:
+    """Validate a reading file with structure 2 without loading it."""
+    report = ValidationReport()
+    low, high = value_range or INTEGER_RANGE
+    low, high = max(low, INTEGER_RANGE[0]), min(high, INTEGER_RANGE[1])
+    engine = get_engine()
+    with engine.connect() as connection:
+        for lookup in (SENSORS, UNITS):
+            lookup.preload(connection)
+    sensors, units = SENSORS.cache, UNITS.cache
+    seen, stored = KeySet(), KeySet()
+    checked_sensors: set[int] = set()
+
+    with open(reject_path, "w", newline="") as reject_file:
+        rejects = csv.writer(reject_file)
+        header_written = False
+        for chunk, _ in iter_csv_chunks(file_path, chunk_size):
+            header = list(chunk)
+            if not header_written:
+                rejects.writerow([*header, "reason"])
+                header_written = True
+
+            # Column checks first: each one yields the positions failing it
+            times, bad_times = convert_column(chunk["Time"], datetime.datetime.fromisoformat)
+            values, bad_values = convert_column(chunk["Measurement"], float)
+            out_of_range = {i for i, value in enumerate(values) if value is not None and not low <= value <= high}
+            chunk_sensors = [sensors.get(name) for name in chunk["Identifier"]]
+            unknown_units = {i for i, unit in enumerate(chunk["MeasurementUnit"]) if units.get(unit) is None}
+
+            new_sensors = {sensor.id for sensor in chunk_sensors if sensor is not None} - checked_sensors
+            if new_sensors:
+                with engine.connect() as connection:
+                    _load_stored_keys(connection, new_sensors, stored)
+                checked_sensors |= new_sensors
+
+            rejected_rows = []
+            for index, sensor in enumerate(chunk_sensors):
+                if index in bad_times:
+                    reason = "invalid time"
+                elif index in bad_values:
+                    reason = "invalid value"
+                elif index in out_of_range:
+                    reason = "value out of range"
+                elif sensor is None:
+                    reason = "unknown sensor"
+                elif sensor.crossection_id is None:
+                    reason = "sensor has no crossection"
+                elif index in unknown_units:
+                    reason = "unknown unit"
+                else:
+                    key = KeySet.key(sensor.id, times[index])
+                    if key in stored:
+                        reason = "already in database"
+                    elif not seen.add(key):
+                        reason = "duplicate in file"
+                    else:
+                        continue
+                report.rejected[reason] += 1
+                rejected_rows.append([*(chunk[column][index] for column in header), reason])
+            rejects.writerows(rejected_rows)
+
+            rows = len(chunk_sensors)
+            report.rows_read += rows
+            report.rows_valid += rows - len(rejected_rows)
+    return report
+
+
+VALIDATORS: dict[str, typing.Callable[..., ValidationReport]] = {
+    "structure2": validate_structure2,
+}
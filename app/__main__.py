@@ -1,3 +1,5 @@
+import typing
+
 import granian
 from granian.constants import Interfaces, Loops
 
@@ -5,12 +7,23 @@ from app.settings import settings
 
 
 if __name__ == "__main__":
+    # Only settings are imported here: the application, with its engines and caches, is imported by every
+    # worker process after it started (see also the fork handlers in app/db/base.py).
+    options: dict[str, typing.Any] = {}
+    if settings.server_backpressure is not None:
+        options["backpressure"] = settings.server_backpressure
     granian.Granian(
         target="app.application:application",
         address="0.0.0.0",  # noqa: S104
         port=settings.app_port,
         interface=Interfaces.ASGI,
+        workers=settings.server_workers,
+        threads=settings.server_threads,
+        pthreads=settings.server_blocking_threads,
+        threading_mode=settings.server_threading_mode,
+        backlog=settings.server_backlog,
         log_dictconfig={"root": {"level": "INFO"}} if not settings.debug else {},
         log_level=settings.log_level,
         loop=Loops.uvloop,
+        **options,
     ).serve()
@@ -1,31 +1,76 @@
 #!/usr/bin/env python
-from dotenv import load_dotenv
+# The .env file is loaded by app.settings, before any setting is read
+import contextlib
+import typing
 
-
-load_dotenv()  # This line must come before importing any modules that use environment variables
-
-from fastapi import Depends, FastAPI
+from fastapi import FastAPI
 
 from app import exceptions
+from app.apps.admin.views import router as admin_router
 from app.apps.dykes.views import router as dykes_router
-from app.db.deps import set_db
+from app.apps.exports.jobs import exports
+from app.apps.exports.views import router as exports_router
 from app.db.exceptions import DatabaseValidationError
+from app.lifespan import dispose_engines, drain, warm_up
+from app.live import live_readings
+from app.live import router as live_router
+from app.metrics import loop_lag
+from app.metrics import router as metrics_router
+from app.middleware import DrainingMiddleware, RequestTimingMiddleware, draining
+from app.profiling import ProfilingMiddleware
+from app.repositories.ingest_buffer import IngestBufferFullError, ingest_buffer
 from app.settings import settings
+from app.utils.admission import AdmissionRejectedError
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app: FastAPI) -> typing.AsyncIterator[None]:
+    draining.clear()
+    loop_lag.start()
+    if settings.warmup_enabled:
+        await warm_up(_app)
+    await live_readings.start()
+    yield
+    # Live streams last as long as their clients: end them, or draining would wait for them
+    await live_readings.stop()
+    await drain(settings.shutdown_drain_timeout_s)
+    # Write out readings still waiting in the ingestion buffer before the process exits.
+    await ingest_buffer.stop()
+    await exports.stop()
+    await loop_lag.stop()
+    await dispose_engines()
 
 
 def get_app() -> FastAPI:
     _app = FastAPI(
         title=settings.service_name,
         debug=settings.debug,
-        dependencies=[Depends(set_db)],
+        lifespan=lifespan,
     )
 
     _app.include_router(dykes_router, prefix="/api")
+    _app.include_router(exports_router, prefix="/api")
+    _app.include_router(live_router, prefix="/api")
+    _app.include_router(admin_router, prefix="/api/admin")
+    _app.include_router(metrics_router)
+
+    _app.add_middleware(DrainingMiddleware)
+    if settings.debug or settings.profiling_enabled:
+        _app.add_middleware(ProfilingMiddleware)
+    _app.add_middleware(RequestTimingMiddleware)
 
     _app.add_exception_handler(
         DatabaseValidationError,
         exceptions.database_validation_exception_handler,  # type: ignore[arg-type]
     )
+    _app.add_exception_handler(
+        IngestBufferFullError,
+        exceptions.ingest_buffer_full_exception_handler,  # type: ignore[arg-type]
+    )
+    _app.add_exception_handler(
+        AdmissionRejectedError,
+        exceptions.admission_rejected_exception_handler,  # type: ignore[arg-type]
+    )
 
     return _app
 
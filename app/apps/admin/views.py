@@ -0,0 +1,76 @@
+"""Operational endpoints exposing the internal state of the service (buffers, caches, pools).
+
+These are meant for operators and dashboards, not for API clients, and are mounted under `/api/admin`.
+"""
+import typing
+
+import fastapi
+from fastapi.responses import PlainTextResponse
+
+from app.db import base
+from app.db.instrumentation import compile_cache, pool_stats, slow_queries
+from app.db.routes import limiters
+from app.middleware import TimedRoute
+from app.profiling import profiles
+from app.repositories.ingest_buffer import ingest_buffer
+from app.settings import settings
+
+
+router = fastapi.APIRouter(route_class=TimedRoute)
+
+
+@router.get("/ingest/")
+async def ingest_stats() -> dict[str, typing.Any]:
+    # Queue depth and flush latency of the write-behind buffer behind POST /api/readings/.
+    return {"enabled": settings.ingest_buffer_enabled, **ingest_buffer.stats()}
+
+
+@router.get("/statements/")
+async def statement_stats() -> dict[str, typing.Any]:
+    # How often executed statements reused a compiled form from SQLAlchemy's cache.
+    return compile_cache.stats()
+
+
+@router.get("/pools/")
+async def pools() -> dict[str, typing.Any]:
+    # Connection pool occupancy per engine: the primary, and the read replica when one is configured.
+    return {name: pool_stats(engine.pool) for name, engine in base.engines.items()}
+
+
+@router.get("/admission/")
+async def admission_stats() -> dict[str, typing.Any]:
+    # Concurrency limit, requests in flight and waiting, and shed requests of reads and writes.
+    return {"enabled": settings.admission_enabled, **{name: limiter.stats() for name, limiter in limiters.items()}}
+
+
+@router.get("/slow-queries/")
+async def slow_query_log() -> dict[str, typing.Any]:
+    # Most recent statements slower than the threshold, with the plan of those that were explained.
+    return {"enabled": settings.slow_query_log_enabled, **slow_queries.stats()}
+
+
+@router.delete("/slow-queries/", status_code=204)
+async def clear_slow_query_log() -> None:
+    slow_queries.clear()
+
+
+@router.get("/profiles/")
+async def list_profiles() -> dict[str, typing.Any]:
+    # Requests profiled with the X-Profile header or by sampling, most recent first.
+    return {
+        "enabled": settings.debug or settings.profiling_enabled,
+        "profiles": [profile.summary() for profile in profiles.list()],
+    }
+
+
+@router.get("/profiles/{profile_id}", response_model=None)
+async def get_profile(
+    profile_id: int,
+    format: typing.Literal["speedscope", "collapsed"] = "speedscope",  # noqa: A002
+) -> dict[str, typing.Any] | PlainTextResponse:
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise fastapi.HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.speedscope()
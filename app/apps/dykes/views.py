@@ -28,26 +28,40 @@ This layered approach ensures a clear separation of concerns where:
   for data manipulation and presentation.
 """
 
+import time
 import typing
 from datetime import datetime
 
 import fastapi
 from fastapi import Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import ValidationError
 
 from app.apps.dykes import models, schemas
+from app.db.routes import DBSessionRoute
 from app.dependencies import get_reading_repository
+from app.live import live_readings
+from app.repositories.ingest_buffer import ingest_buffer
 from app.repositories.repository_interface import ReadingRepository
+from app.settings import settings
+from app.utils.singleflight import SingleFlight
+from app.utils.timing import request_timings
 
 
-router = fastapi.APIRouter()
+# Handlers get a database session on their first query, see DBSessionRoute
+router = fastapi.APIRouter(route_class=DBSessionRoute)
+
+# Concurrent requests for the same readings share one query and one response body, see list_readings
+readings_flight: SingleFlight[bytes | None] = SingleFlight()
 
 
 @router.get("/dykes/")
-async def list_dykes() -> schemas.Dykes:
-    # Fetch all dyke entries from the database using the Dyke model's all() method.
-    objects = await models.Dyke.all()
+async def list_dykes(
+    limit: int | None = Query(None, ge=1),
+    offset: int | None = Query(None, ge=0),
+) -> schemas.Dykes:
+    # Fetch a page of dyke entries (all of them by default) using the Dyke model's all() method.
+    objects = await models.Dyke.all(sorting={"id": "asc"}, limit=limit, offset=offset)
     return typing.cast(schemas.Dykes, {"items": objects})
 
 
@@ -80,18 +94,85 @@ async def list_readings(
         sensor_id (Optional[int]): The sensor ID to filter readings by.
         sensor_name (Optional[str]): The sensor name to filter readings by.
 
+    With `readings_coalescing_enabled`, requests arriving while the same query (see `readings_key`) runs
+    for another request wait for its result, and get the same serialized body.
     """
-    objects = await repository.get_readings(start_date=start_date,
-                                            end_date=end_date,
-                                            sensor_ids=sensor_ids,
-                                            sensor_names=sensor_names)
-    if not objects:
+    async def query() -> bytes | None:
+        objects = await repository.get_readings(start_date=start_date,
+                                                end_date=end_date,
+                                                sensor_ids=sensor_ids,
+                                                sensor_names=sensor_names)
+        if not objects:
+            return None
+
+        # Validate objects coming from repository
+        started = time.perf_counter()
+        try:
+            validated_objects = schemas.Readings(readings=objects)
+        except ValidationError:
+            raise HTTPException(status_code=500, detail="Data validation error")
+        body = validated_objects.model_dump_json().encode()
+        timings = request_timings.get()
+        if timings is not None:
+            timings.serialize_time += time.perf_counter() - started
+        return body
+
+    if settings.readings_coalescing_enabled:
+        key = readings_key(repository, start_date, end_date, sensor_ids, sensor_names)
+        body = await readings_flight.do(key, query)
+    else:
+        body = await query()
+    if body is None:
         raise HTTPException(status_code=404, detail="No readings found")
+    return Response(body, media_type="application/json")  # type: ignore[return-value]
 
-    # Validate objects coming from repository
-    try:
-        validated_objects = schemas.Readings(readings=objects)
-    except ValidationError:
-        raise HTTPException(status_code=500, detail="Data validation error")
 
-    return validated_objects
+def readings_key(
+    repository: ReadingRepository,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    sensor_ids: list[int] | None,
+    sensor_names: list[str] | None,
+) -> tuple[typing.Any, ...]:
+    """Filters of a readings query, normalized so that queries with the same result have the same key.
+
+    The order and repetitions of sensors do not matter, and sensor names are ignored next to sensor ids,
+    as in the repositories.
+    """
+    sensors: tuple[typing.Any, ...] | None = None
+    if sensor_ids:
+        sensors = ("id", *sorted(set(sensor_ids)))
+    elif sensor_names:
+        sensors = ("name", *sorted({sensor_name.strip().strip('"') for sensor_name in sensor_names}))
+    return (
+        type(repository).__name__,
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        sensors,
+    )
+
+
+@router.post("/readings/", status_code=201)
+async def create_reading(
+    payload: schemas.ReadingCreate,
+    repository: ReadingRepository = Depends(get_reading_repository),
+) -> schemas.Reading:
+    """Store a single reading.
+
+    With `ingest_buffer_enabled` the reading is queued and written in a batch together with other
+    readings posted around the same time. Depending on `ingest_wait_for_flush` the request either waits
+    for that batch to be committed, or returns 202 right away. A full buffer answers with 429.
+    """
+    try:
+        if not settings.ingest_buffer_enabled:
+            obj = await repository.create_reading(payload)
+            live_readings.publish([obj])
+        elif settings.ingest_wait_for_flush:
+            obj = await ingest_buffer.submit(payload)
+        else:
+            await ingest_buffer.submit(payload, wait=False)
+            return JSONResponse(status_code=202, content={"detail": "Reading queued"})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return schemas.Reading.model_validate(obj)
@@ -0,0 +1,327 @@
+"""
+Export jobs: readings matching a set of filters, written to a file in the background.
+
+An export of the full history of a dyke takes minutes. Run in a request it would hold the HTTP connection
+and an interactive pool connection all that time, so `POST /api/exports/` only queues a job and returns its
+id. At most `workers` jobs run at once, each streaming its rows over the export pool with a server-side
+cursor, `batch_size` rows at a time, and handing every batch to a writer thread so the event loop never
+waits for the disk.
+
+The file is written next to its final name and renamed once complete. The state of every job is kept
+in a JSON file beside it, so every worker process of the host can report on a job and serve its file,
+whichever worker ran it. Files are removed `retention` seconds after their job finished.
+"""
+import asyncio
+import csv
+import dataclasses
+import importlib.util
+import json
+import logging
+import re
+import time
+import typing
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy.ext import asyncio as sa_async
+
+from app.apps.dykes import models
+from app.apps.exports.schemas import ExportCreate, ExportFormat, ExportStatus
+from app.db import base
+from app.db.utils import any_of
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "time", "value", "unit", "sensor_id", "sensor_name", "sensor_type", "crossection", "dyke_id")
+EXTENSIONS = {ExportFormat.csv: "csv", ExportFormat.parquet: "parquet", ExportFormat.ndjson: "ndjson"}
+MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+    ExportFormat.ndjson: "application/x-ndjson",
+}
+_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class ExportQueueFullError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class ExportJob:
+    id: str
+    format: ExportFormat
+    filters: dict[str, typing.Any]
+    status: ExportStatus = ExportStatus.queued
+    created_at: str = dataclasses.field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    started_at: str | None = None
+    finished_at: str | None = None
+    rows_total: int | None = None
+    rows_written: int = 0
+    size: int | None = None
+    error: str | None = None
+
+    @property
+    def progress(self) -> float | None:
+        if self.status == ExportStatus.done:
+            return 1.0
+        if not self.rows_total:
+            return None
+        return min(self.rows_written / self.rows_total, 1.0)
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.id}.{EXTENSIONS[self.format]}"
+
+
+def readings_query(request: ExportCreate) -> sa.Select[typing.Any]:
+    query = (
+        sa.select(
+            models.Reading.id,
+            models.Reading.time,
+            models.Reading.value,
+            models.UnitOfMeasure.unit,
+            models.Sensor.id.label("sensor_id"),
+            models.Sensor.name.label("sensor_name"),
+            models.SensorType.name.label("sensor_type"),
+            models.Crossection.name.label("crossection"),
+            models.Crossection.dyke_id,
+        )
+        .outerjoin(models.Sensor, models.Sensor.id == models.Reading.sensor_id)
+        .outerjoin(models.SensorType, models.SensorType.id == models.Sensor.sensor_type_id)
+        .join(models.Crossection, models.Crossection.id == models.Reading.crossection_id)
+        .join(models.UnitOfMeasure, models.UnitOfMeasure.id == models.Reading.unit_id)
+    )
+    # reading.time has no time zone
+    if request.start_date:
+        query = query.where(models.Reading.time >= request.start_date.replace(tzinfo=None))
+    if request.end_date:
+        query = query.where(models.Reading.time <= request.end_date.replace(tzinfo=None))
+    # Like the readings endpoint: sensor ids take precedence over sensor names
+    if request.sensor_ids:
+        query = query.where(any_of(models.Reading.sensor_id, request.sensor_ids))
+    elif request.sensor_names:
+        query = query.where(any_of(models.Sensor.name, [name.strip().strip('"') for name in request.sensor_names]))
+    if request.dyke_id is not None:
+        query = query.where(models.Crossection.dyke_id == request.dyke_id)
+    return query
+
+
+class CsvWriter:
+    def __init__(self, path: Path) -> None:
+        self._file = path.open("w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows: typing.Sequence[sa.Row[typing.Any]]) -> None:
+        self._writer.writerows((*row[:1], row[1].isoformat(), *row[2:]) for row in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class NdjsonWriter:
+    def __init__(self, path: Path) -> None:
+        self._file = path.open("w")
+
+    def write(self, rows: typing.Sequence[sa.Row[typing.Any]]) -> None:
+        self._file.writelines(
+            json.dumps({**row._asdict(), "time": row.time.isoformat()}, separators=(",", ":")) + "\n" for row in rows
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path: Path) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("time", pa.timestamp("us")),
+            ("value", pa.int64()),
+            ("unit", pa.string()),
+            ("sensor_id", pa.int64()),
+            ("sensor_name", pa.string()),
+            ("sensor_type", pa.string()),
+            ("crossection", pa.string()),
+            ("dyke_id", pa.int64()),
+        ])
+        # Every batch becomes a row group
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: typing.Sequence[sa.Row[typing.Any]]) -> None:
+        columns = list(zip(*rows, strict=True))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema, strict=True)],
+            schema=self._schema,
+        ))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+WRITERS: dict[ExportFormat, typing.Callable[[Path], typing.Any]] = {
+    ExportFormat.csv: CsvWriter,
+    ExportFormat.parquet: ParquetWriter,
+    ExportFormat.ndjson: NdjsonWriter,
+}
+
+
+class ExportJobs:
+    def __init__(
+        self,
+        session_factory: typing.Callable[[], sa_async.AsyncSession],
+        directory: str,
+        workers: int,
+        queue_size: int,
+        batch_size: int,
+        retention: float,
+    ) -> None:
+        self.session_factory = session_factory
+        self.directory = Path(directory)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retention = retention
+        self._queue: asyncio.Queue[tuple[ExportJob, ExportCreate]] = asyncio.Queue(queue_size)
+        self._tasks: list[asyncio.Task[None]] = []
+        # Jobs of this process, queued or running
+        self._jobs: dict[str, ExportJob] = {}
+
+    def start(self) -> None:
+        """Start the workers, unless they are already running."""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        self._tasks += [loop.create_task(self._work()) for _ in range(self.workers - len(self._tasks))]
+
+    async def stop(self) -> None:
+        """Cancel the jobs of this process; queued and running jobs fail, and their partial files are removed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job, _ = self._queue.get_nowait()
+            self._fail(job, "Cancelled by shutdown")
+
+    def submit(self, request: ExportCreate) -> ExportJob:
+        if request.format == ExportFormat.parquet and importlib.util.find_spec("pyarrow") is None:
+            msg = "Parquet exports need pyarrow (poetry install --extras parquet)"
+            raise ValueError(msg)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.expire()
+        self.start()
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            format=request.format,
+            filters=request.model_dump(mode="json", exclude={"format"}, exclude_none=True),
+        )
+        try:
+            self._queue.put_nowait((job, request))
+        except asyncio.QueueFull:
+            raise ExportQueueFullError from None
+        self._jobs[job.id] = job
+        self._save(job)
+        return job
+
+    def get(self, export_id: str) -> ExportJob | None:
+        if export_id in self._jobs:
+            return self._jobs[export_id]
+        # The id becomes a file name: anything but an id of ours is unknown
+        if not _ID.fullmatch(export_id):
+            return None
+        try:
+            state = json.loads(self._state_path(export_id).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return ExportJob(**{**state, "format": ExportFormat(state["format"]), "status": ExportStatus(state["status"])})
+
+    def path(self, job: ExportJob) -> Path:
+        return self.directory / job.file_name
+
+    def expire(self) -> None:
+        """Remove the files of jobs that finished more than `retention` seconds ago."""
+        deadline = time.time() - self.retention
+        for state_path in self.directory.glob("*.json"):
+            try:
+                if state_path.stat().st_mtime < deadline:
+                    for path in self.directory.glob(f"{state_path.stem}.*"):
+                        path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+
+    def _state_path(self, export_id: str) -> Path:
+        return self.directory / f"{export_id}.json"
+
+    def _save(self, job: ExportJob) -> None:
+        # Written aside and renamed, so other workers never read half a file
+        state_path = self._state_path(job.id)
+        partial = state_path.with_suffix(".json.tmp")
+        partial.write_text(json.dumps(dataclasses.asdict(job)))
+        partial.replace(state_path)
+
+    def _fail(self, job: ExportJob, error: str) -> None:
+        job.status = ExportStatus.failed
+        job.error = error
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+        self._save(job)
+        self._jobs.pop(job.id, None)
+
+    async def _work(self) -> None:
+        while True:
+            job, request = await self._queue.get()
+            try:
+                await self._run(job, request)
+            except asyncio.CancelledError:
+                self._fail(job, "Cancelled by shutdown")
+                raise
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Export %s failed: %s", job.id, e)
+                self._fail(job, str(e))
+
+    async def _run(self, job: ExportJob, request: ExportCreate) -> None:
+        job.status = ExportStatus.running
+        job.started_at = datetime.now(timezone.utc).isoformat()
+        query = readings_query(request)
+        path = self.path(job)
+        partial = path.with_suffix(path.suffix + ".part")
+        async with self.session_factory() as db:
+            job.rows_total = await db.scalar(sa.select(sa.func.count()).select_from(query.subquery()))
+            self._save(job)
+            writer = await asyncio.to_thread(WRITERS[job.format], partial)
+            completed = False
+            try:
+                result = await db.stream(
+                    query.order_by(models.Reading.time, models.Reading.id).execution_options(yield_per=self.batch_size),
+                )
+                async for rows in result.partitions():
+                    await asyncio.to_thread(writer.write, rows)
+                    job.rows_written += len(rows)
+                    self._save(job)
+                completed = True
+            finally:
+                await asyncio.to_thread(writer.close)
+                if not completed:
+                    partial.unlink(missing_ok=True)
+        partial.replace(path)
+        job.status = ExportStatus.done
+        job.size = path.stat().st_size
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+        self._save(job)
+        self._jobs.pop(job.id, None)
+
+
+exports = ExportJobs(
+    # The engines are only created on first use, so the pool is looked up per job
+    lambda: base.sessionmakers["export"](),
+    directory=settings.export_directory,
+    workers=settings.export_workers,
+    queue_size=settings.export_queue_size,
+    batch_size=settings.export_batch_size,
+    retention=settings.export_retention_s,
+)
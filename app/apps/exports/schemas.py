@@ -0,0 +1,41 @@
+import enum
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+
+class ExportFormat(str, enum.Enum):
+    csv = "csv"
+    parquet = "parquet"
+    ndjson = "ndjson"
+
+
+class ExportStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class ExportCreate(BaseModel):
+    format: ExportFormat = ExportFormat.csv
+    start_date: datetime | None = Field(None, alias="startDate")
+    end_date: datetime | None = Field(None, alias="endDate")
+    sensor_ids: list[int] | None = Field(None, alias="sensorId")
+    sensor_names: list[str] | None = Field(None, alias="sensorName")
+    dyke_id: int | None = Field(None, alias="dykeId", description="Only readings of the crossections of this dyke")
+
+
+class Export(BaseModel):
+    id: str
+    format: ExportFormat
+    status: ExportStatus
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    rows_total: int | None = Field(None, description="Rows matching the filters, counted when the export starts")
+    rows_written: int = 0
+    progress: float | None = Field(None, description="Share of the rows written, from 0 to 1")
+    size: int | None = Field(None, description="Size of the file in bytes, once done")
+    error: str | None = None
+    download_url: str | None = None
@@ -0,0 +1,71 @@
+"""Exports of readings: queued with POST, polled for progress, and downloaded once done (see jobs.py)."""
+import fastapi
+from fastapi import HTTPException
+
+from app.apps.exports import schemas
+from app.apps.exports.jobs import MEDIA_TYPES, ExportJob, ExportQueueFullError, exports
+from app.middleware import TimedRoute
+from app.utils.responses import RangeFileResponse
+
+# The jobs take their connections from the export pool themselves; requests here do not query the database
+router = fastapi.APIRouter(route_class=TimedRoute)
+
+
+def export_status(request: fastapi.Request, job: ExportJob) -> schemas.Export:
+    download_url = None
+    if job.status == schemas.ExportStatus.done:
+        download_url = str(request.url_for("download_export", export_id=job.id))
+    return schemas.Export(
+        id=job.id,
+        format=job.format,
+        status=job.status,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        rows_total=job.rows_total,
+        rows_written=job.rows_written,
+        progress=job.progress,
+        size=job.size,
+        error=job.error,
+        download_url=download_url,
+    )
+
+
+def get_job(export_id: str) -> ExportJob:
+    job = exports.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@router.post("/exports/", status_code=202)
+async def create_export(
+    payload: schemas.ExportCreate, request: fastapi.Request, response: fastapi.Response,
+) -> schemas.Export:
+    """Queue an export of the readings matching the filters; poll the returned export for its progress."""
+    try:
+        job = exports.submit(payload)
+    except ExportQueueFullError:
+        raise HTTPException(status_code=429, detail="Too many exports queued, retry later",
+                            headers={"Retry-After": "60"}) from None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from None
+    response.headers["Location"] = str(request.url_for("get_export", export_id=job.id))
+    return export_status(request, job)
+
+
+@router.get("/exports/{export_id}/")
+async def get_export(export_id: str, request: fastapi.Request) -> schemas.Export:
+    return export_status(request, get_job(export_id))
+
+
+@router.get("/exports/{export_id}/download", response_class=RangeFileResponse)
+async def download_export(export_id: str) -> RangeFileResponse:
+    """The file of a finished export; a `Range` header fetches part of it, e.g. to resume a download."""
+    job = get_job(export_id)
+    if job.status != schemas.ExportStatus.done:
+        raise HTTPException(status_code=409, detail=f"Export is {job.status.value}")
+    path = exports.path(job)
+    if not path.is_file():
+        raise HTTPException(status_code=410, detail="Export expired")
+    return RangeFileResponse(path, media_type=MEDIA_TYPES[job.format], filename=f"readings-{job.file_name}")
@@ -1,17 +1,122 @@
-from sqlalchemy import MetaData
+import os
+import sys
+import typing
+
+import sqlalchemy as sa
+from sqlalchemy import MetaData, orm
+from sqlalchemy.engine.url import URL
 from sqlalchemy.ext import asyncio as sa_async
 from sqlalchemy.orm import declarative_base
 
+from app.db.instrumentation import TimedQueuePool, compile_cache, slow_queries, statement_timer
 from app.settings import settings
 
 
-engine = sa_async.create_async_engine(
-    settings.db_dsn,
-    echo=settings.db_echo,
-    pool_size=settings.db_pool_size,
-    max_overflow=settings.db_max_overflow,
-    future=True,
-)
-async_session = sa_async.async_sessionmaker(engine, expire_on_commit=False)
+def _create_engine(dsn: URL, pool_size: int, pool_timeout: float) -> sa_async.AsyncEngine:
+    return sa_async.create_async_engine(
+        dsn,
+        echo=settings.db_echo,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=pool_timeout,
+        future=True,
+    )
+
+
+# Engines, pools and session factories are created on first use (PEP 562 module __getattr__), so that
+# importing the models (migrations, the ETL, test collection) neither imports asyncpg nor builds pools.
+engine: sa_async.AsyncEngine
+ingest_engine: sa_async.AsyncEngine
+export_engine: sa_async.AsyncEngine
+read_engine: sa_async.AsyncEngine
+engines: dict[str, sa_async.AsyncEngine]
+async_session: sa_async.async_sessionmaker[sa_async.AsyncSession]
+async_read_session: sa_async.async_sessionmaker[sa_async.AsyncSession]
+sessionmakers: dict[str, sa_async.async_sessionmaker[sa_async.AsyncSession]]
+_LAZY = frozenset(__annotations__)
+# The module itself, to read the lazy attributes from within it
+_module = sys.modules[__name__]
+
+
+def _create_engines() -> None:
+    # One engine, and so one connection pool, per workload (see Settings)
+    interactive = _create_engine(settings.db_dsn, settings.db_pool_size, settings.db_pool_timeout)
+    ingest = _create_engine(settings.db_dsn, settings.db_ingest_pool_size, settings.db_ingest_pool_timeout)
+    export = _create_engine(settings.db_dsn, settings.db_export_pool_size, settings.db_export_pool_timeout)
+    # Engines by name, for the pool statistics of /api/admin/pools/
+    by_name = {"interactive": interactive, "ingest": ingest, "export": export}
+    # Without a replica configured, reads simply go to the primary
+    read = interactive
+    if settings.db_read_dsn is not None:
+        read = by_name["read"] = _create_engine(
+            settings.db_read_dsn, settings.db_read_pool_size, settings.db_pool_timeout
+        )
+    for name, _engine in by_name.items():
+        compile_cache.install(_engine.sync_engine)
+        statement_timer.install(_engine.sync_engine)
+        if settings.slow_query_log_enabled:
+            slow_queries.install(name, _engine)
+
+    interactive_session = sa_async.async_sessionmaker(interactive, expire_on_commit=False)
+    globals().update(
+        engine=interactive,
+        ingest_engine=ingest,
+        export_engine=export,
+        read_engine=read,
+        engines=by_name,
+        async_session=interactive_session,
+        async_read_session=sa_async.async_sessionmaker(sync_session_class=RoutingSession, expire_on_commit=False),
+        # Session factories by workload, see `app.db.deps.use_pool`
+        sessionmakers={
+            "interactive": interactive_session,
+            "ingest": sa_async.async_sessionmaker(ingest, expire_on_commit=False),
+            "export": sa_async.async_sessionmaker(export, expire_on_commit=False),
+        },
+    )
+
+
+def __getattr__(name: str) -> typing.Any:  # noqa: ANN401
+    if name in _LAZY:
+        _create_engines()
+        return globals()[name]
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+def created_engines() -> dict[str, sa_async.AsyncEngine]:
+    """The engines by name, without creating them when nothing used them yet."""
+    return globals().get("engines", {})
+
+
+def _after_fork_in_child() -> None:
+    # A worker forked from a process that already used the engines must not share its connections: drop
+    # them from the pools without closing them, as they still belong to the parent. The child opens its own.
+    for _engine in created_engines().values():
+        _engine.sync_engine.dispose(close=False)
+    compile_cache.reset()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class RoutingSession(orm.Session):
+    """Session sending reads to the read engine until it writes anything.
+
+    The first INSERT/UPDATE/DELETE (or flush, or textual statement) pins the session to the primary, so
+    everything read after a write in the same session sees that write, whatever the replication lag.
+    """
+
+    def get_bind(
+        self,
+        mapper: typing.Any = None,  # noqa: ANN401
+        clause: typing.Any = None,  # noqa: ANN401
+        **kwargs: typing.Any,  # noqa: ANN401
+    ) -> sa.Engine:
+        if not self.info.get("primary") and (self._flushing or not isinstance(clause, sa.Select)):
+            self.info["primary"] = True
+        return _module.engine.sync_engine if self.info.get("primary") else _module.read_engine.sync_engine
+
+
 metadata = MetaData()
 Base = declarative_base(metadata=metadata)
@@ -1,27 +1,81 @@
+import contextlib
+import dataclasses
 import typing
 from contextvars import ContextVar
 
 from sqlalchemy.ext import asyncio as sa_async
 
-from app.db.base import async_session
+from app.db import base
 
 session_context_var: ContextVar[sa_async.AsyncSession | None] = ContextVar("_session", default=None)
 
-async def set_db() -> typing.AsyncIterator[None]:
-    """Store db session in the context var and reset it."""
-    db = async_session()
-    token = session_context_var.set(db)
+
+@dataclasses.dataclass
+class _SessionScope:
+    read_only: bool = False
+    pool: str = "interactive"
+    session: sa_async.AsyncSession | None = None
+
+
+# The scope is a mutable holder: a session created deep inside a handler (in a copied context, e.g. a
+# sync dependency running in the threadpool) is still seen and closed by whoever opened the scope.
+_scope_context_var: ContextVar[_SessionScope | None] = ContextVar("_session_scope", default=None)
+
+
+@contextlib.asynccontextmanager
+async def db_scope(read_only: bool = False, pool: str = "interactive") -> typing.AsyncIterator[None]:
+    """Let `get_db()` create a session on first use within the scope, and close it when the scope ends.
+
+    The session takes its connection from the named `pool` (see `app.db.base.sessionmakers`). A
+    `read_only` interactive scope reads from the replica until it writes (see RoutingSession).
+    """
+    scope = _SessionScope(read_only, pool)
+    token = _scope_context_var.set(scope)
     try:
         yield
     finally:
-        await db.close()
-        session_context_var.reset(token)
+        _scope_context_var.reset(token)
+        if scope.session is not None:
+            await scope.session.close()
+
+
+async def set_db() -> typing.AsyncIterator[None]:
+    """Store db session in the context var and reset it."""
+    async with db_scope():
+        yield
 
 
 def get_db() -> sa_async.AsyncSession:
-    """Fetch db session from the context var."""
+    """Fetch db session from the context var, creating it on the first call in a `db_scope`."""
+    scope = _scope_context_var.get()
+    if scope is not None:
+        if scope.session is None:
+            if scope.read_only and scope.pool == "interactive":
+                scope.session = base.async_read_session()
+            else:
+                scope.session = base.sessionmakers[scope.pool]()
+        return scope.session
     session = session_context_var.get()
     if session is None:
         msg = "Missing session"
         raise RuntimeError(msg)
-    return session
\ No newline at end of file
+    return session
+
+
+def use_pool(name: str) -> typing.Callable[[], typing.Awaitable[None]]:
+    """Dependency taking the session of the request from the named pool instead of the interactive one.
+
+    E.g. `@router.get("/exports/{export_id}/", dependencies=[Depends(use_pool("export"))])`
+    """
+    if name not in base.sessionmakers:
+        msg = f"Unknown pool {name}"
+        raise KeyError(msg)
+
+    async def select_pool() -> None:
+        scope = _scope_context_var.get()
+        if scope is None or scope.session is not None:
+            msg = "use_pool needs a route of DBSessionRoute, before the session is used"
+            raise RuntimeError(msg)
+        scope.pool = name
+
+    return select_pool
@@ -0,0 +1,251 @@
+"""Statistics on how statements are compiled and executed, and how connection pools are used.
+
+Every statement executed through the engine is counted by its cache outcome: a hit reused a compiled
+form, a miss compiled the statement and stored it, and statements without a cache key (textual SQL,
+constructs that cannot be cached) are compiled every time. The time spent executing statements is added
+to the timings of the request running them.
+"""
+import asyncio
+import collections
+import dataclasses
+import itertools
+import json
+import logging
+import random
+import time
+import typing
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.ext import asyncio as sa_async
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.settings import settings
+from app.utils.metrics import Histogram
+from app.utils.timing import request_timings
+
+logger = logging.getLogger(__name__)
+
+
+# Checkouts are normally immediate, so the buckets start well below a millisecond
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class CompileCacheStats:
+    def __init__(self) -> None:
+        self.counts: collections.Counter[str] = collections.Counter()
+        self._engines: list[sa.Engine] = []
+
+    def install(self, engine: sa.Engine) -> None:
+        sa.event.listen(engine, "after_execute", self._after_execute)
+        self._engines.append(engine)
+
+    def _after_execute(self, conn: sa.Connection, clauseelement: typing.Any, *args: typing.Any) -> None:  # noqa: ANN401
+        result: sa.CursorResult[typing.Any] = args[-1]
+        context = getattr(result, "context", None)
+        if context is not None:
+            self.counts[context.cache_hit.name.lower()] += 1
+
+    def reset(self) -> None:
+        self.counts.clear()
+
+    def stats(self) -> dict[str, typing.Any]:
+        compiled = self.counts["cache_hit"] + self.counts["cache_miss"]
+        return {
+            **{outcome: self.counts[outcome] for outcome in ("cache_hit", "cache_miss", "no_cache_key")},
+            "hit_rate": self.counts["cache_hit"] / compiled if compiled else 0.0,
+            "cached_statements": sum(
+                len(engine._compiled_cache) for engine in self._engines if engine._compiled_cache is not None
+            ),
+        }
+
+
+compile_cache = CompileCacheStats()
+
+
+class StatementTimer:
+    """Add the execution time of every statement to the `RequestTimings` of the current request."""
+
+    def install(self, engine: sa.Engine) -> None:
+        sa.event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        sa.event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn: sa.Connection, *args: typing.Any) -> None:  # noqa: ANN401
+        # A connection executes one statement at a time; a statement that failed is simply overwritten
+        conn.info["statement_started"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn: sa.Connection, *args: typing.Any) -> None:  # noqa: ANN401
+        started = conn.info.pop("statement_started", None)
+        timings = request_timings.get()
+        if started is not None and timings is not None:
+            timings.record_statement(time.perf_counter() - started)
+
+
+statement_timer = StatementTimer()
+
+
+@dataclasses.dataclass
+class SlowQuery:
+    id: int
+    engine: str
+    recorded_at: str
+    duration_ms: float
+    statement: str
+    # Types (and lengths of lists) of the bound parameters; their values are not kept
+    parameters: list[str]
+    plan: typing.Any = None  # noqa: ANN401
+    explain_error: str | None = None
+
+
+def parameter_shape(value: typing.Any) -> str:  # noqa: ANN401
+    if isinstance(value, list | tuple):
+        item_types = sorted({type(item).__name__ for item in value}) or ["?"]
+        return f"{'|'.join(item_types)}[{len(value)}]"
+    return type(value).__name__
+
+
+class SlowQueryLog:
+    """Ring buffer of the statements slower than a threshold, with the plan of a sample of them.
+
+    A slow SELECT is re-run as `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` in a background task, on its own
+    connection of the same engine, so the request that ran it does not wait for the plan. Explains are
+    sampled (`explain_sample_rate`) and at most one starts per `explain_interval` seconds, as every one
+    runs the slow query again. Other statements are recorded without a plan: EXPLAIN ANALYZE executes them.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        size: int,
+        explain_sample_rate: float,
+        explain_interval: float,
+        explain_timeout: float = 60.0,
+    ) -> None:
+        self.threshold = threshold
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self.explain_timeout = explain_timeout
+        self.entries: collections.deque[SlowQuery] = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._last_explain = float("-inf")
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def install(self, name: str, engine: sa_async.AsyncEngine) -> None:
+        def after_cursor_execute(
+            conn: sa.Connection, cursor: typing.Any, statement: str, parameters: typing.Any,  # noqa: ANN401
+            context: typing.Any, executemany: bool,  # noqa: ANN401
+        ) -> None:
+            started = conn.info.get("slow_query_started")
+            if started is not None:
+                duration = time.perf_counter() - started
+                if duration >= self.threshold:
+                    self.record(name, engine, statement, () if executemany else parameters, duration)
+
+        sa.event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        sa.event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+    def _before_cursor_execute(self, conn: sa.Connection, *args: typing.Any) -> None:  # noqa: ANN401
+        conn.info["slow_query_started"] = time.perf_counter()
+
+    def record(
+        self, name: str, engine: sa_async.AsyncEngine, statement: str, parameters: typing.Sequence[typing.Any],
+        duration: float,
+    ) -> SlowQuery:
+        entry = SlowQuery(
+            id=next(self._ids),
+            engine=name,
+            recorded_at=datetime.now(timezone.utc).isoformat(),
+            duration_ms=round(duration * 1000, 2),
+            statement=statement,
+            parameters=[parameter_shape(value) for value in parameters],
+        )
+        self.entries.append(entry)
+        if self._should_explain(statement):
+            self._last_explain = time.monotonic()
+            task = asyncio.get_running_loop().create_task(self._explain(entry, engine, statement, list(parameters)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return entry
+
+    def _should_explain(self, statement: str) -> bool:
+        return (
+            statement.lstrip()[:6].upper() == "SELECT"
+            and time.monotonic() - self._last_explain >= self.explain_interval
+            and random.random() < self.explain_sample_rate  # noqa: S311
+        )
+
+    async def _explain(
+        self, entry: SlowQuery, engine: sa_async.AsyncEngine, statement: str, parameters: list[typing.Any],
+    ) -> None:
+        # The driver connection is used directly, so the EXPLAIN is neither timed nor recorded itself
+        try:
+            async with engine.connect() as connection:
+                raw_connection = await connection.get_raw_connection()
+                plan = await raw_connection.driver_connection.fetchval(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", *parameters,
+                    timeout=self.explain_timeout,
+                )
+                await connection.rollback()
+            entry.plan = json.loads(plan) if isinstance(plan, str) else plan
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Failed to explain slow query %s: %s", entry.id, e)
+            entry.explain_error = str(e)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "queries": [dataclasses.asdict(entry) for entry in reversed(self.entries)],
+        }
+
+
+# Only installed on the engines with settings.slow_query_log_enabled, see app/db/base.py
+slow_queries = SlowQueryLog(
+    threshold=settings.slow_query_ms / 1000,
+    size=settings.slow_query_log_size,
+    explain_sample_rate=settings.slow_query_explain_sample_rate,
+    explain_interval=settings.slow_query_explain_interval_s,
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Pool recording how long every checkout took, to size pools by how long requests wait for them.
+
+    The time includes opening a new connection when the pool grows, and checkouts that gave up after
+    the pool timeout are counted separately.
+    """
+
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any) -> None:  # noqa: ANN401
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def connect(self) -> typing.Any:  # noqa: ANN401
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except sa.exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_time.observe(time.perf_counter() - started)
+
+
+def pool_stats(pool: sa.Pool) -> dict[str, typing.Any]:
+    """Occupancy of a connection pool: connections idle in the pool, handed out, and beyond its size."""
+    if not isinstance(pool, sa.QueuePool):
+        return {"pool": type(pool).__name__}
+    stats = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats["timeouts"] = pool.timeouts
+        stats["wait_time"] = pool.wait_time.snapshot()
+    return stats
@@ -1,4 +1,5 @@
 import datetime
+import functools
 import logging
 import re
 import typing
@@ -10,7 +11,7 @@ from sqlalchemy.orm import selectinload
 
 from app.db.deps import get_db
 from app.db.exceptions import DatabaseValidationError
-from app.db.utils import operators_map
+from app.db.utils import aggregates_map, any_of, operators_map
 from app.utils.datetime import generate_utc_dt
 
 from app.db.base import Base
@@ -73,24 +74,37 @@ class BaseModel(Base):
         prefetch: tuple[str, ...] | None = None,
         options: list[typing.Any] | None = None,
     ) -> sa.Select[tuple[typing.Self]]:
+        if not options:
+            return cls._base_query(prefetch or ())
+        options = [*options, *(selectinload(getattr(cls, x)) for x in prefetch or ())]
+        return sa.select(cls).options(*options).execution_options(populate_existing=True)
+
+    @classmethod
+    @functools.cache
+    def _base_query(cls, prefetch: tuple[str, ...]) -> sa.Select[tuple[typing.Self]]:
+        # Statements are immutable, so the select with its loader options is built once per model and prefetch
         query = sa.select(cls)
         if prefetch:
-            if not options:
-                options = []
-            options.extend(selectinload(getattr(cls, x)) for x in prefetch)
-            query = query.options(*options).execution_options(populate_existing=True)
+            query = query.options(*(selectinload(getattr(cls, x)) for x in prefetch))
+            query = query.execution_options(populate_existing=True)
         return query
 
     @classmethod
-    async def all(cls, prefetch: tuple[str, ...] | None = None) -> typing.Sequence[typing.Self]:
-        query = cls._get_query(prefetch)
-        db = get_db()
-        db_execute = await db.execute(query)
-        return db_execute.scalars().all()
+    async def all(
+        cls,
+        prefetch: tuple[str, ...] | None = None,
+        sorting: dict[str, str] | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        after: dict[str, typing.Any] | None = None,
+    ) -> typing.Sequence[typing.Self]:
+        return await cls.filter({}, sorting, prefetch, limit=limit, offset=offset, after=after)
 
     @classmethod
     async def get_by_id(cls, obj_id: int, prefetch: tuple[str, ...] | None = None) -> typing.Self | None:
-        query = cls._get_query(prefetch).where(cls.id == obj_id)
+        base_query = cls._get_query(prefetch)
+        # A lambda statement is only built the first time, later calls just extract the id from the closure
+        query = sa.lambda_stmt(lambda: base_query.where(cls.id == obj_id))
         db = get_db()
         db_execute = await db.execute(query)
         return db_execute.scalars().first()
@@ -101,20 +115,106 @@ class BaseModel(Base):
         filters: dict[str, typing.Any],
         sorting: dict[str, str] | None = None,
         prefetch: tuple[str, ...] | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        after: dict[str, typing.Any] | None = None,
     ) -> typing.Sequence[typing.Self]:
+        """Fetch the objects matching `filters`.
+
+        Pages are taken with `limit` and `offset`, or with `after`: the values of the sorting fields of the
+        last object of the previous page. Paging with `after` (keyset pagination) stays fast on deep pages,
+        since the database seeks to the position through the index instead of skipping `offset` rows.
+        """
         query = cls._get_query(prefetch)
         db = get_db()
+        conditions = cls._build_filters(filters)
+        if after is not None:
+            # Keyset pages need a unique order, the id breaks ties between equal sorting values
+            sorting = {**(sorting or {}), "id": (sorting or {}).get("id", "asc")}
+            conditions.append(cls._build_keyset(sorting, after))
         if sorting is not None:
             query = query.order_by(*cls._build_sorting(sorting))
-        db_execute = await db.execute(query.where(sa.and_(True, *cls._build_filters(filters))))
+        query = query.where(sa.and_(True, *conditions)).limit(limit).offset(offset)
+        db_execute = await db.execute(query)
         return db_execute.scalars().all()
 
     @classmethod
-    def _build_sorting(cls, sorting: dict[str, str]) -> list[typing.Any]:
-        """Build list of ORDER_BY clauses."""
-        result = []
+    async def count(cls, filters: dict[str, typing.Any] | None = None) -> int:
+        query = sa.select(sa.func.count()).select_from(cls).where(sa.and_(True, *cls._build_filters(filters or {})))
+        db = get_db()
+        db_execute = await db.execute(query)
+        return db_execute.scalar_one()
+
+    @classmethod
+    async def exists(cls, filters: dict[str, typing.Any] | None = None) -> bool:
+        query = sa.select(sa.exists().where(sa.and_(True, *cls._build_filters(filters or {}))))
+        db = get_db()
+        db_execute = await db.execute(query)
+        return db_execute.scalar_one()
+
+    @classmethod
+    async def aggregate(
+        cls,
+        aggregates: dict[str, str],
+        filters: dict[str, typing.Any] | None = None,
+        group_by: tuple[str, ...] = (),
+        sorting: dict[str, str] | None = None,
+    ) -> list[dict[str, typing.Any]]:
+        """Compute aggregates in the database, one row per group.
+
+        `aggregates` maps result names to "<field>__<aggregate>" expressions, e.g.
+        `{"readings": "id__count", "highest": "value__max"}`, which are returned together with the
+        `group_by` fields (a single row without grouping).
+        """
+        columns = {field_name: getattr(cls, field_name) for field_name in group_by}
+        for name, expression in aggregates.items():
+            field_name, _, function_name = expression.rpartition("__")
+            if function_name not in aggregates_map:
+                msg = f"Expression {expression} has incorrect aggregate {function_name}"
+                raise KeyError(msg)
+            columns[name] = aggregates_map[function_name](getattr(cls, field_name)).label(name)
+        query = (
+            sa.select(*columns.values())
+            .where(sa.and_(True, *cls._build_filters(filters or {})))
+            .group_by(*(columns[field_name] for field_name in group_by))
+        )
+        if sorting is not None:
+            # Groups can be sorted by the aggregates too
+            query = query.order_by(*cls._build_sorting(sorting, columns))
+        db = get_db()
+        db_execute = await db.execute(query)
+        return [dict(row) for row in db_execute.mappings()]
+
+    @classmethod
+    def _build_keyset(cls, sorting: dict[str, str], after: dict[str, typing.Any]) -> typing.Any:  # noqa: ANN401
+        """Build the WHERE condition selecting the rows that come after `after` in the given order."""
+        # (a > x) OR (a = x AND b > y) OR ..., flipping the comparison for descending fields
+        conditions = []
+        equal: list[typing.Any] = []
         for field_name, direction in sorting.items():
+            if field_name not in after:
+                msg = f"Keyset value for sorting field {field_name} is missing"
+                raise KeyError(msg)
             field = getattr(cls, field_name)
+            # A comparison with NULL is never true, rows with a NULL sorting value would drop out of every page
+            if field.nullable:
+                msg = f"Keyset pagination cannot sort by nullable field {field_name}"
+                raise ValueError(msg)
+            following = field < after[field_name] if direction == "desc" else field > after[field_name]
+            conditions.append(sa.and_(*equal, following))
+            equal.append(field == after[field_name])
+        return sa.or_(*conditions)
+
+    @classmethod
+    def _build_sorting(
+        cls,
+        sorting: dict[str, str],
+        columns: dict[str, typing.Any] | None = None,
+    ) -> list[typing.Any]:
+        """Build list of ORDER_BY clauses, on model fields or on the given (labeled) columns."""
+        result = []
+        for field_name, direction in sorting.items():
+            field = columns[field_name] if columns and field_name in columns else getattr(cls, field_name)
             result.append(getattr(field, direction)())
         return result
 
@@ -134,30 +234,82 @@ class BaseModel(Base):
         return result
 
     @classmethod
-    async def bulk_create(cls, objects: list[typing.Self]) -> typing.Sequence[typing.Self]:
+    def _column_values(cls, obj: typing.Self | dict[str, typing.Any]) -> dict[str, typing.Any]:
+        """The column attributes set on an object (or given in a dict), keyed by attribute name."""
+        values = obj if isinstance(obj, dict) else obj.__dict__
+        return {attr.key: values[attr.key] for attr in sa.inspect(cls).column_attrs if attr.key in values}
+
+    @classmethod
+    async def bulk_create(
+        cls,
+        objects: typing.Sequence[typing.Self | dict[str, typing.Any]],
+        returning: bool = True,
+    ) -> typing.Sequence[typing.Self]:
+        """Insert objects (or dicts of column values) with as few INSERT statements as possible.
+
+        Rows go through a single INSERT .. VALUES per batch (insertmanyvalues) instead of the unit of work,
+        so relationships set on the objects are not saved. With `returning` the created objects are loaded
+        back in the order given, with their ids; without it nothing is returned, which is cheaper still.
+        The returned objects are new instances: the objects passed in are left untouched, without ids.
+        """
+        if not objects:
+            return []
         db: AsyncSession = get_db()
+        rows = []
+        for obj in objects:
+            values = cls._column_values(obj)
+            if values.get("id") is None:
+                values.pop("id", None)
+            rows.append(values)
         try:
-            db.add_all(objects)
-            await db.flush()
+            if returning:
+                query = sa.insert(cls).returning(cls, sort_by_parameter_order=True)
+                db_execute = await db.execute(query, rows)
+                return db_execute.scalars().all()
+            await db.execute(sa.insert(cls), rows)
         except IntegrityError as e:
             cls._raise_validation_exception(e)
-        return objects
+        return []
 
     @classmethod
-    async def bulk_update(cls, objects: list[typing.Self]) -> typing.Sequence[typing.Self]:
+    async def bulk_update(
+        cls,
+        objects: typing.Sequence[typing.Self | dict[str, typing.Any]],
+        returning: bool = True,
+    ) -> typing.Sequence[typing.Self]:
+        """Update objects (or dicts of column values) by primary key with executemany UPDATE statements.
+
+        Only the columns set on each object are updated, objects without an id are skipped. With `returning`
+        the updated objects are loaded back in the order given. Ids that do not exist raise a
+        DatabaseValidationError; the rows that did exist are updated, so roll back to discard them.
+        """
+        rows = [values for values in map(cls._column_values, objects) if values.get("id")]
+        if not rows:
+            return []
         db: AsyncSession = get_db()
+        ids = [row["id"] for row in rows]
         try:
-            ids = [x.id for x in objects if x.id]
-            await db.execute(sa.select(cls).where(cls.id.in_(ids)))
-            for item in objects:
-                try:
-                    await db.merge(item)
-                except IntegrityError as e:
-                    cls._raise_validation_exception(e)
-            await db.flush()
+            await db.execute(sa.update(cls), rows)
         except IntegrityError as e:
             cls._raise_validation_exception(e)
-        return objects
+        except orm.exc.StaleDataError:
+            existing = set((await db.execute(sa.select(cls.id).where(any_of(cls.id, ids)))).scalars())
+            cls._raise_missing_ids([obj_id for obj_id in ids if obj_id not in existing])
+        if not returning:
+            return []
+        db_execute = await db.execute(
+            sa.select(cls).where(any_of(cls.id, ids)).execution_options(populate_existing=True)
+        )
+        updated = {obj.id: obj for obj in db_execute.scalars()}
+        if len(updated) < len(set(ids)):
+            # Drivers without a reliable executemany rowcount do not raise StaleDataError
+            cls._raise_missing_ids([obj_id for obj_id in ids if obj_id not in updated])
+        return [updated[obj_id] for obj_id in ids]
+
+    @classmethod
+    def _raise_missing_ids(cls, ids: list[int]) -> typing.Never:
+        msg = f"{cls.__name__} with id {', '.join(map(str, ids))} does not exist"
+        raise DatabaseValidationError(msg, "id")
 
     async def save(self, commit: bool = True) -> None:
         db: AsyncSession = get_db()
@@ -0,0 +1,71 @@
+"""Route class giving every request its database session, within the admission limit of its kind.
+
+Kept apart from app.db.deps, which the models import, so that importing the models (migrations, the
+ETL) does not import FastAPI.
+"""
+import contextlib
+import typing
+
+import fastapi
+import sqlalchemy as sa
+
+from app.db.deps import db_scope
+from app.middleware import TimedRoute
+from app.settings import settings
+from app.utils.admission import AdaptiveLimiter
+from app.utils.timing import request_timings
+
+
+def _limiter(name: str) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name,
+        initial_limit=settings.admission_initial_limit,
+        min_limit=settings.admission_min_limit,
+        max_limit=settings.admission_max_limit,
+        queue_size=settings.admission_queue_size,
+        queue_timeout=settings.admission_queue_timeout_s,
+        tolerance=settings.admission_latency_tolerance,
+    )
+
+
+# Reads and writes are limited apart: a burst of dashboard refreshes must not hold back ingestion
+limiters = {"read": _limiter("read"), "write": _limiter("write")}
+
+
+@contextlib.asynccontextmanager
+async def admission(limiter: AdaptiveLimiter) -> typing.AsyncIterator[None]:
+    """Run within the limiter, and feed it the database latency the request saw."""
+    if not settings.admission_enabled:
+        yield
+        return
+    async with limiter.acquire():
+        try:
+            yield
+        except sa.exc.TimeoutError:
+            limiter.observe(None, dropped=True)
+            raise
+        timings = request_timings.get()
+        if timings is not None and timings.statements:
+            limiter.observe(timings.db_time / timings.statements)
+
+
+class DBSessionRoute(TimedRoute):
+    """Route running its handler in a `db_scope`.
+
+    Requests that never call `get_db()` never create a session, and a request that does uses that one
+    session (and at most one pooled connection) throughout. The session is closed, and its connection
+    checked back in, as soon as the handler returned its response, before the response is sent.
+    GET routes read from the replica, when one is configured; every other route uses the primary.
+    Both kinds have their own admission limit (see `limiters`), and queue or are shed beyond it.
+    """
+
+    def get_route_handler(self) -> typing.Callable[[fastapi.Request], typing.Awaitable[fastapi.Response]]:
+        handler = super().get_route_handler()
+        read_only = self.methods <= {"GET", "HEAD"}
+        kind = "read" if read_only else "write"
+
+        async def route_handler(request: fastapi.Request) -> fastapi.Response:
+            async with admission(limiters[kind]), db_scope(read_only):
+                return await handler(request)
+
+        return route_handler
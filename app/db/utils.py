@@ -4,6 +4,8 @@ from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from typing import TYPE_CHECKING
 
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql import operators
 
 from app.db.deps import get_db
@@ -33,6 +35,21 @@ async def transaction() -> AsyncGenerator[None, None]:
             logger.debug("implicit transaction commit")
 
 
+def any_of(column: typing.Any, values: typing.Iterable[typing.Any]) -> sa.ColumnElement[bool]:  # noqa: ANN401
+    """`column IN values` as `column = ANY(:array)`.
+
+    An IN list renders one parameter per value, so every list length is a different SQL string for the
+    asyncpg prepared statement cache (and asyncpg refuses more than 32767 parameters). A single array
+    parameter keeps the SQL the same whatever the number of values.
+    """
+    return column == sa.any_(sa.bindparam(None, list(values), type_=postgresql.ARRAY(column.type)))
+
+
+def none_of(column: typing.Any, values: typing.Iterable[typing.Any]) -> sa.ColumnElement[bool]:  # noqa: ANN401
+    """`column NOT IN values` as `column != ALL(:array)`, see `any_of`."""
+    return column != sa.all_(sa.bindparam(None, list(values), type_=postgresql.ARRAY(column.type)))
+
+
 # https://github.com/absent1706/sqlalchemy-mixins/blob/master/sqlalchemy_mixins/smartquery.py
 operators_map: dict[str, typing.Any] = {
     "isnull": lambda c, v: (c is None) if v else (c is not None),
@@ -42,8 +59,8 @@ operators_map: dict[str, typing.Any] = {
     "ge": operators.ge,  # greater than or equal, >=
     "lt": operators.lt,  # lower than, <
     "le": operators.le,  # lower than or equal, <=
-    "in": operators.in_op,
-    "notin": operators.notin_op,
+    "in": any_of,
+    "notin": none_of,
     "between": lambda c, v: c.between(v[0], v[1]),
     "like": operators.like_op,
     "ilike": operators.ilike_op,
@@ -53,3 +70,12 @@ operators_map: dict[str, typing.Any] = {
     "iendswith": lambda c, v: c.ilike("%" + v),
     "overlaps": lambda c, v: c.overlaps(v),
 }
+
+# Aggregates for BaseModel.aggregate, named the same way as the filters: "<field>__<aggregate>"
+aggregates_map: dict[str, typing.Any] = {
+    "count": sa.func.count,
+    "sum": sa.func.sum,
+    "avg": sa.func.avg,
+    "min": sa.func.min,
+    "max": sa.func.max,
+}
@@ -2,14 +2,16 @@
 Dependency injection: Updated to switch between different data 
 source implementations. 
 '''
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.deps import get_db
+from app.repositories.asyncpg_repository import AsyncpgReadingRepository
 from app.repositories.database_repository import DatabaseReadingRepository
-from app.repositories.inmemory_repository import InMemoryReadingRepository
 from app.repositories.repository_interface import ReadingRepository
+from app.settings import settings
 
-async def get_reading_repository(db = Depends(get_db)) -> ReadingRepository:
+async def get_reading_repository() -> ReadingRepository:
     # You can switch the repository here as needed
-    return DatabaseReadingRepository(db)
-    # return InMemoryReadingRepository(your_in_memory_data)
+    # An async dependency runs on the event loop, and the repository only asks for the session of the
+    # request (creating it) on its first query
+    if settings.reading_repository == "asyncpg":
+        return AsyncpgReadingRepository()
+    return DatabaseReadingRepository()
+    # or return an app.repositories.inmemory_repository.InMemoryReadingRepository, e.g. one loaded at startup
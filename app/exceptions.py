@@ -1,9 +1,13 @@
+import math
+
 from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from starlette.requests import Request
 
 from app.db.exceptions import DatabaseValidationError
+from app.repositories.ingest_buffer import IngestBufferFullError
+from app.utils.admission import AdmissionRejectedError
 
 
 async def database_validation_exception_handler(request: Request, exc: DatabaseValidationError) -> JSONResponse:
@@ -19,3 +23,19 @@ async def database_validation_exception_handler(request: Request, exc: DatabaseV
         body=exc.message,
     )
     return await request_validation_exception_handler(request, validation_error)
+
+
+async def ingest_buffer_full_exception_handler(request: Request, exc: IngestBufferFullError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Ingestion buffer is full, retry later"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+async def admission_rejected_exception_handler(request: Request, exc: AdmissionRejectedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is over capacity, retry later"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
@@ -0,0 +1,102 @@
+"""Startup warm-up and graceful shutdown of a worker.
+
+Without a warm-up the first requests of a new worker open the pool's connections, compile (and with the
+asyncpg repository, prepare) their statements and run pydantic-core's validators for the first time,
+which shows up as a p99 spike on every deploy. `warm_up` does that work before the worker reports
+itself started, by sending requests through the application itself:
+- the readings query with each kind of filter, `db_pool_size` of them at once, so every connection of the
+  interactive pool is opened (and has its statements prepared); they ask for readings from the far
+  future, so they are cheap and answer 404
+- the dyke list, which also fills the cached base queries of the models
+
+On shutdown `drain` refuses new requests with 503 (see `DrainingMiddleware`) and waits for those in
+flight, after which the lifespan writes out the ingest buffer and `dispose_engines` closes the pools.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from starlette.types import ASGIApp, Message
+
+from app.apps.dykes import schemas
+from app.db import base
+from app.middleware import draining, request_metrics
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Every request of a batch asks for another microsecond, so they are not coalesced into a single query
+FAR_FUTURE = "9999-01-01T00:00:00.{:06d}"
+WARMUP_PATHS = (
+    "/api/readings/?startDate={far_future}",
+    "/api/readings/?startDate={far_future}&endDate={far_future}",
+    "/api/readings/?startDate={far_future}&sensorId=0",
+    "/api/readings/?startDate={far_future}&sensorName=warm-up",
+)
+
+
+async def synthetic_request(app: ASGIApp, path_with_query: str) -> int:
+    """Send a GET request straight to the ASGI application, and return the status of its response."""
+    path, _, query = path_with_query.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"warm-up")],
+        "client": None,
+        "server": None,
+    }
+    status = 0
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def warm_up(app: ASGIApp) -> None:
+    started = time.perf_counter()
+    try:
+        for path in WARMUP_PATHS:
+            await asyncio.gather(*(
+                synthetic_request(app, path.format(far_future=FAR_FUTURE.format(index)))
+                for index in range(settings.db_pool_size)
+            ))
+        await synthetic_request(app, "/api/dykes/?limit=1")
+    except Exception as e:  # noqa: BLE001
+        # A worker that cannot reach the database yet still starts, and recovers once it can
+        logger.warning("Warm-up failed: %s", e)
+        return
+    schemas.Readings.model_validate({"readings": [{
+        "id": 0, "crossection": "", "sensor_id": 0, "sensor_name": "", "sensor_type": "", "sensor_is_active": True,
+        "location_in_topology": [0.0, 0.0], "unit": "", "value": 0.0, "time": datetime(2000, 1, 1),
+    }]}).model_dump_json()
+    logger.info("Warmed up in %.0fms", (time.perf_counter() - started) * 1000)
+
+
+async def drain(timeout: float) -> None:
+    """Refuse new requests and wait up to `timeout` seconds for those in flight."""
+    draining.set()
+    deadline = time.monotonic() + timeout
+    while request_metrics.in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if request_metrics.in_flight:
+        logger.warning("Shutting down with %s requests still in flight", request_metrics.in_flight)
+
+
+async def dispose_engines() -> None:
+    await asyncio.gather(*(engine.dispose() for engine in base.created_engines().values()))
+
@@ -0,0 +1,300 @@
+"""Live readings: ingested readings pushed to dashboards over SSE or a WebSocket at /api/readings/live.
+
+Instead of every dashboard polling the readings endpoint, clients subscribe once, optionally to some
+sensors (`sensorId`) or crossections (`crossection`), and receive the readings matching their filter as
+they are ingested. Ingestion publishes a compact form of every stored reading on a bus (`LiveReadings`):
+- the "memory" bus hands them to the subscribers of the same worker process
+- the "postgres" bus sends them with `NOTIFY` instead; every worker LISTENs on one connection of its own
+  and hands what arrives to its subscribers, so a reading posted to any worker reaches all of them
+
+Every subscriber has a bounded buffer. A client too slow to keep up loses the oldest readings of its
+buffer, and the next message tells how many were dropped, so it can refetch them. Readings arriving within
+`settings.live_flush_interval_ms` are sent together in one message.
+"""
+import asyncio
+import collections
+import json
+import logging
+import typing
+
+import fastapi
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+
+from app.middleware import TimedRoute
+from app.settings import settings
+
+if typing.TYPE_CHECKING:
+    import asyncpg
+
+logger = logging.getLogger(__name__)
+
+LIVE_FIELDS = ("id", "sensor_id", "sensor_name", "crossection", "unit", "value", "time")
+# NOTIFY payloads are limited to 8000 bytes
+NOTIFY_PAYLOAD_SIZE = 7500
+
+
+def compact(reading: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    return {field: reading.get(field) for field in LIVE_FIELDS}
+
+
+class Subscription:
+    def __init__(
+        self,
+        sensor_ids: typing.Collection[int] | None,
+        crossections: typing.Collection[str] | None,
+        buffer_size: int,
+        flush_interval: float,
+    ) -> None:
+        self.sensor_ids = frozenset(sensor_ids or ())
+        self.crossections = frozenset(crossections or ())
+        self.flush_interval = flush_interval
+        self.closed = False
+        self.dropped = 0
+        self._pending: collections.deque[dict[str, typing.Any]] = collections.deque(maxlen=buffer_size)
+        self._ready = asyncio.Event()
+        self._last_sent = float("-inf")
+
+    def matches(self, reading: dict[str, typing.Any]) -> bool:
+        return (not self.sensor_ids or reading["sensor_id"] in self.sensor_ids) and (
+            not self.crossections or reading["crossection"] in self.crossections
+        )
+
+    def offer(self, reading: dict[str, typing.Any]) -> None:
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(reading)
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def next(self, timeout: float) -> dict[str, typing.Any] | None:
+        """The readings received since the last call, or None after `timeout` seconds without any or once closed."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except TimeoutError:
+            return None
+        loop = asyncio.get_running_loop()
+        # Readings arriving shortly after the previous message wait for the next one, and go out together
+        delay = self._last_sent + self.flush_interval - loop.time()
+        if delay > 0 and not self.closed:
+            await asyncio.sleep(delay)
+        self._ready.clear()
+        if not self._pending:
+            return None
+        readings = list(self._pending)
+        self._pending.clear()
+        message = {"readings": readings, "dropped": self.dropped}
+        self.dropped = 0
+        self._last_sent = loop.time()
+        return message
+
+
+class LiveReadings:
+    def __init__(self, bus: str, channel: str, buffer_size: int, flush_interval: float) -> None:
+        self.bus = bus
+        self.channel = channel
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        # Subscribers by the sensor or crossection they filter on, so a reading is only matched against those
+        # that may want it
+        self._by_sensor: dict[int, set[Subscription]] = collections.defaultdict(set)
+        self._by_crossection: dict[str, set[Subscription]] = collections.defaultdict(set)
+        self._unfiltered: set[Subscription] = set()
+        self._subscriptions: set[Subscription] = set()
+        self._connection: asyncpg.Connection | None = None
+        self._notify_lock = asyncio.Lock()
+        self._listener: asyncio.Task[None] | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(
+        self, sensor_ids: typing.Collection[int] | None = None, crossections: typing.Collection[str] | None = None,
+    ) -> Subscription:
+        subscription = Subscription(sensor_ids, crossections, self.buffer_size, self.flush_interval)
+        for group in self._groups(subscription):
+            group.add(subscription)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for group in self._groups(subscription):
+            group.discard(subscription)
+        self._subscriptions.discard(subscription)
+        subscription.close()
+
+    def _groups(self, subscription: Subscription) -> list[set[Subscription]]:
+        if subscription.sensor_ids:
+            return [self._by_sensor[sensor_id] for sensor_id in subscription.sensor_ids]
+        if subscription.crossections:
+            return [self._by_crossection[crossection] for crossection in subscription.crossections]
+        return [self._unfiltered]
+
+    def publish(self, readings: typing.Sequence[dict[str, typing.Any]]) -> None:
+        """Push stored readings to the subscribers, of every worker with the postgres bus. Never waits."""
+        if not readings:
+            return
+        live = [compact(reading) for reading in readings]
+        self.published += len(live)
+        if self.bus == "postgres" and self._connection is not None and not self._connection.is_closed():
+            task = asyncio.get_running_loop().create_task(self._notify(live))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.deliver(live)
+
+    def deliver(self, readings: typing.Iterable[dict[str, typing.Any]]) -> None:
+        """Hand readings to the matching subscribers of this worker."""
+        for reading in readings:
+            candidates = (
+                self._unfiltered
+                | self._by_sensor.get(reading["sensor_id"], set())
+                | self._by_crossection.get(reading["crossection"], set())
+            )
+            for subscription in candidates:
+                if subscription.matches(reading):
+                    subscription.offer(reading)
+                    self.delivered += 1
+
+    async def _notify(self, readings: list[dict[str, typing.Any]]) -> None:
+        payloads, chunk, size = [], [], 2
+        for reading in readings:
+            encoded = json.dumps(reading, separators=(",", ":"))
+            if chunk and size + len(encoded) + 1 > NOTIFY_PAYLOAD_SIZE:
+                payloads.append("[" + ",".join(chunk) + "]")
+                chunk, size = [], 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        payloads.append("[" + ",".join(chunk) + "]")
+        try:
+            # A connection runs one statement at a time
+            async with self._notify_lock:
+                for payload in payloads:
+                    await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Failed to notify %s live readings, delivering them locally: %s", len(readings), e)
+            self.deliver(readings)
+
+    def _on_notification(self, connection: typing.Any, pid: int, channel: str, payload: str) -> None:  # noqa: ANN401
+        self.deliver(json.loads(payload))
+
+    async def start(self) -> None:
+        """With the postgres bus, LISTEN on the channel on a connection of this worker, reconnecting when lost."""
+        if self.bus == "postgres" and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        while True:
+            lost = asyncio.Event()
+            try:
+                # A connection outside the pools: it is held for the lifetime of the worker
+                self._connection = await asyncpg.connect(
+                    host=settings.db_host, port=settings.db_port, user=settings.db_user,
+                    password=settings.db_password, database=settings.db_database,
+                )
+                self._connection.add_termination_listener(lambda _: lost.set())
+                await self._connection.add_listener(self.channel, self._on_notification)
+                await lost.wait()
+                logger.warning("Lost the live readings connection, reconnecting")
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Failed to listen for live readings: %s", e)
+            await asyncio.sleep(1)
+
+    async def stop(self) -> None:
+        """End every subscription, and stop listening."""
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "bus": self.bus,
+            "listening": self._connection is not None and not self._connection.is_closed(),
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+live_readings = LiveReadings(
+    bus=settings.live_bus,
+    channel=settings.live_channel,
+    buffer_size=settings.live_buffer_size,
+    flush_interval=settings.live_flush_interval_ms / 1000,
+)
+
+router = fastapi.APIRouter(route_class=TimedRoute)
+
+
+async def live_events(subscription: Subscription) -> typing.AsyncIterator[str]:
+    """Server-sent events of a subscription: a `readings` event per message, and a comment as heartbeat."""
+    try:
+        # Reconnect a second after losing the stream
+        yield "retry: 1000\n\n"
+        while not subscription.closed:
+            message = await subscription.next(settings.live_heartbeat_s)
+            if message is None:
+                # Keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: readings\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+    finally:
+        live_readings.unsubscribe(subscription)
+
+
+@router.get("/readings/live")
+async def stream_live_readings(
+    sensor_ids: list[int] | None = Query(None, alias="sensorId"),
+    crossections: list[str] | None = Query(None, alias="crossection"),
+) -> StreamingResponse:
+    """Readings as they are ingested, as server-sent events (`EventSource`)."""
+    subscription = live_readings.subscribe(sensor_ids, crossections)
+    return StreamingResponse(
+        live_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/readings/live")
+async def live_readings_socket(
+    websocket: fastapi.WebSocket,
+    sensor_ids: list[int] | None = Query(None, alias="sensorId"),
+    crossections: list[str] | None = Query(None, alias="crossection"),
+) -> None:
+    """Readings as they are ingested, one JSON message per batch. Messages of the client are ignored."""
+    await websocket.accept()
+    subscription = live_readings.subscribe(sensor_ids, crossections)
+    disconnected = False
+
+    async def until_disconnected() -> None:
+        nonlocal disconnected
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        disconnected = True
+        subscription.close()
+
+    receiver = asyncio.create_task(until_disconnected())
+    try:
+        while not subscription.closed:
+            message = await subscription.next(settings.live_heartbeat_s)
+            if message is not None:
+                await websocket.send_json(message)
+        if not disconnected:
+            # The subscription was ended by the server, going away
+            await websocket.close(code=1001)
+    finally:
+        receiver.cancel()
+        live_readings.unsubscribe(subscription)
@@ -0,0 +1,98 @@
+"""Service metrics in the Prometheus text exposition format, at GET /metrics.
+
+Nothing here runs on the request path: requests, statements, pools and the ingest buffer only bump
+integers in their own histograms and counters, and this module reads them when Prometheus scrapes.
+Rates (requests/s, ingested rows/s) come from `rate()` over the counters in Prometheus.
+"""
+import fastapi
+from fastapi.responses import PlainTextResponse
+
+from app.apps.dykes.views import readings_flight
+from app.db import base
+from app.db.instrumentation import TimedQueuePool, compile_cache
+from app.db.routes import limiters
+from app.live import live_readings
+from app.middleware import TimedRoute, request_metrics
+from app.repositories.ingest_buffer import ingest_buffer
+from app.utils.metrics import EventLoopLagMonitor, PrometheusWriter
+
+loop_lag = EventLoopLagMonitor()
+
+router = fastapi.APIRouter(route_class=TimedRoute)
+
+
+def render_metrics() -> str:
+    writer = PrometheusWriter()
+
+    writer.family("geodykes_http_request_duration_seconds", "histogram", "Request latency by route")
+    for (method, route), histogram in request_metrics.latency.children.items():
+        writer.histogram("geodykes_http_request_duration_seconds", histogram, {"method": method, "route": route})
+    writer.family("geodykes_http_request_statements", "histogram", "SQL statements executed per request")
+    for (method, route), histogram in request_metrics.statements.children.items():
+        writer.histogram("geodykes_http_request_statements", histogram, {"method": method, "route": route})
+    writer.family("geodykes_http_requests_in_flight", "gauge", "Requests being handled")
+    writer.sample("geodykes_http_requests_in_flight", request_metrics.in_flight)
+
+    writer.family("geodykes_db_pool_size", "gauge", "Connections the pool keeps")
+    for name, engine in base.engines.items():
+        writer.sample("geodykes_db_pool_size", engine.pool.size(), {"pool": name})
+    writer.family("geodykes_db_pool_checked_out", "gauge", "Connections handed out by the pool")
+    for name, engine in base.engines.items():
+        writer.sample("geodykes_db_pool_checked_out", engine.pool.checkedout(), {"pool": name})
+    writer.family("geodykes_db_pool_overflow", "gauge", "Connections opened beyond the pool size")
+    for name, engine in base.engines.items():
+        writer.sample("geodykes_db_pool_overflow", max(engine.pool.overflow(), 0), {"pool": name})
+    timed_pools = {
+        name: engine.pool for name, engine in base.engines.items() if isinstance(engine.pool, TimedQueuePool)
+    }
+    writer.family("geodykes_db_pool_wait_seconds", "histogram", "Time spent waiting for a connection")
+    for name, pool in timed_pools.items():
+        writer.histogram("geodykes_db_pool_wait_seconds", pool.wait_time, {"pool": name})
+    writer.family("geodykes_db_pool_timeouts_total", "counter", "Checkouts that gave up after the pool timeout")
+    for name, pool in timed_pools.items():
+        writer.sample("geodykes_db_pool_timeouts_total", pool.timeouts, {"pool": name})
+
+    writer.family("geodykes_admission_limit", "gauge", "Requests admitted at once, by kind of route")
+    for name, limiter in limiters.items():
+        writer.sample("geodykes_admission_limit", limiter.limit, {"limiter": name})
+    writer.family("geodykes_admission_waiting", "gauge", "Requests waiting for admission")
+    for name, limiter in limiters.items():
+        writer.sample("geodykes_admission_waiting", limiter.waiting, {"limiter": name})
+    writer.family("geodykes_admission_rejected_total", "counter", "Requests shed with a 503")
+    for name, limiter in limiters.items():
+        writer.sample("geodykes_admission_rejected_total", limiter.rejected, {"limiter": name})
+
+    writer.family("geodykes_readings_queries_total", "counter", "Readings requests, by whether they ran the query")
+    writer.sample("geodykes_readings_queries_total", readings_flight.calls, {"outcome": "queried"})
+    writer.sample("geodykes_readings_queries_total", readings_flight.shared, {"outcome": "coalesced"})
+
+    live = live_readings.stats()
+    writer.family("geodykes_live_subscribers", "gauge", "Clients subscribed to live readings")
+    writer.sample("geodykes_live_subscribers", live["subscribers"])
+    writer.family("geodykes_live_readings_total", "counter", "Live readings published, and delivered to subscribers")
+    writer.sample("geodykes_live_readings_total", live["published"], {"outcome": "published"})
+    writer.sample("geodykes_live_readings_total", live["delivered"], {"outcome": "delivered"})
+
+    writer.family("geodykes_sql_compile_cache_total", "counter", "Executed statements by compiled cache outcome")
+    for outcome in ("cache_hit", "cache_miss", "no_cache_key"):
+        writer.sample("geodykes_sql_compile_cache_total", compile_cache.counts[outcome], {"outcome": outcome})
+    writer.family("geodykes_sql_compile_cache_hit_ratio", "gauge", "Share of compiled statements taken from cache")
+    writer.sample("geodykes_sql_compile_cache_hit_ratio", compile_cache.stats()["hit_rate"])
+
+    writer.family("geodykes_ingest_rows_total", "counter", "Readings handled by the ingest buffer, by outcome")
+    for outcome in ("flushed", "rejected", "refused"):
+        writer.sample("geodykes_ingest_rows_total", getattr(ingest_buffer, f"rows_{outcome}"), {"outcome": outcome})
+    writer.family("geodykes_ingest_queue_depth", "gauge", "Readings waiting in the ingest buffer")
+    writer.sample("geodykes_ingest_queue_depth", ingest_buffer.depth)
+    writer.family("geodykes_ingest_flush_seconds", "histogram", "Time to write one batch of the ingest buffer")
+    writer.histogram("geodykes_ingest_flush_seconds", ingest_buffer.flush_latency)
+
+    writer.family("geodykes_event_loop_lag_seconds", "histogram", "How late the event loop runs scheduled callbacks")
+    writer.histogram("geodykes_event_loop_lag_seconds", loop_lag.lag)
+
+    return writer.render()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type=PrometheusWriter.content_type)
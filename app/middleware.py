@@ -0,0 +1,190 @@
+"""Per-request timing: statement count, database time, serialization time and total time.
+
+`RequestTimingMiddleware` keeps a `RequestTimings` in a context variable while the request is handled.
+The database engines add the statements they execute to it (see app/db/instrumentation.py), and routes
+of `TimedRoute` add the time spent serializing the response. The middleware reports the result:
+- in `request_metrics`, exposed at /metrics (see app/metrics.py)
+- with `settings.request_timing_enabled`, in a `Server-Timing` header, which browsers show next to the
+  request in their developer tools, and in a log line with one key=value pair per figure, at WARNING
+  when the request took longer than `settings.slow_request_ms` and at DEBUG otherwise
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+import typing
+
+import fastapi
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.settings import settings
+from app.utils.metrics import Histogram, LabeledHistogram
+from app.utils.timing import RequestTimings, request_timings
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class RequestMetrics:
+    """Latency and statement count of requests by method and route template, and requests in flight.
+
+    Label sets are created on the first request of a route; later requests only look them up.
+    """
+
+    def __init__(self) -> None:
+        self.latency = LabeledHistogram(("method", "route"))
+        self.statements = LabeledHistogram(("method", "route"), STATEMENT_BUCKETS)
+        self.in_flight = 0
+        self._bound: dict[tuple[str, str], tuple[Histogram, Histogram]] = {}
+
+    def observe(self, method: str, route: str, duration: float, statements: int) -> None:
+        bound = self._bound.get((method, route))
+        if bound is None:
+            bound = self._bound[method, route] = (
+                self.latency.labels(method, route), self.statements.labels(method, route),
+            )
+        bound[0].observe(duration)
+        bound[1].observe(statements)
+
+
+request_metrics = RequestMetrics()
+
+
+class RequestTimingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        status = 500
+        report = settings.request_timing_enabled
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if report:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        request_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_metrics.in_flight -= 1
+            request_timings.reset(token)
+            total = time.perf_counter() - timings.started
+            # The router stores the matched route in the scope; the template keeps the label set small
+            route = scope.get("route")
+            request_metrics.observe(
+                scope["method"], getattr(route, "path_format", "unmatched"), total, timings.statements,
+            )
+            level = logging.WARNING if total * 1000 >= settings.slow_request_ms else logging.DEBUG
+            if report and logger.isEnabledFor(level):
+                fields = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "statements": timings.statements,
+                    "db_ms": round(timings.db_time * 1000, 2),
+                    "serialize_ms": round(timings.serialize_time * 1000, 2),
+                    "total_ms": round(total * 1000, 2),
+                }
+                logger.log(
+                    level,
+                    "request %s",
+                    " ".join(f"{key}={value}" for key, value in fields.items()),
+                    extra={"request_timing": fields},
+                )
+
+
+def server_timing(timings: RequestTimings) -> str:
+    """`Server-Timing` header value; `app` is what remains besides the database and serialization."""
+    total = time.perf_counter() - timings.started
+    app_time = max(total - timings.db_time - timings.serialize_time, 0.0)
+    return ", ".join((
+        f'db;dur={timings.db_time * 1000:.2f};desc="{timings.statements} statements"',
+        f"serialize;dur={timings.serialize_time * 1000:.2f}",
+        f"app;dur={app_time * 1000:.2f}",
+        f"total;dur={total * 1000:.2f}",
+    ))
+
+
+class TimedRoute(APIRoute):
+    """Route recording how long it took to turn the value returned by the endpoint into a response."""
+
+    def get_route_handler(self) -> typing.Callable[[fastapi.Request], typing.Awaitable[fastapi.Response]]:
+        # The request handler calls the endpoint through the dependant; the wrapper notes when it returned
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def route_handler(request: fastapi.Request) -> fastapi.Response:
+            response = await handler(request)
+            timings = request_timings.get()
+            if timings is not None and timings.endpoint_returned is not None:
+                timings.serialize_time += time.perf_counter() - timings.endpoint_returned
+                timings.endpoint_returned = None
+            return response
+
+        return route_handler
+
+
+def _endpoint_returned() -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings.endpoint_returned = time.perf_counter()
+
+
+def _timed_endpoint(endpoint: typing.Callable[..., typing.Any]) -> typing.Callable[..., typing.Any]:
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:  # noqa: ANN401
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _endpoint_returned()
+    else:
+        # Sync endpoints run in the threadpool, in a copy of the context that still holds the same timings
+        @functools.wraps(endpoint)
+        def timed_endpoint(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:  # noqa: ANN401
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _endpoint_returned()
+    return timed_endpoint
+
+
+# Set while the worker shuts down, see app/lifespan.py
+draining = threading.Event()
+
+
+class DrainingMiddleware:
+    """Answers new requests with 503 once the worker is shutting down, so clients retry on another worker.
+
+    `Connection: close` makes clients with a kept-alive connection to this worker open a new one.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not draining.is_set():
+            await self.app(scope, receive, send)
+            return
+        response = JSONResponse(
+            status_code=503,
+            content={"detail": "Shutting down, retry later"},
+            headers={"Retry-After": "1", "Connection": "close"},
+        )
+        await response(scope, receive, send)
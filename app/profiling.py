@@ -0,0 +1,235 @@
+"""Sampling profiler for single requests, to profile e.g. `list_readings` on production data.
+
+With `settings.debug` or `settings.profiling_enabled`, `ProfilingMiddleware` profiles the requests sent
+with an `X-Profile: 1` header, and a random `settings.profiling_sample_rate` share of the others. The
+response carries an `X-Profile-Id` header; the profile is kept in memory and downloaded from
+`/api/admin/profiles/{id}` as collapsed stacks (flamegraph.pl, speedscope, ...) or as a speedscope file.
+
+The stack of the event loop thread is sampled every `settings.profiling_interval_ms` (see `Sampler`).
+Only the samples taken while the request's own task runs are attributed to its frames; while the task
+is suspended (awaiting the database, or another task holding the loop) the sample counts as
+`(awaiting)`. Work the request hands to the threadpool (sync endpoints and dependencies) shows up as
+awaiting too.
+"""
+import asyncio
+import collections
+import dataclasses
+import itertools
+import random
+import signal
+import sys
+import threading
+import time
+import types
+import typing
+from datetime import datetime, timezone
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.settings import settings
+
+PROFILE_HEADER = b"x-profile"
+AWAITING = ("(awaiting)", "", 0)
+
+# (function name, file name, first line) of a frame, root first
+Stack = tuple[tuple[str, str, int], ...]
+
+
+@dataclasses.dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    started_at: str
+    interval: float
+    duration: float = 0.0
+    status: int | None = None
+    samples: collections.Counter[Stack] = dataclasses.field(default_factory=collections.Counter)
+
+    def summary(self) -> dict[str, typing.Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one `root;...;leaf count` line per distinct stack."""
+        return "".join(
+            ";".join(_frame_label(frame) for frame in stack) + f" {count}\n"
+            for stack, count in self.samples.most_common()
+        )
+
+    def speedscope(self) -> dict[str, typing.Any]:
+        """Sampled profile in the speedscope file format, https://www.speedscope.app/file-format-schema.json"""
+        frames: dict[tuple[str, str, int], int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval * 1000)
+        name = f"{self.method} {self.path}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": settings.service_name,
+            "shared": {
+                "frames": [
+                    {"name": function, "file": file, "line": line} if file else {"name": function}
+                    for function, file, line in frames
+                ],
+            },
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+def _frame_label(frame: tuple[str, str, int]) -> str:
+    function, file, line = frame
+    return f"{function} ({file}:{line})" if file else function
+
+
+def _stack(frame: types.FrameType | None) -> Stack:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class Sampler:
+    """Samples the stack of the event loop thread while requests are being profiled.
+
+    On the main thread a SIGALRM interval timer interrupts the loop, and the handler is given the exact
+    frame it interrupted. Otherwise (signals only reach the main thread) a background thread reads the
+    loop thread's frame; that thread only gets the GIL when the loop releases it, so it over-samples code
+    that releases the GIL (socket writes, ...) and is a fallback.
+    """
+
+    def __init__(self) -> None:
+        self._profiles: dict[asyncio.Task[typing.Any], Profile] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def add(self, profile: Profile) -> None:
+        """Profile the current task, until `remove` is called."""
+        task = asyncio.current_task()
+        assert task is not None
+        self._profiles[task] = profile
+        if len(self._profiles) == 1:
+            self._loop = asyncio.get_running_loop()
+            self._start(profile.interval)
+
+    def remove(self) -> None:
+        self._profiles.pop(asyncio.current_task(), None)  # type: ignore[arg-type]
+        if not self._profiles:
+            self._stop()
+
+    def _start(self, interval: float) -> None:
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGALRM, self._on_signal)
+            signal.setitimer(signal.ITIMER_REAL, interval, interval)
+        else:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(threading.get_ident(), interval), name="profiler", daemon=True,
+            )
+            self._thread.start()
+
+    def _stop(self) -> None:
+        if self._thread is None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        else:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _on_signal(self, signum: int, frame: types.FrameType | None) -> None:
+        self._sample(frame)
+
+    def _run(self, thread_id: int, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self._sample(sys._current_frames().get(thread_id))  # noqa: SLF001
+
+    def _sample(self, frame: types.FrameType | None) -> None:
+        current = asyncio.current_task(self._loop)
+        stack = None
+        for task, profile in list(self._profiles.items()):
+            if task is current:
+                stack = stack or _stack(frame)
+                profile.samples[stack] += 1
+            else:
+                profile.samples[(AWAITING,)] += 1
+
+
+sampler = Sampler()
+
+
+class ProfileStore:
+    """The most recent profiles, by id."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._profiles: collections.OrderedDict[int, Profile] = collections.OrderedDict()
+        self._ids = itertools.count(1)
+
+    def create(self, method: str, path: str, interval: float) -> Profile:
+        profile = Profile(next(self._ids), method, path, datetime.now(timezone.utc).isoformat(), interval)
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.size:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def get(self, profile_id: int) -> Profile | None:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[Profile]:
+        return list(reversed(self._profiles.values()))
+
+
+profiles = ProfileStore(settings.profiling_store_size)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiles.create(scope["method"], scope["path"], settings.profiling_interval_ms / 1000)
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.remove()
+            profile.duration = time.perf_counter() - started
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        if any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"]):
+            return True
+        return random.random() < settings.profiling_sample_rate  # noqa: S311
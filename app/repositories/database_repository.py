@@ -1,9 +1,12 @@
 from datetime import datetime
+from sqlalchemy import insert, lambda_stmt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload, joinedload
-from typing import List, Type, TypeVar, Optional, Dict
+from typing import List, Type, TypeVar, Optional, Dict, Sequence, Union
 import app.apps.dykes.models as models
+from app.db.deps import get_db
+from app.db.utils import any_of
 from app.repositories.repository_interface import ReadingRepository
 
 # Define a generic type variable 'T'
@@ -19,7 +22,8 @@ class DatabaseReadingRepository(ReadingRepository):
     and performing asyncsynchronous retrieval of readings.
 
     Attributes:
-        db (AsyncSession): The asynchronous database session used for querying the database.
+        db (AsyncSession): The asynchronous database session used for querying the database. Without a
+            session given, the one of the request is used, created on the first query (see app.db.deps).
 
     Methods:
         convert_to_dict: Converts a reading object to a dictionary format.
@@ -27,8 +31,12 @@ class DatabaseReadingRepository(ReadingRepository):
         sync_get_readings: Retrieves all readings from the database synchronously.
     """
 
-    def __init__(self, db: AsyncSession):
-        self.db = db
+    def __init__(self, db: Optional[AsyncSession] = None):
+        self._db = db
+
+    @property
+    def db(self) -> AsyncSession:
+        return self._db if self._db is not None else get_db()
 
     async def fetch_related_model(self, model: Type[T], model_id: int) -> Optional[T]:
         """
@@ -82,7 +90,9 @@ class DatabaseReadingRepository(ReadingRepository):
                                 end_date: Optional[datetime] = None,
                                 sensor_ids: Optional[List[int]] = None,
                                 sensor_names: Optional[List[str]] = None) -> List[dict]:
-        query = select(models.Reading).options(
+        # A lambda statement is only built on the first call: later calls reuse the cached construct and its
+        # compiled SQL, and only extract the bound values from the closures below.
+        query = lambda_stmt(lambda: select(models.Reading).options(
             # WHY SELECTINLOAD?
             # Queries using SQLAlchemy are constructed different depending on the load strategy used.
             # For example, selectinload or joinedload.
@@ -96,20 +106,23 @@ class DatabaseReadingRepository(ReadingRepository):
             # However in a context of larger datasets selectinload can be a better option
             joinedload(models.Reading.sensor).joinedload(models.Sensor.sensor_type),
             selectinload(models.Reading.unit)
-        )
+        ))
 
         if start_date and end_date:
-            query = query.filter(models.Reading.time.between(start_date, end_date))
+            query += lambda q: q.filter(models.Reading.time.between(start_date, end_date))
         elif start_date:
-            query = query.filter(models.Reading.time >= start_date)
+            query += lambda q: q.filter(models.Reading.time >= start_date)
         elif end_date:
-            query = query.filter(models.Reading.time <= end_date)
+            query += lambda q: q.filter(models.Reading.time <= end_date)
+        # Arrays instead of IN lists keep the SQL the same for any number of sensors
         if sensor_ids:
-            query = query.where(models.Reading.sensor_id.in_(sensor_ids))
+            sensor_id_in = any_of(models.Reading.sensor_id, sensor_ids)
+            query += lambda q: q.where(sensor_id_in)
         elif sensor_names:
             # Remove any leading or trailing whitespace or quotes to avoid issues with the query
             sensor_names = [sensor_name.strip().strip('"') for sensor_name in sensor_names]
-            query = query.join(models.Sensor).where(models.Sensor.name.in_(sensor_names))
+            sensor_name_in = any_of(models.Sensor.name, sensor_names)
+            query += lambda q: q.join(models.Sensor).where(sensor_name_in)
 
         result = await self.db.execute(query)
         objects = result.scalars().all()
@@ -189,3 +202,114 @@ class DatabaseReadingRepository(ReadingRepository):
         
         # return reading as a dictionary to be validated 
         return await self.convert_to_dict(reading)
+
+    async def create_readings(self, payloads: Sequence) -> List[Union[dict, Exception]]:
+        """
+        Create a batch of readings with a fixed number of round trips, whatever the batch size.
+
+        Crossections and sensors are resolved with one set-based lookup each, and the locations and
+        readings are written with multi-row INSERT ... RETURNING statements inside a single transaction.
+
+        Args:
+            payloads (Sequence[ReadingCreate]): The readings to create.
+
+        Returns:
+            List[Union[dict, Exception]]: One entry per payload, in order. Either the created reading in the
+            same shape as `create_reading` returns, or the ValueError explaining why it was rejected.
+        """
+        crossection_names = {payload.crossection for payload in payloads}
+        sensor_names = {payload.sensor_name for payload in payloads}
+
+        crossection_result = await self.db.execute(
+            select(models.Crossection.name, models.Crossection.id)
+            .where(any_of(models.Crossection.name, crossection_names))
+        )
+        crossections = dict(crossection_result.all())
+
+        # A sensor type can measure several units; like `create_reading` we take the first one as the default.
+        sensor_result = await self.db.execute(
+            select(
+                models.Sensor.name,
+                models.Sensor.id,
+                models.Sensor.is_active,
+                models.SensorType.id.label("sensor_type_id"),
+                models.SensorType.name.label("sensor_type"),
+                models.UnitOfMeasure.id.label("unit_id"),
+                models.UnitOfMeasure.unit,
+            )
+            .join(models.Sensor.sensor_type)
+            .join(models.SensorType.units_of_measure)
+            .where(any_of(models.Sensor.name, sensor_names))
+            .order_by(models.Sensor.id, models.UnitOfMeasure.id)
+            .distinct(models.Sensor.id)
+        )
+        sensors = {row.name: row for row in sensor_result.all()}
+
+        results: List[Union[dict, Exception]] = []
+        accepted = []
+        for payload in payloads:
+            if payload.crossection not in crossections:
+                results.append(ValueError("Crossection not found"))
+            elif payload.sensor_name not in sensors:
+                results.append(ValueError("Sensor not found"))
+            elif len(payload.location_in_topology) != 2:
+                results.append(ValueError("Coordinates must be a list of two values"))
+            else:
+                results.append(None)
+                accepted.append(payload)
+
+        if accepted:
+            location_result = await self.db.execute(
+                insert(models.LocationInTopology)
+                .returning(models.LocationInTopology.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "coordinates": payload.location_in_topology,
+                        "crossection_id": crossections[payload.crossection],
+                    }
+                    for payload in accepted
+                ],
+            )
+            location_ids = location_result.scalars().all()
+
+            reading_result = await self.db.execute(
+                # The value is returned as stored, reading.value is an integer column
+                insert(models.Reading).returning(
+                    models.Reading.id, models.Reading.value, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "crossection_id": crossections[payload.crossection],
+                        "location_in_topology_id": location_id,
+                        "unit_id": sensors[payload.sensor_name].unit_id,
+                        "sensor_type_id": sensors[payload.sensor_name].sensor_type_id,
+                        "sensor_id": sensors[payload.sensor_name].id,
+                        "value": payload.value,
+                        "time": payload.time,
+                    }
+                    for payload, location_id in zip(accepted, location_ids)
+                ],
+            )
+            stored_readings = reading_result.all()
+            await self.db.commit()
+
+            created = iter(zip(accepted, stored_readings))
+            for index, result in enumerate(results):
+                if result is not None:
+                    continue
+                payload, stored = next(created)
+                sensor = sensors[payload.sensor_name]
+                results[index] = {
+                    "id": stored.id,
+                    "crossection": payload.crossection,
+                    "sensor_id": sensor.id,
+                    "sensor_name": sensor.name,
+                    "sensor_type": sensor.sensor_type,
+                    "sensor_is_active": sensor.is_active,
+                    "location_in_topology": payload.location_in_topology,
+                    "unit": sensor.unit,
+                    "value": stored.value,
+                    "time": payload.time.isoformat(),
+                }
+
+        return results
@@ -0,0 +1,181 @@
+"""
+Write-behind buffer for single-reading POSTs.
+
+Field gateways post one reading at a time at a high rate. Committing each of them in its own transaction
+makes the database the bottleneck, so instead the readings are queued here and a background flusher
+writes them in batches through `DatabaseReadingRepository.create_readings`. A batch is flushed as soon as
+either `batch_size` readings are queued or `flush_interval` seconds passed since the first one arrived.
+
+Callers can wait for the batch holding their reading to be committed (and get the created reading back),
+or return right after enqueueing. When the queue is full `IngestBufferFullError` is raised so the view can
+answer with 429 and let the gateway retry later.
+"""
+import asyncio
+import logging
+import time
+import typing
+
+from sqlalchemy.ext import asyncio as sa_async
+
+from app.db import base
+from app.live import live_readings
+from app.repositories.database_repository import DatabaseReadingRepository
+from app.settings import settings
+from app.utils.metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBufferFullError(Exception):
+    def __init__(self, retry_after: float) -> None:
+        self.retry_after = retry_after
+
+
+class ReadingIngestBuffer:
+    def __init__(
+        self,
+        session_factory: typing.Callable[[], sa_async.AsyncSession],
+        batch_size: int,
+        flush_interval: float,
+        max_size: int,
+        repository_class: type[DatabaseReadingRepository] = DatabaseReadingRepository,
+    ) -> None:
+        self.session_factory = session_factory
+        self.repository_class = repository_class
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._queue: asyncio.Queue[tuple[typing.Any, asyncio.Future[dict] | None]] = asyncio.Queue(max_size)
+        self._task: asyncio.Task[None] | None = None
+        # The batch being collected by the flusher, and the flush in progress, so `stop` can finish both
+        self._batch: list[tuple[typing.Any, asyncio.Future[dict] | None]] = []
+        self._flushing: asyncio.Future[None] | None = None
+
+        self.flush_latency = Histogram()
+        self.batch_sizes = Histogram(buckets=(1, 10, 50, 100, 250, 500, 1000, 5000))
+        self.rows_flushed = 0
+        self.rows_rejected = 0
+        self.rows_refused = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """Start the background flusher, unless it is already running."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher after writing whatever is still queued."""
+        if self._task is not None:
+            # Flushes are shielded, so this only interrupts the flusher while it waits for readings
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+        batch, self._batch = self._batch, []
+        while batch or not self._queue.empty():
+            await self._flush(self._drain(batch))
+            batch = []
+
+    async def submit(self, payload: typing.Any, wait: bool = True) -> dict | None:  # noqa: ANN401
+        """Queue a reading for the next batch.
+
+        With `wait` the call returns the created reading once its batch is committed, and raises the
+        ValueError the repository produced if the reading was rejected.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future() if wait else None
+        try:
+            self._queue.put_nowait((payload, future))
+        except asyncio.QueueFull:
+            self.rows_refused += 1
+            raise IngestBufferFullError(retry_after=self.flush_interval) from None
+        if future is None:
+            return None
+        # Shield the future: a client disconnecting must not cancel a row that is already queued.
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "queue_depth": self.depth,
+            "queue_capacity": self.max_size,
+            "rows_flushed": self.rows_flushed,
+            "rows_rejected": self.rows_rejected,
+            "rows_refused": self.rows_refused,
+            "batch_size": self.batch_sizes.snapshot(),
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+    def _drain(self, batch: list) -> list:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self._drain(self._batch)) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _create(self, payloads: list) -> list:
+        """Write the readings, retrying a failing batch in halves so one bad reading only rejects itself."""
+        try:
+            async with self.session_factory() as db:
+                return await self.repository_class(db).create_readings(payloads)
+        except Exception as e:  # noqa: BLE001
+            if len(payloads) == 1:
+                logger.warning("Failed to write buffered reading: %s", e)
+                return [e]
+            logger.warning("Failed to write %s buffered readings, retrying in halves: %s", len(payloads), e)
+            middle = len(payloads) // 2
+            return await self._create(payloads[:middle]) + await self._create(payloads[middle:])
+
+    async def _flush(self, batch: list) -> None:
+        started = time.perf_counter()
+        results = await self._create([payload for payload, _ in batch])
+        self.flush_latency.observe(time.perf_counter() - started)
+        self.batch_sizes.observe(len(batch))
+        live_readings.publish([result for result in results if not isinstance(result, Exception)])
+
+        for (_, future), result in zip(batch, results, strict=True):
+            if isinstance(result, Exception):
+                self.rows_rejected += 1
+                if future is not None and not future.done():
+                    future.set_exception(result)
+            else:
+                self.rows_flushed += 1
+                if future is not None and not future.done():
+                    future.set_result(result)
+
+
+ingest_buffer = ReadingIngestBuffer(
+    # Batches are written over the ingest pool, so bursts of posts cannot starve the interactive requests.
+    # The pool is looked up per flush, as the engines are only created on first use.
+    lambda: base.sessionmakers["ingest"](),
+    batch_size=settings.ingest_batch_size,
+    flush_interval=settings.ingest_flush_interval_ms / 1000,
+    max_size=settings.ingest_queue_size,
+)
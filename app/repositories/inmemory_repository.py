@@ -1,10 +1,273 @@
-from typing import List
-from app.apps.dykes.models import Reading
+"""
+Columnar in-memory store of readings, answering `get_readings` without a database.
+
+Readings are kept per sensor in contiguous NumPy arrays (time, value, id, and the codes of their
+crossection, unit and location), sorted by time, so that:
+- a time range of a sensor is two binary searches (`np.searchsorted`) and a slice, which copies nothing
+- readings of several sensors are the concatenation of their slices, ordered by time with one stable sort
+- repeated strings (crossections, units, coordinates) are stored once, in a `Dictionary`, and referred to by
+  an integer code per reading
+
+Appends go to the end of over-allocated arrays; a sensor receiving a reading older than its last one is
+sorted again on its next query. The store serves tests without a database, and can be loaded from another
+repository to serve a hot window of readings from memory (`InMemoryReadingRepository.load`). It lives in
+the memory of one process: readings created here are not written anywhere else.
+"""
+from datetime import datetime
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
 from .repository_interface import ReadingRepository
 
+INITIAL_CAPACITY = 64
+
+
+class Dictionary:
+    """Dictionary encoding of a dimension: every distinct value gets an integer code."""
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+        self._codes: Dict[Hashable, int] = {}
+        self._decoder: Optional[np.ndarray] = None
+
+    def encode(self, value: Any) -> int:
+        key = tuple(value) if isinstance(value, list) else value
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+            self._decoder = None
+        return code
+
+    def code(self, value: Any) -> Optional[int]:
+        return self._codes.get(tuple(value) if isinstance(value, list) else value)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        # An object array of the values, so a whole column is decoded with one fancy indexing
+        if self._decoder is None:
+            self._decoder = np.empty(len(self.values), dtype=object)
+            # One by one: a slice assignment would unpack values that are lists (coordinates)
+            for code, value in enumerate(self.values):
+                self._decoder[code] = value
+        return self._decoder[codes]
+
+
+class SensorSeries:
+    """The readings of one sensor, column by column, sorted by time once `sort` ran."""
+
+    COLUMNS = {
+        "time": "datetime64[us]",
+        "value": "float64",
+        "id": "int64",
+        "crossection": "int32",
+        "unit": "int32",
+        "location": "int32",
+    }
+
+    def __init__(self, sensor_id: int, name: str, sensor_type: str, is_active: bool) -> None:
+        self.sensor_id = sensor_id
+        self.name = name
+        self.sensor_type = sensor_type
+        self.is_active = is_active
+        self.unit: Optional[str] = None
+        self.size = 0
+        self.sorted = True
+        self._columns = {name: np.empty(INITIAL_CAPACITY, dtype=dtype) for name, dtype in self.COLUMNS.items()}
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.size]
+
+    def append(self, time: np.datetime64, value: float, reading_id: int, crossection: int, unit: int,
+               location: int) -> None:
+        if self.size == len(self._columns["time"]):
+            # Doubling keeps appends amortized constant time
+            for name, column in self._columns.items():
+                grown = np.empty(len(column) * 2, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self._columns[name] = grown
+        if self.size and time < self._columns["time"][self.size - 1]:
+            self.sorted = False
+        for name, item in zip(self.COLUMNS, (time, value, reading_id, crossection, unit, location)):
+            self._columns[name][self.size] = item
+        self.size += 1
+
+    def sort(self) -> None:
+        if not self.sorted:
+            # Stable, so readings with the same time keep the order they were added in
+            order = np.argsort(self.column("time"), kind="stable")
+            for name in self.COLUMNS:
+                self._columns[name][:self.size] = self.column(name)[order]
+            self.sorted = True
+
+    def between(self, start: Optional[np.datetime64], end: Optional[np.datetime64]) -> slice:
+        self.sort()
+        times = self.column("time")
+        first = np.searchsorted(times, start, side="left") if start is not None else 0
+        last = np.searchsorted(times, end, side="right") if end is not None else self.size
+        return slice(int(first), int(last))
+
+
+def to_datetime64(value: Union[datetime, str, None]) -> Optional[np.datetime64]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # reading.time has no time zone, like the database repositories the zone of a filter is ignored
+    return np.datetime64(value.replace(tzinfo=None), "us")
+
+
 class InMemoryReadingRepository(ReadingRepository):
-    def __init__(self, data: List[Reading]):
-        self.data = data
+    """
+    A repository keeping readings in memory, in the same shape as `DatabaseReadingRepository` returns them.
+
+    Args:
+        data (Iterable[dict]): Readings to start with, as returned by `get_readings` of any repository.
+    """
+
+    def __init__(self, data: Iterable[dict] = ()):
+        self.crossections = Dictionary()
+        self.units = Dictionary()
+        self.locations = Dictionary()
+        self.sensors: Dict[int, SensorSeries] = {}
+        self._sensor_ids_by_name: Dict[str, int] = {}
+        self._next_id = 1
+        for reading in data:
+            self.add(reading)
+
+    @classmethod
+    async def load(cls, repository: ReadingRepository, **filters: Any) -> "InMemoryReadingRepository":
+        """Copy the readings `repository.get_readings(**filters)` returns, e.g. the last days of readings."""
+        return cls(await repository.get_readings(**filters))
+
+    def __len__(self) -> int:
+        return sum(series.size for series in self.sensors.values())
+
+    def add_sensor(self, sensor_id: int, name: str, sensor_type: str, is_active: bool = True,
+                   unit: Optional[str] = None) -> SensorSeries:
+        """Register a sensor, so readings can be created for it (and `unit` is the unit of those readings)."""
+        series = self.sensors.get(sensor_id)
+        if series is None:
+            series = self.sensors[sensor_id] = SensorSeries(sensor_id, name, sensor_type, is_active)
+            self._sensor_ids_by_name[name] = sensor_id
+        if unit is not None:
+            series.unit = unit
+        return series
+
+    def add_crossection(self, name: str) -> None:
+        self.crossections.encode(name)
+
+    def add(self, reading: dict) -> dict:
+        """Store a reading in the shape `get_readings` returns; its id is kept, or assigned when missing."""
+        series = self.add_sensor(reading["sensor_id"], reading["sensor_name"], reading["sensor_type"],
+                                 reading["sensor_is_active"])
+        if series.unit is None:
+            series.unit = reading["unit"]
+        reading_id = reading.get("id")
+        if reading_id is None:
+            reading_id = self._next_id
+        self._next_id = max(self._next_id, reading_id + 1)
+        location = reading.get("location_in_topology")
+        series.append(
+            to_datetime64(reading["time"]),
+            reading["value"],
+            reading_id,
+            self.crossections.encode(reading["crossection"]),
+            self.units.encode(reading["unit"]),
+            self.locations.encode(location) if location is not None else -1,
+        )
+        return {**reading, "id": reading_id}
+
+    async def get_readings(self, start_date: Optional[datetime] = None,
+                           end_date: Optional[datetime] = None,
+                           sensor_ids: Optional[List[int]] = None,
+                           sensor_names: Optional[List[str]] = None) -> List[dict]:
+        # Like the database repositories: sensor ids take precedence over sensor names
+        if sensor_ids:
+            selected = [self.sensors[sensor_id] for sensor_id in dict.fromkeys(sensor_ids) if sensor_id in self.sensors]
+        elif sensor_names:
+            names = dict.fromkeys(sensor_name.strip().strip('"') for sensor_name in sensor_names)
+            selected = [self.sensors[self._sensor_ids_by_name[name]] for name in names
+                        if name in self._sensor_ids_by_name]
+        else:
+            selected = list(self.sensors.values())
+
+        start, end = to_datetime64(start_date), to_datetime64(end_date)
+        parts = [(series, series.between(start, end)) for series in selected]
+        parts = [(series, rows) for series, rows in parts if rows.stop > rows.start]
+        if not parts:
+            return []
+
+        def gather(column: str) -> np.ndarray:
+            return np.concatenate([series.column(column)[rows] for series, rows in parts])
+
+        # Which sensor every row belongs to, as an index into `parts`
+        owners = np.repeat(np.arange(len(parts)), [rows.stop - rows.start for _, rows in parts])
+        times = gather("time")
+        order = np.argsort(times, kind="stable") if len(parts) > 1 else slice(None)
+
+        locations = gather("location")[order]
+        if self.locations.values:
+            decoded_locations = np.where(locations >= 0, self.locations.decode(np.maximum(locations, 0)), None)
+        else:
+            decoded_locations = np.full(len(locations), None, dtype=object)
+        sensors = [series for series, _ in parts]
+        return [
+            {
+                "id": reading_id,
+                "crossection": crossection,
+                "sensor_id": sensors[owner].sensor_id,
+                "sensor_name": sensors[owner].name,
+                "sensor_type": sensors[owner].sensor_type,
+                "sensor_is_active": sensors[owner].is_active,
+                "location_in_topology": list(location) if location is not None else None,
+                "unit": unit,
+                "value": value,
+                "time": time,
+            }
+            for reading_id, crossection, owner, location, unit, value, time in zip(
+                gather("id")[order].tolist(),
+                self.crossections.decode(gather("crossection")[order]).tolist(),
+                owners[order].tolist(),
+                decoded_locations.tolist(),
+                self.units.decode(gather("unit")[order]).tolist(),
+                gather("value")[order].tolist(),
+                [time.isoformat() for time in times[order].tolist()],
+            )
+        ]
+
+    async def create_reading(self, payload) -> dict:
+        return self._create(payload)
+
+    async def create_readings(self, payloads: Sequence) -> List[Union[dict, Exception]]:
+        """Create a batch of readings, with the same results as `DatabaseReadingRepository.create_readings`."""
+        results: List[Union[dict, Exception]] = []
+        for payload in payloads:
+            try:
+                results.append(self._create(payload))
+            except ValueError as e:
+                results.append(e)
+        return results
 
-    async def get_readings(self) -> List[Reading]:
-        return self.data
+    def _create(self, payload) -> dict:
+        # The same checks as the database repository: crossections and sensors must be known
+        if self.crossections.code(payload.crossection) is None:
+            raise ValueError("Crossection not found")
+        sensor_id = self._sensor_ids_by_name.get(payload.sensor_name)
+        if sensor_id is None:
+            raise ValueError("Sensor not found")
+        if len(payload.location_in_topology) != 2:
+            raise ValueError("Coordinates must be a list of two values")
+        series = self.sensors[sensor_id]
+        time = payload.time.replace(tzinfo=None)
+        return self.add({
+            "crossection": payload.crossection,
+            "sensor_id": sensor_id,
+            "sensor_name": series.name,
+            "sensor_type": series.sensor_type,
+            "sensor_is_active": series.is_active,
+            "location_in_topology": list(payload.location_in_topology),
+            "unit": series.unit,
+            "value": payload.value,
+            "time": time.isoformat(),
+        })
@@ -18,14 +18,18 @@ having to worry about the database implementation.
 """
 
 from abc import ABC, abstractmethod
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from app.apps.dykes.models import Reading
 
 
 class ReadingRepository(ABC):
     @abstractmethod
-    async def get_readings(self) -> List[Reading]:
+    async def get_readings(self, start_date: Optional[datetime] = None,
+                           end_date: Optional[datetime] = None,
+                           sensor_ids: Optional[List[int]] = None,
+                           sensor_names: Optional[List[str]] = None) -> List[dict]:
         pass
 
     @abstractmethod
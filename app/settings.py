@@ -1,5 +1,8 @@
 import os
+import tempfile
+import typing
 import pydantic_settings
+from granian.constants import ThreadModes
 from granian.log import LogLevels
 from sqlalchemy.engine.url import URL
 
@@ -19,11 +22,99 @@ class Settings(pydantic_settings.BaseSettings):
     db_password: str = os.getenv("DB_PASS", "password")
     db_database: str = os.getenv("DB_NAME", "postgres")
 
+    # Connection pools per workload, so one long export cannot starve the interactive requests.
+    # The interactive pool serves the API, the ingest pool the ingest buffer, the export pool exports.
     db_pool_size: int = 5
     db_max_overflow: int = 0
+    db_pool_timeout: float = 30.0
+    db_ingest_pool_size: int = 2
+    db_ingest_pool_timeout: float = 10.0
+    db_export_pool_size: int = 2
+    db_export_pool_timeout: float = 60.0
     db_echo: bool = False
 
+    # Optional read replica for GET routes, with the same credentials and database as the primary.
+    # Pointing it at the primary under a second host name (e.g. localhost vs 127.0.0.1) works for testing.
+    db_read_host: str | None = os.getenv("DB_READ_HOST")
+    db_read_port: int | None = os.getenv("DB_READ_PORT")
+    db_read_pool_size: int = 5
+
+    # Repository behind the readings API: "orm", or "asyncpg" for the raw asyncpg fast path of the
+    # readings query, see app/repositories/asyncpg_repository.py
+    reading_repository: typing.Literal["orm", "asyncpg"] = "orm"
+
+    # Write-behind buffer for POST /api/readings/, see app/repositories/ingest_buffer.py
+    ingest_buffer_enabled: bool = False
+    ingest_batch_size: int = 500
+    ingest_flush_interval_ms: int = 50
+    ingest_queue_size: int = 10_000
+    ingest_wait_for_flush: bool = True
+
+    # Statement count and database, serialization and total time of every request, reported in a
+    # Server-Timing header and a log line (at WARNING for requests slower than slow_request_ms)
+    request_timing_enabled: bool = True
+    slow_request_ms: float = 500.0
+
+    # Statements slower than slow_query_ms, kept in a ring buffer shown at /api/admin/slow-queries/. A sample
+    # of slow SELECTs is re-run with EXPLAIN ANALYZE, at most one per slow_query_explain_interval_s.
+    slow_query_log_enabled: bool = False
+    slow_query_ms: float = 200.0
+    slow_query_log_size: int = 100
+    slow_query_explain_sample_rate: float = 0.1
+    slow_query_explain_interval_s: float = 60.0
+
+    # Sampling profiler for single requests, only with debug or profiling_enabled, see app/profiling.py
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0
+    profiling_interval_ms: float = 1.0
+    profiling_store_size: int = 20
+
     app_port: int = 8000
+    # Concurrent identical readings queries share one query and one serialized response
+    readings_coalescing_enabled: bool = True
+
+    # Export jobs (POST /api/exports/) run in the background, at most `export_workers` at once over the export
+    # pool, and write their files to `export_directory`, where they are kept for `export_retention_s`.
+    # Workers of one host share the directory, so any of them can report a job and serve its file.
+    export_workers: int = 2
+    export_queue_size: int = 20
+    export_batch_size: int = 5000
+    export_directory: str = os.path.join(tempfile.gettempdir(), "geodykes-exports")
+    export_retention_s: float = 24 * 3600
+
+    # Live readings at /api/readings/live (see app/live.py). The "memory" bus only reaches the subscribers of the
+    # worker that stored a reading; with more than one worker use the "postgres" bus (LISTEN/NOTIFY on
+    # `live_channel`), so every worker sees the readings of all of them.
+    live_bus: typing.Literal["memory", "postgres"] = "memory"
+    live_channel: str = "geodykes_readings"
+    live_buffer_size: int = 1000
+    live_flush_interval_ms: int = 250
+    live_heartbeat_s: float = 15.0
+
+    # Adaptive concurrency limits of the database routes, one for reads (GET) and one for writes, see
+    # app/utils/admission.py. Requests beyond the limit queue, and beyond the queue get a 503.
+    admission_enabled: bool = True
+    admission_initial_limit: int = 10
+    admission_min_limit: int = 2
+    admission_max_limit: int = 100
+    admission_queue_size: int = 50
+    admission_queue_timeout_s: float = 2.0
+    admission_latency_tolerance: float = 2.0
+
+    # Warm up pools and statement caches before serving, and wait this long for requests in flight on
+    # shutdown, see app/lifespan.py
+    warmup_enabled: bool = True
+    shutdown_drain_timeout_s: float = 30.0
+
+    # Granian server, see app/__main__.py. Every worker is a process with its own event loop, engines and
+    # pools, so the database sees up to server_workers times the connections of all pools together.
+    server_workers: int = 1
+    server_threads: int = 1  # Runtime threads per worker
+    server_blocking_threads: int = 1
+    server_threading_mode: ThreadModes = ThreadModes.workers
+    server_backlog: int = 1024
+    # Requests a worker accepts at once before the others wait in the backlog; needs Granian 1.3 or later
+    server_backpressure: int | None = None
 
     @property
     def db_dsn(self) -> URL:
@@ -36,5 +127,11 @@ class Settings(pydantic_settings.BaseSettings):
             self.db_database,
         )
 
+    @property
+    def db_read_dsn(self) -> URL | None:
+        if not self.db_read_host:
+            return None
+        return self.db_dsn.set(host=self.db_read_host, port=self.db_read_port or self.db_port)
+
 
 settings = Settings()
@@ -0,0 +1,137 @@
+"""
+Adaptive concurrency limiting, so the database degrades gracefully under bursts instead of collapsing.
+
+Every limiter admits up to `limit` requests at once; further requests wait in a bounded FIFO queue for at
+most `queue_timeout` seconds. Requests that find the queue full, or time out in it, are shed with
+`AdmissionRejectedError` (a 503 with Retry-After, see app/exceptions.py), which is cheaper for everybody
+than a pool checkout timing out after 30 seconds.
+
+The limit follows the latency of the database (AIMD): the mean statement time of every finished request
+is compared with a baseline, the lowest recent latency. Above `tolerance` times the baseline the database
+is queueing, and the limit is cut by `backoff`. Otherwise, when the limit was actually used, it grows by
+one per `limit` requests. A request that gave up on the connection pool also cuts the limit.
+"""
+import asyncio
+import collections
+import contextlib
+import math
+import typing
+
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, limiter: str, retry_after: float) -> None:
+        super().__init__(f"{limiter} requests are over capacity")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        queue_size: int,
+        queue_timeout: float,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+    ) -> None:
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.baseline: float | None = None
+        self._waiters: collections.deque[asyncio.Future[None]] = collections.deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> typing.AsyncIterator[None]:
+        await self._admit()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+    async def _admit(self) -> None:
+        if self.in_flight < math.floor(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejectedError(self.name, self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.cancel()
+                self.rejected += 1
+                raise AdmissionRejectedError(self.name, self.queue_timeout) from None
+            # Admitted just as the wait timed out: the slot is ours
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over to a request that went away: pass it on
+                self.in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        self.admitted += 1
+
+    def _wake(self) -> None:
+        # Slots are handed over to waiters in order; `in_flight` counts them from the moment they are handed
+        while self._waiters and self.in_flight < math.floor(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def observe(self, latency: float | None, dropped: bool = False) -> None:
+        """Adjust the limit to the mean statement time of a request finishing, or to a pool timeout.
+
+        Called by the request itself, before it leaves `acquire`.
+        """
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            return
+        if latency is None:
+            return
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Let the baseline follow slowly when the database gets slower for good (a larger table, ...)
+            self.baseline += (latency - self.baseline) * 0.01
+        if latency > self.baseline * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self.in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "baseline_ms": round(self.baseline * 1000, 3) if self.baseline is not None else None,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
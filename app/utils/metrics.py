@@ -0,0 +1,133 @@
+import asyncio
+import bisect
+import contextlib
+import time
+import typing
+
+
+# Latency buckets in seconds, from sub-millisecond statements up to multi-second exports.
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram.
+
+    Observations only bump integers in a pre-allocated list, so recording from the event loop
+    needs no locking and allocates nothing.
+    """
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict[str, typing.Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip((*self.buckets, float("inf")), self.counts, strict=True):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": buckets,
+        }
+
+
+class LabeledHistogram:
+    """Histograms by label values, e.g. request latency by method and route.
+
+    `labels(...)` returns the histogram bound to those values, created on first use; callers on the hot
+    path keep it, or look it up again with a single dictionary lookup.
+    """
+
+    def __init__(
+        self, label_names: typing.Sequence[str], buckets: typing.Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.children: dict[tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(self.buckets)
+        return child
+
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes up a task sleeping for `interval` seconds.
+
+    A loop busy with blocking work (CPU-bound serialization, sync I/O) delays every request it serves;
+    the lag is the time those requests waited on top of their own work.
+    """
+
+    def __init__(self, interval: float = 0.5, buckets: typing.Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.interval = interval
+        self.lag = Histogram(buckets)
+        self.last_lag = 0.0
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.lag.observe(self.last_lag)
+
+
+def _escape_label_value(value: typing.Any) -> str:  # noqa: ANN401
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, typing.Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class PrometheusWriter:
+    """Writes metric families in the Prometheus text exposition format (version 0.0.4)."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def family(self, name: str, metric_type: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value: float, labels: dict[str, typing.Any] | None = None) -> None:
+        self.lines.append(f"{name}{_format_labels(labels or {})} {value}")
+
+    def histogram(self, name: str, histogram: Histogram, labels: dict[str, typing.Any] | None = None) -> None:
+        labels = labels or {}
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, float("inf")), histogram.counts, strict=True):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            self.sample(f"{name}_bucket", cumulative, {**labels, "le": le})
+        self.sample(f"{name}_sum", histogram.sum, labels)
+        self.sample(f"{name}_count", histogram.count, labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
@@ -0,0 +1,71 @@
+import os
+import re
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeFileResponse(FileResponse):
+    """File response answering a single byte range (`Range: bytes=start-end`) with 206 Partial Content.
+
+    Without a range the whole file is sent by `FileResponse`, which hands the path to the server when it
+    supports the ASGI `pathsend` extension, so the server can send it without copying it through Python.
+    A range the file does not hold gets 416; several ranges, or a range of an older version of the file
+    (`If-Range`), get the whole file, as HTTP allows.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            self.set_stat_headers(self.stat_result)
+        self.headers["accept-ranges"] = "bytes"
+        headers = Headers(scope=scope)
+        if_range = headers.get("if-range")
+        byte_range = None
+        if "range" in headers and (if_range is None or if_range == self.headers["etag"]):
+            byte_range = parse_range(headers["range"], self.stat_result.st_size)
+        if byte_range is None:
+            await super().__call__(scope, receive, send)
+            return
+        if byte_range == ():
+            response = Response(
+                status_code=416, headers={"content-range": f"bytes */{self.stat_result.st_size}"},
+            )
+            await response(scope, receive, send)
+            return
+
+        start, end = byte_range
+        self.status_code = 206
+        self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+        self.headers["content-length"] = str(end - start + 1)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining = remaining - len(chunk) if chunk else 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+
+
+def parse_range(value: str, size: int) -> tuple[int, int] | tuple[()] | None:
+    """The first and last byte of a single range; `()` when it is not satisfiable, None to send everything."""
+    match = _RANGE.fullmatch(value.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # A suffix: the last bytes of the file
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return ()
+    return start, end
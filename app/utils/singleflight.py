@@ -0,0 +1,56 @@
+"""
+Coalescing of concurrent identical calls: the first caller of a key runs the call, and whoever asks for the
+same key while it runs waits for that result instead of running the call again.
+
+Nothing is cached: a caller arriving after the call finished runs it anew, so results are never older
+than the request asking for them. When the caller running the call is cancelled (its client went away),
+the callers waiting for it are not: one of them runs the call again.
+"""
+import asyncio
+import typing
+
+T = typing.TypeVar("T")
+
+
+class SingleFlight(typing.Generic[T]):
+    def __init__(self) -> None:
+        self._calls: dict[typing.Hashable, asyncio.Future[T]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: typing.Hashable, call: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                return await self._lead(key, call)
+            self.shared += 1
+            try:
+                # Shielded: a waiter going away must not cancel the call of the others
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller running the call was cancelled, not this one: take over
+
+    async def _lead(self, key: typing.Hashable, call: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.calls += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here, so a call nobody else waited for does not log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {"in_flight": len(self._calls), "calls": self.calls, "shared": self.shared}
@@ -0,0 +1,36 @@
+import contextvars
+import dataclasses
+import time
+
+
+@dataclasses.dataclass
+class RequestTimings:
+    """Where the time of one request went, filled in while it is handled (see app/middleware.py).
+
+    `db_time` is the time spent in the database driver executing statements and fetching their rows,
+    `serialize_time` the time between the endpoint returning and the response being built (response
+    model validation and JSON encoding). Times are in seconds.
+    """
+
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+    statements: int = 0
+    db_time: float = 0.0
+    serialize_time: float = 0.0
+    # When the endpoint of the request returned, to time its serialization from
+    endpoint_returned: float | None = None
+
+    def record_statement(self, duration: float) -> None:
+        self.statements += 1
+        self.db_time += duration
+
+
+request_timings: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar(
+    "request_timings", default=None,
+)
+
+
+def record_statement(duration: float) -> None:
+    """Count a statement executed outside SQLAlchemy (e.g. on the raw asyncpg connection) for the request."""
+    timings = request_timings.get()
+    if timings is not None:
+        timings.record_statement(duration)
@@ -0,0 +1,86 @@
+"""
+Benchmark of BaseModel.bulk_create / bulk_update against the unit-of-work implementation they replaced.
+
+Creates and then updates `--rows` dykes inside a transaction that is rolled back at the end, so it can be
+run against any database with the schema in place:
+
+    python -m benchmarks.bulk_operations --rows 100000
+"""
+import argparse
+import asyncio
+import time
+import typing
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.apps.dykes.models import Dyke
+from app.db.base import engine
+from app.db.deps import session_context_var
+
+
+async def unit_of_work_create(db: AsyncSession, objects: list[Dyke]) -> None:
+    db.add_all(objects)
+    await db.flush()
+
+
+async def unit_of_work_update(db: AsyncSession, objects: list[Dyke]) -> None:
+    # The original selected all ids at once, which asyncpg refuses beyond 32767 parameters
+    for start in range(0, len(objects), 10_000):
+        await db.execute(sa.select(Dyke).where(Dyke.id.in_([x.id for x in objects[start:start + 10_000]])))
+    for item in objects:
+        await db.merge(item)
+    await db.flush()
+
+
+async def measure(name: str, rows: int, operation: typing.Callable[[], typing.Awaitable[typing.Any]]) -> None:
+    started = time.perf_counter()
+    await operation()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {elapsed:8.2f}s {rows / elapsed:>12,.0f} rows/s")
+
+
+async def run(rows: int) -> None:
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        db = AsyncSession(bind=connection, expire_on_commit=False)
+        session_context_var.set(db)
+        try:
+            for returning in (True, False):
+                prefix = uuid.uuid4().hex
+                created = await Dyke.bulk_create(
+                    [{"name": f"{prefix}-{i}", "description": "created"} for i in range(rows)], returning=returning
+                )
+                if not returning:
+                    created = (await db.execute(sa.select(Dyke).where(Dyke.name.startswith(prefix)))).scalars().all()
+                ids = [dyke.id for dyke in created]
+                db.expunge_all()
+                label = "returning objects" if returning else "without returning"
+                await measure(f"bulk_update ({label})", rows, lambda: Dyke.bulk_update(
+                    [{"id": obj_id, "description": "updated"} for obj_id in ids], returning=returning
+                ))
+
+            for returning in (True, False):
+                prefix = uuid.uuid4().hex
+                label = "returning objects" if returning else "without returning"
+                await measure(f"bulk_create ({label})", rows, lambda: Dyke.bulk_create(
+                    [{"name": f"{prefix}-{i}", "description": "created"} for i in range(rows)], returning=returning
+                ))
+
+            prefix = uuid.uuid4().hex
+            objects = [Dyke(name=f"{prefix}-{i}", description="created") for i in range(rows)]
+            await measure("unit of work create (add_all + flush)", rows, lambda: unit_of_work_create(db, objects))
+            detached = [Dyke(id=obj.id, name=obj.name, description="updated") for obj in objects]
+            db.expunge_all()
+            await measure("unit of work update (select + merge)", rows, lambda: unit_of_work_update(db, detached))
+        finally:
+            await db.close()
+            await transaction.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk create and update")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows to create and update")
+    asyncio.run(run(parser.parse_args().rows))
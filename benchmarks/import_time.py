@@ -0,0 +1,71 @@
+"""
+Import time of the entry points, against a budget.
+
+Every module is imported `--runs` times in a fresh interpreter with `python -X importtime`; the median of
+its cumulative import time is compared with its budget, and the modules that took longest themselves are
+listed. Exits with status 1 when a module is over budget, so it can run in CI:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget app.application=800 --top 20
+"""
+import argparse
+import collections
+import statistics
+import subprocess
+import sys
+
+# Milliseconds. The API is imported by every worker, the models by migrations and the ETL.
+BUDGETS = {
+    "app.application": 1500,
+    "app.db.models": 700,
+    "ETL.etl": 900,
+}
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module imported by importing `module`."""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def measure(module: str, budget: float, runs: int, top: int) -> bool:
+    totals = []
+    self_times: collections.defaultdict[str, list[int]] = collections.defaultdict(list)
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(times[module][1] / 1000)
+        for name, (self_us, _) in times.items():
+            self_times[name].append(self_us)
+    total = statistics.median(totals)
+    within = total <= budget
+    print(f"{module:<20} {total:8.0f}ms  budget {budget:6.0f}ms  {'ok' if within else 'OVER BUDGET'}")
+    slowest = sorted(self_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:top]
+    for name, values in slowest:
+        print(f"    {statistics.median(values) / 1000:8.1f}ms  {name}")
+    return within
+
+
+def parse_budget(value: str) -> tuple[str, float]:
+    module, _, milliseconds = value.partition("=")
+    return module, float(milliseconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of the entry points, against a budget")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                        help="module=milliseconds, replacing the default budget of the module or adding one")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module, the median is compared")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules (by their own time) to list")
+    args = parser.parse_args()
+    budgets = {**BUDGETS, **dict(args.budget)}
+    results = [measure(module, budget, args.runs, args.top) for module, budget in budgets.items()]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,109 @@
+"""
+Load benchmark of the service under Granian with 1, 2, 4 and 8 workers.
+
+For every worker count the service is started with `python -m app` (SERVER_WORKERS=n) on `--port`, and
+`--client-processes` processes with `--concurrency` connections each request `--path` for `--duration`
+seconds. Clients run in several processes so that they are not the bottleneck; give them cores of their
+own, or run the benchmark from another machine with `--url`.
+
+    python -m benchmarks.load --path "/api/readings/?sensorId=1" --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def client(url: str, concurrency: int, duration: float) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def connection(http: httpx.AsyncClient) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await http.get(url)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        await asyncio.gather(*(connection(http) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(args: tuple[str, int, float]) -> tuple[list[float], int]:
+    return asyncio.run(client(*args))
+
+
+def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    msg = f"Service did not start at {url}"
+    raise RuntimeError(msg)
+
+
+def measure(url: str, client_processes: int, concurrency: int, duration: float) -> None:
+    with multiprocessing.Pool(client_processes) as pool:
+        started = time.perf_counter()
+        results = pool.map(run_client, [(url, concurrency, duration)] * client_processes)
+        elapsed = time.perf_counter() - started
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        print(f"{'':>10} no successful requests, {errors} errors")
+        return
+    print(
+        f"{len(latencies) / elapsed:>10,.0f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.2f}ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f}ms"
+        f"  {errors} errors"
+    )
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.url:
+        measure(args.url + args.path, args.client_processes, args.concurrency, args.duration)
+        return
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    for workers in args.workers:
+        # Requests are slow under overload by design; their log lines would only drown the results
+        env = {**os.environ, "SERVER_WORKERS": str(workers), "APP_PORT": str(args.port), "SLOW_REQUEST_MS": "inf"}
+        server = subprocess.Popen([sys.executable, "-m", "app"], env=env)  # noqa: S603
+        try:
+            wait_until_up(url)
+            # Warm up the pools and statement caches of every worker before measuring
+            run_client((url, args.concurrency, 2))
+            print(f"{workers} workers:", end="", flush=True)
+            measure(url, args.client_processes, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the service by number of Granian workers")
+    parser.add_argument("--path", default="/api/dykes/?limit=10", help="Path (and query) to request")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to compare")
+    parser.add_argument("--port", type=int, default=8001, help="Port to start the service on")
+    parser.add_argument("--url", help="Benchmark an already running service at this base URL instead")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to send requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=32, help="Connections per client process")
+    parser.add_argument("--client-processes", type=int, default=2, help="Client processes")
+    run(parser.parse_args())
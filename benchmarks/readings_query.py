@@ -0,0 +1,99 @@
+"""
+Benchmark of the readings query through the ORM repository, a Core select of the same columns, and the
+raw asyncpg repository with named prepared statements.
+
+Every path runs the same filters `--iterations` times on one connection; a few warm-up calls first fill the
+statement caches, so the figures are those of a long-running worker:
+
+    python -m benchmarks.readings_query --iterations 200 --sensor-ids 1 2 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import typing
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.apps.dykes import models
+from app.db.base import engine
+from app.db.utils import any_of
+from app.repositories.asyncpg_repository import AsyncpgReadingRepository
+from app.repositories.database_repository import DatabaseReadingRepository
+
+WARMUP = 5
+
+
+async def core_readings(db: AsyncSession, start_date: datetime | None = None, end_date: datetime | None = None,
+                        sensor_ids: list[int] | None = None) -> list[dict]:
+    query = (
+        sa.select(
+            models.Reading.id,
+            models.Crossection.name.label("crossection"),
+            models.Sensor.id.label("sensor_id"),
+            models.Sensor.name.label("sensor_name"),
+            models.SensorType.name.label("sensor_type"),
+            models.Sensor.is_active.label("sensor_is_active"),
+            models.LocationInTopology.coordinates.label("location_in_topology"),
+            models.UnitOfMeasure.unit,
+            models.Reading.value,
+            models.Reading.time,
+        )
+        .outerjoin(models.Sensor, models.Sensor.id == models.Reading.sensor_id)
+        .outerjoin(models.SensorType, models.SensorType.id == models.Sensor.sensor_type_id)
+        .outerjoin(models.Crossection, models.Crossection.id == models.Reading.crossection_id)
+        .outerjoin(models.LocationInTopology, models.LocationInTopology.id == models.Reading.location_in_topology_id)
+        .outerjoin(models.UnitOfMeasure, models.UnitOfMeasure.id == models.Reading.unit_id)
+    )
+    if start_date:
+        query = query.where(models.Reading.time >= start_date)
+    if end_date:
+        query = query.where(models.Reading.time <= end_date)
+    if sensor_ids:
+        query = query.where(any_of(models.Reading.sensor_id, sensor_ids))
+    rows = (await db.execute(query)).mappings()
+    return [{**row, "time": row["time"].isoformat()} for row in rows]
+
+
+async def measure(name: str, iterations: int, operation: typing.Callable[[], typing.Awaitable[list]]) -> None:
+    for _ in range(WARMUP):
+        rows = len(await operation())
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await operation()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(
+        f"{name:<10} {rows:>8} rows"
+        f" mean {statistics.mean(timings) * 1000:8.2f}ms"
+        f" p50 {timings[len(timings) // 2] * 1000:8.2f}ms"
+        f" p95 {timings[int(len(timings) * 0.95)] * 1000:8.2f}ms"
+    )
+
+
+async def run(iterations: int, filters: dict[str, typing.Any]) -> None:
+    async with engine.connect() as connection:
+        db = AsyncSession(bind=connection, expire_on_commit=False)
+        try:
+            orm, raw = DatabaseReadingRepository(db), AsyncpgReadingRepository(db)
+            await measure("orm", iterations, lambda: orm.get_readings(**filters))
+            await measure("core", iterations, lambda: core_readings(db, **filters))
+            await measure("asyncpg", iterations, lambda: raw.get_readings(**filters))
+        finally:
+            await db.close()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the readings query")
+    parser.add_argument("--iterations", type=int, default=100, help="Timed calls per path")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, help="Readings from this time")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, help="Readings until this time")
+    parser.add_argument("--sensor-ids", type=int, nargs="+", help="Readings of these sensors")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations, {
+        "start_date": args.start_date, "end_date": args.end_date, "sensor_ids": args.sensor_ids,
+    }))
@@ -8,6 +8,7 @@ from sqlalchemy import URL, create_engine
 from app.db.base import Base
 from app.apps.decks.models import Deck, Card
 from app.apps.dykes.models import Dyke, Crossection
+from ETL.models import EtlSource, EtlSensorMark
 
 from app.settings import settings
 
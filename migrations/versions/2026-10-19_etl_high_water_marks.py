@@ -0,0 +1,45 @@
+"""etl high water marks
+
+Revision ID: 5b1f0c2d7e94
+Revises: 20f9678efc01
+Create Date: 2026-10-19 09:12:41.203519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c2d7e94'
+down_revision = '20f9678efc01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('etl_source',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('file_offset', sa.BigInteger(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('etl_sensor_mark',
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.Column('sensor_id', sa.Integer(), nullable=False),
+    sa.Column('last_time', sa.DateTime(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ),
+    sa.ForeignKeyConstraint(['source_id'], ['etl_source.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source_id', 'sensor_id')
+    )
+
+
+def downgrade():
+    op.drop_table('etl_sensor_mark')
+    op.drop_table('etl_source')
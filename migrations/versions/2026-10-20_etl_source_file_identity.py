@@ -0,0 +1,24 @@
+"""etl source file identity
+
+Revision ID: 8c3e6a41f2d7
+Revises: 5b1f0c2d7e94
+Create Date: 2026-10-20 10:02:17.482911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3e6a41f2d7'
+down_revision = '5b1f0c2d7e94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('etl_source', sa.Column('file_identity', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('etl_source', 'file_identity')
@@ -13,10 +13,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.application import application
 from app.db.base import engine
 from app.db.deps import session_context_var, set_db
+from app.settings import settings
 
 
 
 
+@pytest.fixture(scope="session", autouse=True)
+def _no_warm_up() -> typing.Iterator[None]:
+    # The TestClient runs the application on an event loop of its own. Connections its warm-up leaves in
+    # the pool would be reused by the `db` fixture on the test's loop.
+    settings.warmup_enabled = False
+    yield
+
+
 @pytest.fixture()
 async def db() -> typing.AsyncIterator[AsyncSession]:
     connection = await engine.connect()
@@ -0,0 +1,42 @@
+''' ACCEPTANCE CRITERIA FOR THE ASYNCPG READINGS REPOSITORY
+- It returns the same readings as the ORM repository, for every combination of filters
+- A statement is prepared once per connection and reused by later calls
+'''
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repositories import asyncpg_repository
+from app.repositories.asyncpg_repository import AsyncpgReadingRepository
+from app.repositories.database_repository import DatabaseReadingRepository
+
+
+FILTERS = [
+    {},
+    {"start_date": datetime(2024, 1, 1), "end_date": datetime(2030, 1, 1)},
+    {"end_date": datetime(2024, 8, 1)},
+    {"sensor_ids": [1, 2]},
+    {"sensor_names": [' "Sensor 1"', "Sensor 3"]},
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filters", FILTERS)
+async def test_same_readings_as_orm(db: AsyncSession, filters):
+    expected = await DatabaseReadingRepository(db).get_readings(**filters)
+    readings = await AsyncpgReadingRepository(db).get_readings(**filters)
+
+    key = lambda reading: reading["id"]
+    assert sorted(readings, key=key) == sorted(expected, key=key)
+
+
+@pytest.mark.asyncio
+async def test_statement_prepared_once(db: AsyncSession):
+    repository = AsyncpgReadingRepository(db)
+    await repository.get_readings(sensor_ids=[1])
+    await repository.get_readings(sensor_ids=[2, 3])
+
+    raw_connection = await (await db.connection()).get_raw_connection()
+    statements = asyncpg_repository._prepared[raw_connection.driver_connection]
+    assert list(statements) == ["geodykes_readings_sensor_ids"]
@@ -0,0 +1,101 @@
+'''
+ACCEPTANCE CRITERIA FOR BULK OPERATIONS
+- Objects are created in bulk and come back with their ids, in the order they were given
+- Objects are updated in bulk by primary key, only the columns that were set change
+- Bulk operations can skip loading the objects back
+- Updating objects that do not exist is a validation error
+- Objects are fetched page by page, by offset or after the last object of the previous page
+- Counting, existence checks and aggregates are computed by the database
+- Lists of values are sent as one array, so the compiled statement is reused for any list length
+'''
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.apps.dykes.models import Dyke
+from app.db.exceptions import DatabaseValidationError
+from app.db.instrumentation import compile_cache
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_and_update(db: AsyncSession):
+    created = await Dyke.bulk_create([Dyke(name=f"bulk dyke {i}", description="created") for i in range(3)])
+    assert [dyke.name for dyke in created] == ["bulk dyke 0", "bulk dyke 1", "bulk dyke 2"]
+    assert all(dyke.id and dyke.created_at for dyke in created)
+
+    updated = await Dyke.bulk_update([
+        {"id": created[2].id, "description": "updated"},
+        Dyke(id=created[0].id, name="bulk dyke 0b"),
+    ])
+    assert [dyke.id for dyke in updated] == [created[2].id, created[0].id]
+    assert updated[0].description == "updated"
+    assert updated[1].name == "bulk dyke 0b"
+    assert updated[1].description == "created"
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_without_returning(db: AsyncSession):
+    assert await Dyke.bulk_create([{"name": "bulk dyke without returning"}], returning=False) == []
+    assert len(await Dyke.filter({"name": "bulk dyke without returning"})) == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_missing_id(db: AsyncSession):
+    [dyke] = await Dyke.bulk_create([{"name": "bulk dyke with a missing neighbour"}])
+
+    with pytest.raises(DatabaseValidationError) as error:
+        await Dyke.bulk_update([{"id": dyke.id, "description": "updated"}, {"id": 2**31 - 1, "description": "gone"}])
+    assert error.value.field == "id"
+    assert str(2**31 - 1) in error.value.message
+
+
+@pytest.mark.asyncio
+async def test_pagination(db: AsyncSession):
+    await Dyke.bulk_create([{"name": f"page dyke {i}", "description": "paged"} for i in range(5)], returning=False)
+    filters = {"description": "paged"}
+
+    first_page = await Dyke.filter(filters, sorting={"name": "desc"}, limit=2)
+    assert [dyke.name for dyke in first_page] == ["page dyke 4", "page dyke 3"]
+    assert [dyke.name for dyke in await Dyke.filter(filters, sorting={"name": "desc"}, limit=2, offset=2)] == [
+        "page dyke 2",
+        "page dyke 1",
+    ]
+    last = first_page[-1]
+    next_page = await Dyke.filter(filters, sorting={"name": "desc"}, limit=2, after={"name": last.name, "id": last.id})
+    assert [dyke.name for dyke in next_page] == ["page dyke 2", "page dyke 1"]
+
+    # Rows with a NULL description could never be paged to
+    with pytest.raises(ValueError):
+        await Dyke.filter(filters, sorting={"description": "asc"}, after={"description": "paged", "id": last.id})
+
+
+@pytest.mark.asyncio
+async def test_count_exists_aggregate(db: AsyncSession):
+    await Dyke.bulk_create([{"name": f"counted dyke {i}", "description": "counted"} for i in range(3)], returning=False)
+
+    assert await Dyke.count({"description": "counted"}) == 3
+    assert await Dyke.exists({"name": "counted dyke 1"})
+    assert not await Dyke.exists({"name": "uncounted dyke"})
+    assert await Dyke.aggregate(
+        {"dykes": "id__count", "last": "name__max"}, filters={"description": "counted"}, group_by=("description",)
+    ) == [{"description": "counted", "dykes": 3, "last": "counted dyke 2"}]
+    assert await Dyke.aggregate(
+        {"dykes": "id__count"}, filters={"description__in": ["counted", "other"]}, group_by=("name",),
+        sorting={"name": "desc"},
+    ) == [{"name": f"counted dyke {i}", "dykes": 1} for i in (2, 1, 0)]
+
+
+@pytest.mark.asyncio
+async def test_in_filter_reuses_compiled_statement(db: AsyncSession):
+    dykes = await Dyke.bulk_create([{"name": f"listed dyke {i}"} for i in range(3)])
+    ids = [dyke.id for dyke in dykes]
+
+    assert len(await Dyke.filter({"id__in": ids[:1]})) == 1
+    compile_cache.reset()
+    assert len(await Dyke.filter({"id__in": ids})) == 3
+    assert compile_cache.counts["cache_hit"] == 1
+    assert len(await Dyke.filter({"id__notin": ids, "name__startswith": "listed dyke"})) == 0
+
+    assert (await Dyke.get_by_id(ids[0])).name == "listed dyke 0"
+    compile_cache.reset()
+    assert (await Dyke.get_by_id(ids[1])).name == "listed dyke 1"
+    assert compile_cache.stats()["hit_rate"] == 1.0
@@ -0,0 +1,25 @@
+''' ACCEPTANCE CRITERIA FOR FORKED WORKERS
+- A forked worker starts with empty pools, and opens its own connections
+'''
+import os
+
+import pytest
+import sqlalchemy as sa
+
+from app.db import base
+
+
+@pytest.mark.asyncio
+async def test_fork_drops_parent_connections():
+    async with base.ingest_engine.connect() as connection:
+        await connection.execute(sa.select(1))
+    assert base.ingest_engine.pool.checkedin() == 1
+
+    pid = os.fork()
+    if pid == 0:
+        # The child exits without running the parent's cleanup
+        os._exit(0 if base.ingest_engine.pool.checkedin() == 0 else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert base.ingest_engine.pool.checkedin() == 1
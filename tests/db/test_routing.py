@@ -0,0 +1,64 @@
+''' ACCEPTANCE CRITERIA FOR READ REPLICA ROUTING AND WORKLOAD POOLS
+- Sessions of GET routes read from the read engine
+- A request can take its connection from the pool of another workload
+- The first write pins the session to the primary, so later reads see the write
+- Pool usage and checkout waits are reported per engine
+'''
+import pytest
+import sqlalchemy as sa
+from httpx import AsyncClient
+from sqlalchemy.ext import asyncio as sa_async
+
+from app.apps.dykes.models import Dyke
+from app.db import base
+from app.db.deps import db_scope, get_db, use_pool
+from app.settings import settings
+
+
+@pytest.fixture
+async def replica(monkeypatch):
+    # The same database under a second engine stands in for the replica
+    replica = sa_async.create_async_engine(settings.db_dsn, pool_size=1, max_overflow=0)
+    monkeypatch.setattr(base, "read_engine", replica)
+    yield replica
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_routing_session_pins_primary(replica):
+    session = base.async_read_session().sync_session
+
+    assert session.get_bind(clause=sa.select(Dyke)) is replica.sync_engine
+    assert session.get_bind(clause=sa.update(Dyke)) is base.engine.sync_engine
+    assert session.get_bind(clause=sa.select(Dyke)) is base.engine.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_read_scope_uses_replica(replica):
+    async with db_scope(read_only=True):
+        await Dyke.count()
+        assert replica.pool.checkedout() == 1
+        assert get_db().sync_session.info.get("primary") is None
+    assert replica.pool.checkedout() == 0
+
+
+@pytest.mark.asyncio
+async def test_workload_pool():
+    async with db_scope(pool="export"):
+        await Dyke.count()
+        assert base.export_engine.pool.checkedout() == 1
+    assert base.export_engine.pool.checkedout() == 0
+
+    with pytest.raises(KeyError):
+        use_pool("reports")
+
+
+@pytest.mark.asyncio
+async def test_pool_stats(client: AsyncClient):
+    response = client.get("/api/admin/pools/")
+
+    assert response.status_code == 200
+    pools = response.json()
+    assert pools["interactive"]["size"] == settings.db_pool_size
+    assert pools["ingest"]["size"] == settings.db_ingest_pool_size
+    assert pools["interactive"]["wait_time"]["count"] > 0
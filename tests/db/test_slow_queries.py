@@ -0,0 +1,74 @@
+''' ACCEPTANCE CRITERIA FOR THE SLOW QUERY LOG
+- Statements slower than the threshold are recorded with their SQL, parameter types and duration
+- Only the most recent statements are kept
+- A sample of slow SELECTs gets its EXPLAIN (ANALYZE, BUFFERS) plan, at most one per interval
+- The log is shown at /api/admin/slow-queries/
+'''
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+from httpx import AsyncClient
+from sqlalchemy.ext import asyncio as sa_async
+
+from app.apps.dykes.models import Reading
+from app.db.instrumentation import SlowQueryLog, parameter_shape
+from app.db.utils import any_of
+from app.settings import settings
+
+
+@pytest.fixture
+async def engine():
+    engine = sa_async.create_async_engine(settings.db_dsn, pool_size=2, max_overflow=0)
+    yield engine
+    await engine.dispose()
+
+
+def test_parameter_shape():
+    assert parameter_shape(3) == "int"
+    assert parameter_shape([1, 2, 3]) == "int[3]"
+    assert parameter_shape([]) == "?[0]"
+
+
+async def run_readings_query(engine, times=1):
+    async with engine.connect() as connection:
+        for _ in range(times):
+            await connection.execute(sa.select(Reading.id).where(any_of(Reading.sensor_id, [1, 2])))
+
+
+@pytest.mark.asyncio
+async def test_slow_select_is_explained(engine):
+    log = SlowQueryLog(threshold=0, size=10, explain_sample_rate=1.0, explain_interval=3600)
+    log.install("test", engine)
+
+    await run_readings_query(engine)
+    await asyncio.gather(*log._tasks)
+
+    [entry] = log.entries
+    assert entry.engine == "test"
+    assert entry.statement.startswith("SELECT reading.id")
+    assert entry.parameters == ["int[2]"]
+    assert entry.explain_error is None
+    assert "Plan" in entry.plan[0]
+
+
+@pytest.mark.asyncio
+async def test_ring_buffer_and_explain_interval(engine):
+    log = SlowQueryLog(threshold=0, size=2, explain_sample_rate=1.0, explain_interval=3600)
+    log.install("test", engine)
+
+    await run_readings_query(engine, times=3)
+    await asyncio.gather(*log._tasks)
+
+    # The first query was explained and then pushed out of the buffer; the later ones came within the interval
+    assert [entry.id for entry in log.entries] == [2, 3]
+    assert all(entry.plan is None for entry in log.entries)
+
+
+@pytest.mark.asyncio
+async def test_slow_query_endpoint(client: AsyncClient):
+    response = client.get("/api/admin/slow-queries/")
+
+    assert response.status_code == 200
+    assert response.json()["enabled"] is settings.slow_query_log_enabled
+    assert isinstance(response.json()["queries"], list)
@@ -0,0 +1,123 @@
+''' ACCEPTANCE CRITERIA FOR COALESCING READINGS QUERIES
+- Concurrent calls with the same key run once and share the result, or the error
+- When the caller running the call is cancelled, a waiting caller runs it instead
+- Readings queries with the same normalized filters have the same key
+- Concurrent identical readings requests make one repository call and get the same body
+'''
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app.application import application
+from app.apps.dykes import views
+from app.dependencies import get_reading_repository
+from app.repositories.database_repository import DatabaseReadingRepository
+from app.utils.singleflight import SingleFlight
+
+READING = {
+    "id": 1,
+    "crossection": "Crossection 4-2",
+    "sensor_id": 2,
+    "sensor_name": "Sensor 2",
+    "sensor_type": "Piezometer",
+    "sensor_is_active": True,
+    "location_in_topology": [25.742971005268636, 39.978211040045174],
+    "unit": "Unit 1",
+    "value": 61.0,
+    "time": "2024-08-03T11:48:14.460881",
+}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    results = await asyncio.gather(*(flight.do("key", call) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "shared": 4}
+
+    await flight.do("key", call)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_error():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.do("key", call) for _ in range(3)), return_exceptions=True)
+
+    assert [type(result) for result in results] == [ValueError] * 3
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_over():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    leader = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == 2
+    assert leader.cancelled()
+
+
+def test_readings_key():
+    repository = DatabaseReadingRepository()
+    start = datetime(2024, 8, 3)
+
+    assert views.readings_key(repository, start, None, [3, 1, 3], None) == \
+        views.readings_key(repository, start, None, [1, 3], ["Sensor 2"])
+    assert views.readings_key(repository, None, None, None, ['"Sensor 2" ', "Sensor 1"]) == \
+        views.readings_key(repository, None, None, None, ["Sensor 1", "Sensor 2"])
+    assert views.readings_key(repository, start, None, None, None) != \
+        views.readings_key(repository, None, start, None, None)
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_query():
+    calls = []
+
+    class SlowRepository(DatabaseReadingRepository):
+        async def get_readings(self, **filters):
+            calls.append(filters)
+            await asyncio.sleep(0.05)
+            return [READING]
+
+    application.dependency_overrides[get_reading_repository] = lambda: SlowRepository()
+    try:
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(client.get("/api/readings/", params={"sensorId": [2, 1]}) for _ in range(5)),
+                client.get("/api/readings/", params={"sensorId": [1, 2, 2]}),
+                client.get("/api/readings/", params={"sensorId": 1}),
+            )
+    finally:
+        del application.dependency_overrides[get_reading_repository]
+
+    assert len(calls) == 2
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.content for response in responses}) == 1
+    assert responses[0].json() == {"readings": [READING]}
@@ -29,3 +29,62 @@ async def test_post_reading(client: AsyncClient):
     data = response.json()
     assert data["crossection"] == payload_example["crossection"]
     assert data["value"] == payload_example["value"]
+
+
+@pytest.mark.asyncio
+async def test_post_reading_buffer_full(client: AsyncClient, monkeypatch):
+    from app.apps.dykes import views
+    from app.repositories.ingest_buffer import IngestBufferFullError
+
+    async def refuse(payload, wait=True):
+        raise IngestBufferFullError(retry_after=0.05)
+
+    monkeypatch.setattr(views.settings, "ingest_buffer_enabled", True)
+    monkeypatch.setattr(views.ingest_buffer, "submit", refuse)
+
+    payload_example = {
+        "crossection": "Crossection 4-2",
+        "sensor_id": 2,
+        "sensor_name": "Sensor 2",
+        "sensor_is_active": True,
+        "location_in_topology": [25.742971005268636, 39.978211040045174],
+        "unit": "Unit 1",
+        "value": 61,
+        "time": "2024-08-03T11:48:14.460881"
+    }
+
+    response = client.post("/api/readings/", json=payload_example)
+
+    assert response.status_code == 429  # The buffer applies backpressure instead of queueing forever
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_post_reading_queued(client: AsyncClient, monkeypatch):
+    from app.apps.dykes import views
+
+    queued = []
+
+    async def enqueue(payload, wait=True):
+        queued.append((payload, wait))
+
+    monkeypatch.setattr(views.settings, "ingest_buffer_enabled", True)
+    monkeypatch.setattr(views.settings, "ingest_wait_for_flush", False)
+    monkeypatch.setattr(views.ingest_buffer, "submit", enqueue)
+
+    payload_example = {
+        "crossection": "Crossection 4-2",
+        "sensor_id": 2,
+        "sensor_name": "Sensor 2",
+        "sensor_is_active": True,
+        "location_in_topology": [25.742971005268636, 39.978211040045174],
+        "unit": "Unit 1",
+        "value": 61,
+        "time": "2024-08-03T11:48:14.460881"
+    }
+
+    response = client.post("/api/readings/", json=payload_example)
+
+    assert response.status_code == 202  # Accepted, the reading is written with the next batch
+    assert len(queued) == 1
+    assert queued[0][1] is False
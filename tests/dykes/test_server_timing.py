@@ -0,0 +1,49 @@
+''' ACCEPTANCE CRITERIA FOR REQUEST TIMINGS
+- Every response has a Server-Timing header with the database, serialization and total time
+- The database time counts the statements the request executed
+- Requests slower than the threshold are logged at WARNING with their timings
+'''
+import logging
+import re
+
+import pytest
+from httpx import AsyncClient
+
+from app.settings import settings
+
+
+def parse_server_timing(header: str) -> dict[str, str]:
+    return {metric.split(";")[0]: metric for metric in header.split(", ")}
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header(client: AsyncClient):
+    response = client.get("/api/dykes/", params={"limit": 2})
+
+    assert response.status_code == 200
+    metrics = parse_server_timing(response.headers["server-timing"])
+    assert set(metrics) == {"db", "serialize", "app", "total"}
+    statements = int(re.search(r'desc="(\d+) statements"', metrics["db"]).group(1))
+    assert statements >= 1
+
+
+@pytest.mark.asyncio
+async def test_request_without_queries(client: AsyncClient):
+    response = client.get("/api/admin/ingest/")
+
+    metrics = parse_server_timing(response.headers["server-timing"])
+    assert metrics["db"] == 'db;dur=0.00;desc="0 statements"'
+
+
+@pytest.mark.asyncio
+async def test_slow_request_logged(client: AsyncClient, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "slow_request_ms", 0)
+
+    with caplog.at_level(logging.WARNING, logger="app.middleware"):
+        client.get("/api/dykes/", params={"limit": 2})
+
+    [record] = caplog.records
+    assert record.request_timing["path"] == "/api/dykes/"
+    assert record.request_timing["status"] == 200
+    assert record.request_timing["statements"] >= 1
+    assert record.request_timing["total_ms"] >= record.request_timing["db_ms"]
@@ -0,0 +1,69 @@
+''' ACCEPTANCE CRITERIA FOR REQUEST SESSIONS
+- Requests that do not query the database never create a session
+- A request querying the database uses a single session, which is closed when the handler is done
+'''
+import pytest
+from httpx import AsyncClient
+
+from app.db import base
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    created, closed = [], []
+
+    def recording(factory):
+        def session_factory():
+            session = factory()
+            close = session.close
+
+            async def record_close():
+                closed.append(session)
+                await close()
+
+            session.close = record_close
+            created.append(session)
+            return session
+
+        return session_factory
+
+    monkeypatch.setattr(base, "async_read_session", recording(base.async_read_session))
+    for name, sessionmaker in base.sessionmakers.items():
+        monkeypatch.setitem(base.sessionmakers, name, recording(sessionmaker))
+    return created, closed
+
+
+@pytest.mark.asyncio
+async def test_request_without_queries_has_no_session(client: AsyncClient, sessions, monkeypatch):
+    from app.apps.dykes import views
+
+    async def enqueue(payload, wait=True):
+        pass
+
+    monkeypatch.setattr(views.settings, "ingest_buffer_enabled", True)
+    monkeypatch.setattr(views.settings, "ingest_wait_for_flush", False)
+    monkeypatch.setattr(views.ingest_buffer, "submit", enqueue)
+
+    response = client.post("/api/readings/", json={
+        "crossection": "Crossection 4-2",
+        "sensor_id": 2,
+        "sensor_name": "Sensor 2",
+        "sensor_is_active": True,
+        "location_in_topology": [25.742971005268636, 39.978211040045174],
+        "unit": "Unit 1",
+        "value": 61,
+        "time": "2024-08-03T11:48:14.460881",
+    })
+
+    assert response.status_code == 202
+    assert sessions == ([], [])
+
+
+@pytest.mark.asyncio
+async def test_request_uses_one_session(client: AsyncClient, sessions):
+    response = client.get("/api/dykes/", params={"limit": 2})
+
+    assert response.status_code == 200
+    created, closed = sessions
+    assert len(created) == 1
+    assert closed == created
@@ -0,0 +1,9 @@
+import typing
+
+import pytest
+
+
+@pytest.fixture(name="db_context", autouse=True)
+def _db_context() -> typing.Iterator[None]:
+    # Unit tests of the pipeline, they do not need the database session of tests/conftest.py
+    yield
@@ -0,0 +1,89 @@
+''' ACCEPTANCE CRITERIA FOR COLUMNAR FILES
+- Sensor names and units are mapped to ids without leaving Arrow
+- Rows with unknown sensors or units, or values that are not numbers, are rejected
+- Values that do not fit reading.value and times that cannot be parsed reject their row, not the batch
+- Directories are expanded to their CSV and columnar files
+'''
+import collections
+import datetime
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from ETL.columnar import ColumnLookup, transform_structure2
+from ETL.etl import expand_sources
+
+
+SensorRow = collections.namedtuple("SensorRow", "name id sensor_type_id location_in_topology_id crossection_id")
+UnitRow = collections.namedtuple("UnitRow", "unit id")
+
+
+@pytest.fixture
+def sensors():
+    return ColumnLookup(
+        {"Sensor 1": SensorRow("Sensor 1", 1, 2, 3, 4), "Sensor 2": None},
+        ("id", "sensor_type_id", "location_in_topology_id", "crossection_id"),
+    )
+
+
+@pytest.fixture
+def units():
+    return ColumnLookup({"kPa": UnitRow("kPa", 7)}, ("id",))
+
+
+def test_transform_structure2(sensors, units):
+    batch = pa.record_batch({
+        "Identifier": ["Sensor 1", "Sensor 2", "Sensor 1", "Sensor 1"],
+        "Measurement": ["1.6", "2.0", "abc", "4"],
+        "Time": ["2024-08-03T11:00:00"] * 4,
+        "MeasurementUnit": ["kPa", "kPa", "kPa", "m"],
+    })
+
+    table = transform_structure2(batch, sensors, units)
+
+    assert table.num_rows == 1
+    row = table.to_pylist()[0]
+    assert row["sensor_id"] == 1
+    assert row["crossection_id"] == 4
+    assert row["unit_id"] == 7
+    assert row["value"] == 2
+    assert row["time"] == datetime.datetime(2024, 8, 3, 11, 0)
+
+
+def test_transform_structure2_bad_values(sensors, units):
+    batch = pa.record_batch({
+        "Identifier": ["Sensor 1"] * 5,
+        "Measurement": [1.0, float("nan"), float("inf"), 3e10, 5.0],
+        "Time": ["2024-08-03T11:00:00", "2024-08-03T11:01:00", "2024-08-03T11:02:00", "2024-08-03T11:03:00",
+                 "yesterday"],
+        "MeasurementUnit": ["kPa"] * 5,
+    })
+
+    table = transform_structure2(batch, sensors, units)
+
+    assert table.column("value").to_pylist() == [1]
+
+
+def test_transform_structure2_time_zones(sensors, units):
+    batch = pa.record_batch({
+        "Identifier": ["Sensor 1"] * 2,
+        "Measurement": ["1", "2"],
+        "Time": ["2024-08-03T11:00:00Z", "2024-08-03 11:01:00+02:00"],
+        "MeasurementUnit": ["kPa"] * 2,
+    })
+
+    table = transform_structure2(batch, sensors, units)
+
+    # Like COPY into reading.time, the offset is ignored
+    assert table.column("time").to_pylist() == [
+        datetime.datetime(2024, 8, 3, 11, 0),
+        datetime.datetime(2024, 8, 3, 11, 1),
+    ]
+
+
+def test_expand_sources_columnar(tmp_path):
+    for name in ("b.parquet", "a.csv", "c.feather", "notes.txt"):
+        (tmp_path / name).write_text("")
+
+    assert expand_sources(str(tmp_path)) == [str(tmp_path / name) for name in ("a.csv", "b.parquet", "c.feather")]
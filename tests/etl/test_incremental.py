@@ -0,0 +1,102 @@
+''' ACCEPTANCE CRITERIA FOR SCHEDULED LOADS
+- Readings are loaded automatically every day at 00:00
+- The loading timerange is flexible: every day at a given time, or every hour
+- A load that failed halfway continues after the last committed chunk, without loading anything twice
+- Readings appended late (older than readings loaded before) are loaded too
+- A rotated file is read from the start, skipping the readings loaded from the previous file
+'''
+import datetime
+import os
+
+import pytest
+import sqlalchemy as sa
+
+from app.apps.dykes.models import Reading
+from ETL import incremental
+from ETL.incremental import load_incremental, next_run
+from ETL.loader import get_engine
+from ETL.models import EtlSensorMark, EtlSource
+from ETL.strategies import STRATEGIES
+
+# Readings of these tests are far in the future, so they can be told apart and removed afterwards
+TEST_TIME = datetime.datetime(2099, 1, 1)
+
+
+def test_next_run_daily():
+    now = datetime.datetime(2024, 8, 3, 11, 48)
+
+    assert next_run(now, "daily", datetime.time(0, 0)) == datetime.datetime(2024, 8, 4, 0, 0)
+    assert next_run(now, "daily", datetime.time(12, 30)) == datetime.datetime(2024, 8, 3, 12, 30)
+
+
+def test_next_run_hourly():
+    now = datetime.datetime(2024, 8, 3, 11, 48)
+
+    assert next_run(now, "hourly", datetime.time(0, 0)) == datetime.datetime(2024, 8, 3, 12, 0)
+    assert next_run(now, "hourly", datetime.time(0, 50)) == datetime.datetime(2024, 8, 3, 11, 50)
+
+
+def write_readings(path, minutes, mode="w"):
+    with open(path, mode) as file:
+        if mode == "w":
+            file.write("Identifier,Measurement,Time,MeasurementUnit\n")
+        for minute in minutes:
+            file.write(f"Sensor 1,{minute},{(TEST_TIME + datetime.timedelta(minutes=minute)).isoformat()},Unit 1\n")
+
+
+def loaded_minutes():
+    with get_engine().connect() as connection:
+        return sorted(connection.execute(sa.select(Reading.value).where(Reading.time >= TEST_TIME)).scalars())
+
+
+@pytest.fixture()
+def logger_file(tmp_path):
+    path = tmp_path / "logger.csv"
+    yield path
+    with get_engine().begin() as connection:
+        source_ids = sa.select(EtlSource.id).where(EtlSource.name == os.path.realpath(path)).scalar_subquery()
+        connection.execute(sa.delete(EtlSensorMark).where(EtlSensorMark.source_id == source_ids))
+        connection.execute(sa.delete(EtlSource).where(EtlSource.id == source_ids))
+        connection.execute(sa.delete(Reading).where(Reading.time >= TEST_TIME))
+
+
+def test_load_incremental_resumes_after_failure(logger_file, monkeypatch):
+    strategy = STRATEGIES["structure2"]
+    write_readings(logger_file, [1, 2, 3, 4])
+    copy_rows = incremental.copy_rows
+    calls = []
+
+    def fail_second_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return copy_rows(*args)
+
+    monkeypatch.setattr(incremental, "copy_rows", fail_second_chunk)
+    with pytest.raises(RuntimeError):
+        load_incremental(str(logger_file), strategy, chunk_size=2)
+    assert loaded_minutes() == [1, 2]
+
+    monkeypatch.setattr(incremental, "copy_rows", copy_rows)
+    report = load_incremental(str(logger_file), strategy, chunk_size=2)
+    assert (report.rows_read, report.rows_loaded) == (2, 2)
+    assert loaded_minutes() == [1, 2, 3, 4]
+
+    # A logger delivering an older reading late
+    write_readings(logger_file, [0], mode="a")
+    report = load_incremental(str(logger_file), strategy, chunk_size=2)
+    assert (report.rows_loaded, report.rows_skipped) == (1, 0)
+    assert loaded_minutes() == [0, 1, 2, 3, 4]
+
+
+def test_load_incremental_rotated_file(logger_file):
+    strategy = STRATEGIES["structure2"]
+    write_readings(logger_file, [1, 2])
+    load_incremental(str(logger_file), strategy, chunk_size=10)
+
+    # The logger starts a new file, which has grown past the old offset by the next run
+    write_readings(logger_file, [2, 3, 4, 5, 6])
+    report = load_incremental(str(logger_file), strategy, chunk_size=10)
+
+    assert (report.rows_read, report.rows_loaded, report.rows_skipped) == (5, 4, 1)
+    assert loaded_minutes() == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,76 @@
+''' ACCEPTANCE CRITERIA FOR THE STREAMING LOADER
+- A csv file is read in chunks of at most chunk_size rows
+- Reading can resume from the offset where a previous chunk ended
+- Chunks are handed out column by column
+- A malformed row does not shift the other rows of its chunk
+- Quoted fields may hold line breaks, also when a record is still being written
+- Values that cannot be converted are reported by position instead of failing the chunk
+'''
+from ETL.loader import convert_column, iter_csv_chunks
+
+
+def test_iter_csv_chunks(tmp_path):
+    file_path = tmp_path / "readings.csv"
+    file_path.write_text("Identifier,Measurement\nSensor 1,1.5\nSensor 2,2.5\nSensor 3\n")
+
+    chunks = list(iter_csv_chunks(file_path, chunk_size=2))
+
+    assert chunks == [
+        ({"Identifier": ["Sensor 1", "Sensor 2"], "Measurement": ["1.5", "2.5"]}, 49),
+        ({"Identifier": ["Sensor 3"], "Measurement": [""]}, 58),
+    ]
+
+
+def test_iter_csv_chunks_resume(tmp_path):
+    file_path = tmp_path / "readings.csv"
+    file_path.write_text("Identifier,Measurement\nSensor 1,1.5\nSensor 2,2.5\nSensor 3,3.")
+
+    # The last line is still being written, so it is not part of the chunk
+    [(chunk, offset)] = iter_csv_chunks(file_path, chunk_size=10, complete_lines_only=True)
+    assert chunk == {"Identifier": ["Sensor 1", "Sensor 2"], "Measurement": ["1.5", "2.5"]}
+
+    with open(file_path, "a") as file:
+        file.write("5\nSensor 4,4.5\n")
+
+    chunks = list(iter_csv_chunks(file_path, chunk_size=10, start_offset=offset, complete_lines_only=True))
+    assert chunks == [({"Identifier": ["Sensor 3", "Sensor 4"], "Measurement": ["3.5", "4.5"]}, 75)]
+
+
+def test_iter_csv_chunks_quoted_line_breaks(tmp_path):
+    file_path = tmp_path / "dykes.csv"
+    file_path.write_bytes(b'Name,Description\nA,"line 1\nline 2"\nB,short\nC,"still being')
+
+    chunks = list(iter_csv_chunks(file_path, chunk_size=1, complete_lines_only=True))
+
+    assert chunks == [
+        ({"Name": ["A"], "Description": ["line 1\nline 2"]}, 35),
+        ({"Name": ["B"], "Description": ["short"]}, 43),
+    ]
+
+    with open(file_path, "ab") as file:
+        file.write(b'\nwritten"\n')
+    chunks = list(iter_csv_chunks(file_path, chunk_size=10, start_offset=43, complete_lines_only=True))
+    assert chunks == [({"Name": ["C"], "Description": ["still being\nwritten"]}, 67)]
+
+
+def test_iter_csv_chunks_empty_file(tmp_path):
+    file_path = tmp_path / "empty.csv"
+    file_path.write_text("")
+
+    assert list(iter_csv_chunks(file_path, chunk_size=2)) == []
+
+
+def test_convert_column():
+    values, failed = convert_column(["1.5", "abc", "3"], float)
+
+    assert values == [1.5, None, 3.0]
+    assert failed == {1}
+
+
+def test_convert_column_non_finite():
+    from ETL.strategies import _to_int
+
+    values, failed = convert_column(["1.4", "inf", "nan", "-2.6"], _to_int)
+
+    assert values == [1, None, None, -3]
+    assert failed == {1, 2}
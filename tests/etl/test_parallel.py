@@ -0,0 +1,142 @@
+''' ACCEPTANCE CRITERIA FOR PARALLEL LOADING
+- A directory expands to its files in sorted order, a pattern matching nothing to no files
+- Parsed rows are partitioned over the loaders by sensor
+- Files are parsed in bounded pieces that resume where the previous piece ended
+- Every loader receives the readings of its sensors in file order
+- A failing loader stops the load and reports what was committed before it
+'''
+import collections
+import contextlib
+import csv
+import io
+
+import pytest
+
+from ETL import parallel
+from ETL.etl import expand_sources
+from ETL.strategies import LOOKUPS, SENSOR_TYPES, SENSORS, UNITS
+
+
+SensorRow = collections.namedtuple("SensorRow", "name id sensor_type_id location_in_topology_id crossection_id")
+UnitRow = collections.namedtuple("UnitRow", "unit id")
+
+SENSOR_ID = 4  # Index of sensor_id in the rows of structure2
+VALUE = 5
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    # Preloaded lookups, as the workers get them, so nothing has to be fetched from the database
+    caches = {
+        SENSOR_TYPES: {},
+        UNITS: {"kPa": UnitRow("kPa", 7)},
+        SENSORS: {f"Sensor {i}": SensorRow(f"Sensor {i}", i, 1, 1, 1) for i in range(1, 4)},
+    }
+    for lookup in LOOKUPS:
+        monkeypatch.setattr(lookup, "cache", caches[lookup])
+        monkeypatch.setattr(lookup, "complete", True)
+        monkeypatch.setattr(lookup, "preload", lambda connection: None)
+
+
+def write_readings(path, readings):
+    lines = ["Identifier,Measurement,Time,MeasurementUnit"]
+    lines += [f"Sensor {sensor},{value},2024-08-03T11:{value % 60:02d}:00,kPa" for sensor, value in readings]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_expand_sources(tmp_path):
+    for name in ("b.csv", "a.csv", "notes.txt"):
+        (tmp_path / name).write_text("")
+
+    assert expand_sources(str(tmp_path)) == [str(tmp_path / "a.csv"), str(tmp_path / "b.csv")]
+    assert expand_sources(str(tmp_path / "*.txt")) == [str(tmp_path / "notes.txt")]
+    assert expand_sources(str(tmp_path / "b.csv")) == [str(tmp_path / "b.csv")]
+    assert expand_sources(str(tmp_path / "*.parquet")) == []
+
+
+def test_parse_piece(tmp_path, lookups):
+    file_path = write_readings(tmp_path / "logger.csv", [(1, 1), (2, 2), (3, 3), (9, 4), (1, 5)])
+
+    piece = parallel._parse_piece(file_path, 0, "structure2", chunk_size=2, loaders=2, start_offset=0,
+                                  chunks_per_task=2)
+
+    assert not piece.last
+    assert piece.rows_read == 4
+    assert piece.rows_rejected == 1  # Sensor 9 does not exist
+    # Sensor 1 and 3 go to the second loader, sensor 2 to the first
+    [first, second] = piece.chunks
+    assert [count for _, count in first] == [1, 1]
+    assert [count for _, count in second] == [0, 1]
+    assert next(csv.reader(io.StringIO(second[1][0])))[SENSOR_ID] == "3"
+
+    rest = parallel._parse_piece(file_path, 0, "structure2", chunk_size=2, loaders=2,
+                                 start_offset=piece.end_offset, chunks_per_task=2)
+
+    assert rest.last
+    assert rest.rows_read == 1
+    assert [count for _, count in rest.chunks[0]] == [0, 1]
+
+
+class FakeConnection:
+    def begin(self):
+        return contextlib.nullcontext()
+
+
+class FakeEngine:
+    @contextlib.contextmanager
+    def connect(self):
+        yield FakeConnection()
+
+
+@pytest.fixture
+def copied(monkeypatch):
+    copied = []
+
+    def copy_csv(connection, table, columns, data):
+        copied.append((connection, list(csv.reader(io.StringIO(data)))))
+
+    monkeypatch.setattr(parallel, "get_engine", FakeEngine)
+    monkeypatch.setattr(parallel, "copy_csv", copy_csv)
+    return copied
+
+
+def test_load_parallel_keeps_file_order(tmp_path, lookups, copied):
+    file_paths = [
+        write_readings(tmp_path / f"logger-{index}.csv", [(sensor, 10 * index + sensor) for sensor in (1, 2, 3)] * 3)
+        for index in range(4)
+    ]
+
+    report = parallel.load_parallel(file_paths, "structure2", chunk_size=2, workers=2, loaders=2,
+                                    chunks_per_task=1)
+
+    assert report.files == 4
+    assert report.load.rows == report.rows_read == 36
+    values_per_sensor = collections.defaultdict(list)
+    connections_per_sensor = collections.defaultdict(set)
+    for connection, rows in copied:
+        for row in rows:
+            values_per_sensor[row[SENSOR_ID]].append(int(row[VALUE]))
+            connections_per_sensor[row[SENSOR_ID]].add(connection)
+    for sensor, values in values_per_sensor.items():
+        assert values == sorted(values)
+        assert len(connections_per_sensor[sensor]) == 1
+
+
+def test_load_parallel_stops_on_failure(tmp_path, lookups, copied, monkeypatch):
+    file_paths = [write_readings(tmp_path / f"logger-{index}.csv", [(1, index)] * 10) for index in range(3)]
+    copy_csv = parallel.copy_csv
+
+    def failing_copy_csv(connection, table, columns, data):
+        if len(copied) == 2:
+            raise RuntimeError("connection lost")
+        copy_csv(connection, table, columns, data)
+
+    monkeypatch.setattr(parallel, "copy_csv", failing_copy_csv)
+
+    with pytest.raises(parallel.ParallelLoadError, match="connection lost") as error:
+        parallel.load_parallel(file_paths, "structure2", chunk_size=5, workers=1, loaders=1, chunks_per_task=1)
+
+    # Both chunks of the first file were committed, nothing after the failure
+    assert error.value.committed == dict(zip(file_paths, [10, 0, 0]))
+    assert len(copied) == 2
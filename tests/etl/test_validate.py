@@ -0,0 +1,104 @@
+''' ACCEPTANCE CRITERIA FOR DRY RUNS
+- Readings that occur twice in a file or are already stored are reported as duplicates
+- Timestamps with an offset are compared the way PostgreSQL stores them
+- Every rejected row is written to the reject file with the reason it was rejected
+'''
+import collections
+import contextlib
+import csv
+import datetime
+
+import pytest
+
+from ETL import validate
+from ETL.strategies import SENSORS, UNITS
+from ETL.validate import KeySet
+
+
+SensorRow = collections.namedtuple("SensorRow", "name id sensor_type_id location_in_topology_id crossection_id")
+UnitRow = collections.namedtuple("UnitRow", "unit id")
+
+
+def test_key_set_detects_duplicates():
+    keys = KeySet()
+    first = KeySet.key(1, datetime.datetime(2024, 1, 1, 12))
+    assert keys.add(first)
+    assert not keys.add(first)
+    assert KeySet.key(2, datetime.datetime(2024, 1, 1, 12)) not in keys
+
+
+def test_key_set_out_of_order():
+    keys = KeySet()
+    for hour in (12, 10, 14, 11):
+        assert keys.add(KeySet.key(1, datetime.datetime(2024, 1, 1, hour)))
+    assert not keys.add(KeySet.key(1, datetime.datetime(2024, 1, 1, 10)))
+    assert KeySet.key(1, datetime.datetime(2024, 1, 1, 13)) not in keys
+    assert list(keys.times[1]) == sorted(keys.times[1])
+
+
+def test_key_set_ignores_offset():
+    keys = KeySet()
+    keys.add(KeySet.key(1, datetime.datetime(2024, 1, 1, 12)))
+    # reading.time has no time zone, so PostgreSQL would store both timestamps the same way
+    assert KeySet.key(1, datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)) in keys
+
+
+class FakeEngine:
+    @contextlib.contextmanager
+    def connect(self):
+        yield None
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    # Preloaded lookups, so the dry run never needs the database
+    caches = {
+        SENSORS: {"Sensor 1": SensorRow("Sensor 1", 1, 1, 1, 1), "Loose": SensorRow("Loose", 2, 1, None, None)},
+        UNITS: {"kPa": UnitRow("kPa", 7)},
+    }
+    for lookup, cache in caches.items():
+        monkeypatch.setattr(lookup, "cache", cache)
+        monkeypatch.setattr(lookup, "complete", True)
+        monkeypatch.setattr(lookup, "preload", lambda connection: None)
+
+
+def test_validate_structure2(tmp_path, lookups, monkeypatch):
+    def load_stored_keys(connection, sensor_ids, stored):
+        stored.add(KeySet.key(1, datetime.datetime(2024, 8, 3, 10)))
+
+    monkeypatch.setattr(validate, "get_engine", FakeEngine)
+    monkeypatch.setattr(validate, "_load_stored_keys", load_stored_keys)
+    file_path = tmp_path / "readings.csv"
+    file_path.write_text(
+        "Identifier,Measurement,Time,MeasurementUnit\n"
+        "Sensor 1,1,2024-08-03T11:00:00,kPa\n"
+        "Sensor 1,2,yesterday,kPa\n"
+        "Sensor 1,abc,2024-08-03T11:01:00,kPa\n"
+        "Sensor 1,500,2024-08-03T11:02:00,kPa\n"
+        "Sensor 9,3,2024-08-03T11:03:00,kPa\n"
+        "Loose,4,2024-08-03T11:04:00,kPa\n"
+        "Sensor 1,5,2024-08-03T11:05:00,m\n"
+        "Sensor 1,6,2024-08-03T10:00:00+02:00,kPa\n"
+        "Sensor 1,7,2024-08-03T11:00:00,kPa\n"
+    )
+    reject_path = tmp_path / "rejects.csv"
+
+    report = validate.validate_structure2(str(file_path), chunk_size=4, reject_path=str(reject_path),
+                                          value_range=(0, 100))
+
+    assert report.rows_read == 9
+    assert report.rows_valid == 1
+    with open(reject_path, newline="") as reject_file:
+        rejects = list(csv.reader(reject_file))
+    assert rejects[0] == ["Identifier", "Measurement", "Time", "MeasurementUnit", "reason"]
+    assert [(row[1], row[-1]) for row in rejects[1:]] == [
+        ("2", "invalid time"),
+        ("abc", "invalid value"),
+        ("500", "value out of range"),
+        ("3", "unknown sensor"),
+        ("4", "sensor has no crossection"),
+        ("5", "unknown unit"),
+        ("6", "already in database"),
+        ("7", "duplicate in file"),
+    ]
+    assert sum(report.rejected.values()) == 8
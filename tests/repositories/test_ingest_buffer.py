@@ -0,0 +1,109 @@
+'''
+ACCEPTANCE CRITERIA FOR THE INGESTION BUFFER
+- Readings are written in batches, as soon as a batch is full or the flush interval passed
+- Every caller gets the result of its own reading back, a rejected reading does not fail the others
+- A reading the database refuses only rejects itself, the rest of its batch is still written
+- Stopping the buffer writes every queued reading, also the batch being written at that moment
+'''
+import asyncio
+import contextlib
+
+import pytest
+
+from app.repositories.ingest_buffer import IngestBufferFullError, ReadingIngestBuffer
+
+
+class FakeRepository:
+    batches: list[list[int]] = []
+    delay = 0.0
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    async def create_readings(self, payloads):
+        await asyncio.sleep(self.delay)
+        if any(payload == "broken" for payload in payloads):
+            raise RuntimeError("database refused the batch")
+        type(self).batches.append(list(payloads))
+        return [ValueError("Sensor not found") if payload < 0 else {"value": payload} for payload in payloads]
+
+
+@contextlib.asynccontextmanager
+async def fake_session():
+    yield None
+
+
+def make_buffer(batch_size=3, flush_interval=0.05, max_size=10, delay=0.0):
+    repository = type("Repository", (FakeRepository,), {"batches": [], "delay": delay})
+    buffer = ReadingIngestBuffer(fake_session, batch_size, flush_interval, max_size, repository_class=repository)
+    return buffer, repository
+
+
+@pytest.mark.asyncio
+async def test_flush_when_batch_is_full():
+    buffer, repository = make_buffer(batch_size=3, flush_interval=10)
+    results = await asyncio.wait_for(asyncio.gather(*(buffer.submit(value) for value in (1, 2, 3))), 1)
+
+    assert results == [{"value": 1}, {"value": 2}, {"value": 3}]
+    assert repository.batches == [[1, 2, 3]]
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_flush_after_interval():
+    buffer, repository = make_buffer(batch_size=100, flush_interval=0.05)
+
+    assert await asyncio.wait_for(buffer.submit(1), 1) == {"value": 1}
+    assert repository.batches == [[1]]
+    assert buffer.stats()["rows_flushed"] == 1
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_results_are_routed_per_reading():
+    buffer, _ = make_buffer()
+    results = await asyncio.gather(buffer.submit(1), buffer.submit(-1), buffer.submit(2), return_exceptions=True)
+
+    assert results[0] == {"value": 1}
+    assert isinstance(results[1], ValueError)
+    assert results[2] == {"value": 2}
+    assert buffer.stats()["rows_rejected"] == 1
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_without_the_broken_reading():
+    buffer, repository = make_buffer(batch_size=4)
+    results = await asyncio.gather(*(buffer.submit(value) for value in (1, 2, "broken", 3)), return_exceptions=True)
+
+    assert results[:2] == [{"value": 1}, {"value": 2}]
+    assert isinstance(results[2], RuntimeError)
+    assert results[3] == {"value": 3}
+    assert sorted(value for batch in repository.batches for value in batch) == [1, 2, 3]
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_writes_everything_queued():
+    buffer, repository = make_buffer(batch_size=2, flush_interval=10, delay=0.05)
+    for value in range(5):
+        await buffer.submit(value, wait=False)
+    await asyncio.sleep(0.01)  # Let the flusher start writing the first batch
+
+    await buffer.stop()
+
+    assert sorted(value for batch in repository.batches for value in batch) == [0, 1, 2, 3, 4]
+    assert buffer.stats()["rows_flushed"] == 5
+    assert buffer.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_refuses_readings():
+    buffer, _ = make_buffer(batch_size=100, flush_interval=10, max_size=2)
+    await buffer.submit(1, wait=False)
+    await buffer.submit(2, wait=False)
+
+    with pytest.raises(IngestBufferFullError):
+        await buffer.submit(3, wait=False)
+    assert buffer.stats()["rows_refused"] == 1
+    await buffer.stop()
@@ -0,0 +1,109 @@
+'''
+ACCEPTANCE CRITERIA FOR THE IN-MEMORY READING REPOSITORY
+- Readings are filtered like in the database: by time range (bounds included), sensor ids, or sensor names
+- Readings of several sensors come back ordered by time, also when they were added out of order
+- Readings come back in the shape of the database repositories, valid for the readings endpoint
+- Readings are created for known crossections and sensors only, with the unit of the sensor
+- The store can be loaded from another repository
+'''
+from datetime import datetime, timezone
+
+import pytest
+
+from app.apps.dykes import schemas
+from app.repositories.inmemory_repository import InMemoryReadingRepository
+
+
+def reading(id, sensor_id, day, hour=12, crossection="Crossection 1"):
+    return {
+        "id": id,
+        "crossection": crossection,
+        "sensor_id": sensor_id,
+        "sensor_name": f"Sensor {sensor_id}",
+        "sensor_type": "Piezometer",
+        "sensor_is_active": True,
+        "location_in_topology": [25.7, 39.9],
+        "unit": "Unit 1",
+        "value": day * 100 + hour,
+        "time": datetime(2022, 1, day, hour).isoformat(),
+    }
+
+
+@pytest.fixture
+def repository():
+    return InMemoryReadingRepository([
+        reading(1, 1, 1), reading(2, 1, 2), reading(3, 1, 3),
+        reading(4, 2, 1), reading(5, 2, 2), reading(6, 2, 3, crossection="Crossection 2"),
+        # Added out of order
+        reading(7, 3, 3), reading(8, 3, 1), reading(9, 3, 2, hour=18),
+    ])
+
+
+@pytest.mark.asyncio
+async def test_filters(repository):
+    async def ids(**filters):
+        return [r["id"] for r in await repository.get_readings(**filters)]
+
+    assert len(await ids()) == 9
+    assert await ids(sensor_ids=[1]) == [1, 2, 3]
+    assert await ids(sensor_ids=[3]) == [8, 9, 7]
+    assert await ids(sensor_ids=[1, 2], start_date=datetime(2022, 1, 2, 12)) == [2, 5, 3, 6]
+    assert await ids(sensor_ids=[2, 3], end_date=datetime(2022, 1, 2, 12)) == [4, 8, 5]
+    assert await ids(start_date=datetime(2022, 1, 2, 13), end_date=datetime(2022, 1, 2, 23)) == [9]
+    assert await ids(sensor_names=['"Sensor 2" ']) == [4, 5, 6]
+    assert await ids(sensor_ids=[1], sensor_names=["Sensor 2"]) == [1, 2, 3]
+    assert await ids(sensor_ids=[42]) == []
+    assert await ids(start_date=datetime(2022, 1, 3, 12, tzinfo=timezone.utc), sensor_ids=[1]) == [3]
+
+
+@pytest.mark.asyncio
+async def test_shape(repository):
+    readings = await repository.get_readings(sensor_ids=[2])
+
+    assert readings[-1] == reading(6, 2, 3, crossection="Crossection 2")
+    schemas.Readings(readings=readings)
+    # Crossections, units and coordinates are stored once
+    assert repository.crossections.values == ["Crossection 1", "Crossection 2"]
+    assert repository.locations.values == [[25.7, 39.9]]
+
+
+@pytest.mark.asyncio
+async def test_create_readings(repository):
+    payload = schemas.ReadingCreate(
+        crossection="Crossection 2", sensor_id=None, sensor_name="Sensor 1", sensor_is_active=True,
+        location_in_topology=[1.0, 2.0], unit="ignored", value=61, time=datetime(2022, 1, 2, 18),
+    )
+
+    created = await repository.create_reading(payload)
+
+    assert created["id"] == 10
+    assert created["unit"] == "Unit 1"
+    assert await repository.get_readings(sensor_ids=[1], start_date=datetime(2022, 1, 2, 13)) == [
+        created, reading(3, 1, 3),
+    ]
+
+    results = await repository.create_readings([
+        payload.model_copy(update={"crossection": "Crossection 9"}),
+        payload.model_copy(update={"sensor_name": "Sensor 9"}),
+        payload.model_copy(update={"location_in_topology": [1.0]}),
+        payload,
+    ])
+    assert [str(result) for result in results[:3]] == [
+        "Crossection not found", "Sensor not found", "Coordinates must be a list of two values",
+    ]
+    assert results[3]["id"] == 11
+    assert len(repository) == 11
+
+
+@pytest.mark.asyncio
+async def test_growth_and_load(repository):
+    for hour in reversed(range(24)):
+        for day in range(1, 10):
+            repository.add(reading(None, 4, day, hour))
+
+    loaded = await InMemoryReadingRepository.load(repository, sensor_ids=[4], start_date=datetime(2022, 1, 5))
+
+    times = [r["time"] for r in await loaded.get_readings()]
+    assert len(times) == 5 * 24
+    assert times == sorted(times)
+    assert times[0] == "2022-01-05T00:00:00"
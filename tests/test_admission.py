@@ -0,0 +1,128 @@
+''' ACCEPTANCE CRITERIA FOR ADMISSION CONTROL
+- Requests beyond the limit wait in a FIFO queue and are admitted in order
+- Requests finding the queue full, or waiting longer than the queue timeout, are rejected
+- The limit is cut when the database latency rises above the baseline, and grows back while it is used
+- A rejected request gets a 503 with Retry-After
+- Admission statistics are reported per kind of route
+'''
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.db import routes
+from app.utils.admission import AdaptiveLimiter, AdmissionRejectedError
+
+
+def limiter(**kwargs):
+    options = {"initial_limit": 1, "min_limit": 1, "max_limit": 4, "queue_size": 2, "queue_timeout": 1.0}
+    return AdaptiveLimiter("test", **{**options, **kwargs})
+
+
+@pytest.mark.asyncio
+async def test_queue_in_order():
+    admission = limiter()
+    order = []
+    release = asyncio.Event()
+
+    async def request(number):
+        async with admission.acquire():
+            order.append(number)
+            await release.wait()
+
+    tasks = [asyncio.create_task(request(number)) for number in range(3)]
+    await asyncio.sleep(0)
+    assert (admission.in_flight, admission.waiting) == (1, 2)
+
+    with pytest.raises(AdmissionRejectedError):
+        async with admission.acquire():
+            pass
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2]
+    assert admission.stats() | {"baseline_ms": None} == {
+        "limit": 1, "in_flight": 0, "waiting": 0, "baseline_ms": None, "admitted": 3, "queued": 2, "rejected": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout():
+    admission = limiter(queue_timeout=0.01)
+
+    async with admission.acquire():
+        with pytest.raises(AdmissionRejectedError):
+            async with admission.acquire():
+                pass
+        assert admission.waiting == 0
+
+    async with admission.acquire():
+        assert admission.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_passes_slot_on():
+    admission = limiter()
+    release = asyncio.Event()
+
+    async def hold():
+        async with admission.acquire():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    release.set()
+    await holder
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert (admission.in_flight, admission.waiting) == (0, 0)
+
+
+def test_limit_follows_latency():
+    admission = limiter(initial_limit=4, max_limit=8)
+    admission.in_flight = 4
+
+    admission.observe(0.001)
+    admission.observe(0.001)
+    assert admission.limit == pytest.approx(4.25 + 1 / 4.25)
+
+    limit = admission.limit
+    admission.observe(0.010)
+    assert admission.limit == pytest.approx(limit * 0.9)
+
+    limit = admission.limit
+    admission.observe(None, dropped=True)
+    assert admission.limit == pytest.approx(limit * 0.9)
+
+    for _ in range(100):
+        admission.observe(None, dropped=True)
+    assert admission.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_request(client: AsyncClient, monkeypatch):
+    full = limiter(queue_size=0)
+    full.in_flight = 1
+    monkeypatch.setitem(routes.limiters, "read", full)
+
+    response = client.get("/api/dykes/", params={"limit": 1})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_admission_stats(client: AsyncClient):
+    client.get("/api/dykes/", params={"limit": 1})
+
+    response = client.get("/api/admin/admission/")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["read"]["admitted"] >= 1
+    assert stats["read"]["in_flight"] == 0
+    assert set(stats["write"]) == set(stats["read"])
@@ -0,0 +1,99 @@
+''' ACCEPTANCE CRITERIA FOR EXPORT JOBS
+- POST /api/exports/ queues an export and answers 202 with its id, before it runs
+- The export reports its status and progress until its file can be downloaded
+- Downloads honour a single byte range with 206, and answer 416 to a range beyond the file
+- Exports are written as CSV, NDJSON or Parquet
+- Unknown and unfinished exports cannot be downloaded
+'''
+import json
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.apps.exports.jobs import exports
+from app.utils.responses import parse_range
+
+
+@pytest.fixture
+def export_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, "directory", tmp_path)
+    return tmp_path
+
+
+def wait_for(client, url):
+    for _ in range(200):
+        export = client.get(url).json()
+        if export["status"] in ("done", "failed"):
+            return export
+        time.sleep(0.05)
+    pytest.fail("Export did not finish")
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=100-", 100) == ()
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+
+
+@pytest.mark.asyncio
+async def test_csv_export(client: AsyncClient, export_directory):
+    response = client.post("/api/exports/", json={"format": "csv", "sensorId": [1, 2]})
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    export = wait_for(client, response.headers["location"])
+    assert export["status"] == "done", export["error"]
+    assert export["rows_written"] == export["rows_total"] > 0
+    assert export["progress"] == 1.0
+
+    download = client.get(export["download_url"])
+    assert download.status_code == 200
+    assert download.headers["accept-ranges"] == "bytes"
+    assert download.headers["content-type"].startswith("text/csv")
+    lines = download.text.splitlines()
+    assert lines[0] == "id,time,value,unit,sensor_id,sensor_name,sensor_type,crossection,dyke_id"
+    assert len(lines) == export["rows_total"] + 1
+    assert {line.split(",")[4] for line in lines[1:]} <= {"1", "2"}
+
+    partial = client.get(export["download_url"], headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 10-19/{export['size']}"
+    assert partial.content == download.content[10:20]
+
+    beyond = client.get(export["download_url"], headers={"Range": f"bytes={export['size']}-"})
+    assert beyond.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export(client: AsyncClient, export_directory):
+    response = client.post("/api/exports/", json={"format": "ndjson", "sensorName": ["Sensor 2"]})
+
+    export = wait_for(client, response.headers["location"])
+    assert export["status"] == "done", export["error"]
+    rows = [json.loads(line) for line in client.get(export["download_url"]).text.splitlines()]
+    assert len(rows) == export["rows_total"]
+    assert {row["sensor_name"] for row in rows} <= {"Sensor 2"}
+
+
+@pytest.mark.asyncio
+async def test_parquet_export(client: AsyncClient, export_directory, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = client.post("/api/exports/", json={"format": "parquet", "startDate": "2000-01-01T00:00:00"})
+
+    export = wait_for(client, response.headers["location"])
+    assert export["status"] == "done", export["error"]
+    path = tmp_path / "download.parquet"
+    path.write_bytes(client.get(export["download_url"]).content)
+    assert pq.read_table(path).num_rows == export["rows_total"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_export(client: AsyncClient, export_directory):
+    assert client.get("/api/exports/0123456789abcdef0123456789abcdef/").status_code == 404
+    assert client.get("/api/exports/..%2F..%2Fetc%2Fpasswd/").status_code == 404
+    assert client.get("/api/exports/0123456789abcdef0123456789abcdef/download").status_code == 404
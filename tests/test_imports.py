@@ -0,0 +1,18 @@
+''' ACCEPTANCE CRITERIA FOR IMPORT SIDE EFFECTS
+- Importing the models (migrations, the ETL) imports neither FastAPI nor the asyncpg driver
+- Engines are only created when first used
+'''
+import subprocess
+import sys
+
+
+def test_models_import_is_light():
+    code = (
+        "import sys, app.db.models, app.db.base as base\n"
+        "print('fastapi' in sys.modules, 'asyncpg' in sys.modules, 'engines' in vars(base))\n"
+        "base.engine\n"
+        "print('engines' in vars(base))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.split() == ["False", "False", "False", "True"]
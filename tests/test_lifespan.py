@@ -0,0 +1,49 @@
+''' ACCEPTANCE CRITERIA FOR THE LIFESPAN
+- Startup opens the connections of the interactive pool before the first request
+- Shutdown disposes the pools
+- While shutting down, new requests are answered with 503 and requests in flight are waited for
+'''
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.application import get_app
+from app.db import base
+from app.lifespan import drain
+from app.middleware import draining, request_metrics
+from app.settings import settings
+
+
+def test_warm_up_and_dispose(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_enabled", True)
+    with TestClient(get_app()):
+        # The connection of the test's own session is checked out
+        assert base.engine.pool.checkedin() + base.engine.pool.checkedout() == settings.db_pool_size
+    assert base.engine.pool.checkedin() == 0
+
+
+def test_draining_refuses_requests():
+    with TestClient(get_app()) as client:
+        draining.set()
+        response = client.get("/api/admin/ingest/")
+        draining.clear()
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_requests_in_flight(monkeypatch):
+    monkeypatch.setattr(request_metrics, "in_flight", 1)
+
+    async def finish_request():
+        await asyncio.sleep(0.1)
+        request_metrics.in_flight -= 1
+
+    started = time.monotonic()
+    await asyncio.gather(drain(timeout=5), finish_request())
+    draining.clear()
+
+    assert 0.1 <= time.monotonic() - started < 1
@@ -0,0 +1,124 @@
+''' ACCEPTANCE CRITERIA FOR LIVE READINGS
+- Subscribers receive the readings matching their sensor and crossection filters
+- Readings arriving together are sent in one message
+- A slow subscriber keeps the latest readings of a bounded buffer, and learns how many were dropped
+- Readings are streamed as server-sent events, with heartbeats while there are none
+- A stored reading is pushed to the WebSocket subscribers
+- With the postgres bus, readings go through NOTIFY to the listener of every worker
+'''
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import live
+from app.live import LiveReadings, live_events, live_readings
+
+
+def reading(id, sensor_id=1, crossection="Crossection 1"):
+    return {"id": id, "sensor_id": sensor_id, "sensor_name": f"Sensor {sensor_id}", "crossection": crossection,
+            "unit": "Unit 1", "value": id, "time": "2024-08-03T11:48:14", "sensor_type": "Piezometer"}
+
+
+@pytest.mark.asyncio
+async def test_filters_and_coalescing():
+    bus = LiveReadings("memory", "test", buffer_size=10, flush_interval=0.01)
+    everything = bus.subscribe()
+    sensor = bus.subscribe(sensor_ids=[2])
+    both = bus.subscribe(sensor_ids=[1, 2], crossections=["Crossection 2"])
+
+    bus.publish([reading(1), reading(2, sensor_id=2), reading(3, crossection="Crossection 2")])
+
+    message = await everything.next(timeout=1)
+    assert [r["id"] for r in message["readings"]] == [1, 2, 3]
+    assert "sensor_type" not in message["readings"][0]
+    assert [r["id"] for r in (await sensor.next(timeout=1))["readings"]] == [2]
+    assert [r["id"] for r in (await both.next(timeout=1))["readings"]] == [3]
+
+    bus.unsubscribe(everything)
+    bus.publish([reading(4)])
+    assert everything.closed
+    assert bus.stats()["subscribers"] == 2
+
+
+@pytest.mark.asyncio
+async def test_bounded_buffer():
+    bus = LiveReadings("memory", "test", buffer_size=3, flush_interval=0)
+    subscription = bus.subscribe()
+
+    bus.publish([reading(id) for id in range(5)])
+
+    message = await subscription.next(timeout=1)
+    assert [r["id"] for r in message["readings"]] == [2, 3, 4]
+    assert message["dropped"] == 2
+    assert await subscription.next(timeout=0.01) is None
+
+
+@pytest.mark.asyncio
+async def test_server_sent_events(monkeypatch):
+    monkeypatch.setattr(live.settings, "live_heartbeat_s", 0.01)
+    subscription = live_readings.subscribe(sensor_ids=[1])
+    events = live_events(subscription)
+
+    assert await anext(events) == "retry: 1000\n\n"
+    assert await anext(events) == ": keep-alive\n\n"
+    live_readings.publish([reading(7)])
+    event = await anext(events)
+    assert event.startswith("event: readings\ndata: {\"readings\":[{\"id\":7,")
+    assert event.endswith(',"dropped":0}\n\n')
+
+    await events.aclose()
+    assert subscription.closed
+
+
+@pytest.mark.asyncio
+async def test_websocket(client: TestClient):
+    payload = {
+        "crossection": "Crossection 4-2",
+        "sensor_id": 2,
+        "sensor_name": "Sensor 2",
+        "sensor_is_active": True,
+        "location_in_topology": [25.742971005268636, 39.978211040045174],
+        "unit": "Unit 1",
+        "value": 61,
+        "time": "2024-08-03T11:48:14.460881",
+    }
+    with client.websocket_connect("/api/readings/live?sensorId=2") as websocket:
+        response = client.post("/api/readings/", json=payload)
+        assert response.status_code == 201
+
+        message = websocket.receive_json()
+        assert message["readings"] == [{
+            "id": response.json()["id"],
+            "sensor_id": 2,
+            "sensor_name": "Sensor 2",
+            "crossection": "Crossection 4-2",
+            "unit": "Unit 1",
+            "value": 61,
+            "time": "2024-08-03T11:48:14.460881",
+        }]
+
+
+@pytest.mark.asyncio
+async def test_postgres_bus():
+    bus = LiveReadings("postgres", "geodykes_readings_test", buffer_size=1000, flush_interval=0)
+    await bus.start()
+    try:
+        for _ in range(100):
+            if bus.stats()["listening"]:
+                break
+            await asyncio.sleep(0.05)
+        subscription = bus.subscribe(crossections=["Crossection 2"])
+
+        # Larger than a NOTIFY payload can hold, so it is sent in several
+        bus.publish([reading(id, crossection="Crossection 2") for id in range(100)])
+
+        received = []
+        while len(received) < 100:
+            message = await subscription.next(timeout=5)
+            assert message is not None
+            received += message["readings"]
+        assert [r["id"] for r in received] == list(range(100))
+    finally:
+        await bus.stop()
+    assert subscription.closed
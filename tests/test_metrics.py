@@ -0,0 +1,48 @@
+''' ACCEPTANCE CRITERIA FOR /metrics
+- Metrics are served in the Prometheus text exposition format
+- Request latency and statements per request are labeled by method and route
+- Pool usage is reported per pool
+- Histogram buckets are cumulative and end with +Inf
+'''
+import pytest
+from httpx import AsyncClient
+
+from app.utils.metrics import Histogram, PrometheusWriter
+
+
+def test_histogram_exposition():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+    writer = PrometheusWriter()
+    writer.family("latency_seconds", "histogram", "Latency")
+    writer.histogram("latency_seconds", histogram, {"route": '/a"b'})
+
+    assert writer.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a\\"b"} 5.55',
+        'latency_seconds_count{route="/a\\"b"} 3',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient):
+    client.get("/api/dykes/", params={"limit": 1})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = dict(line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#"))
+    labels = 'method="GET",route="/api/dykes/"'
+    assert int(samples[f'geodykes_http_request_duration_seconds_count{{{labels}}}']) >= 1
+    assert float(samples[f'geodykes_http_request_statements_sum{{{labels}}}']) >= 1
+    assert samples['geodykes_http_requests_in_flight'] == "1"
+    assert 'geodykes_db_pool_checked_out{pool="interactive"}' in samples
+    assert 'geodykes_db_pool_wait_seconds_bucket{pool="interactive",le="+Inf"}' in samples
+    assert 'geodykes_ingest_rows_total{outcome="flushed"}' in samples
+    assert "geodykes_event_loop_lag_seconds_count" in samples
@@ -0,0 +1,71 @@
+''' ACCEPTANCE CRITERIA FOR REQUEST PROFILING
+- Requests sent with an X-Profile header are profiled when profiling is enabled, others are not
+- Samples are attributed to the request's frames while its task runs, and to (awaiting) while it waits
+- Profiles are downloaded as collapsed stacks or as a speedscope file
+'''
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.application import get_app
+from app.profiling import AWAITING, Profile, Sampler
+from app.settings import settings
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def profiled(sampler):
+    profile = Profile(1, "GET", "/", "", interval=0.001)
+    sampler.add(profile)
+    busy(0.05)
+    await asyncio.sleep(0.05)
+    sampler.remove()
+    return profile
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("main_thread", [True, False])
+async def test_sampler_attributes_request_frames(main_thread):
+    # Off the main thread the sampler falls back from the interval timer to a sampling thread
+    if main_thread:
+        profile = await profiled(Sampler())
+    else:
+        profile = await asyncio.to_thread(asyncio.run, profiled(Sampler()))
+
+    functions = {function for stack in profile.samples for function, _, _ in stack}
+    assert "busy" in functions
+    assert profile.samples[(AWAITING,)] > 0
+
+
+def test_profile_formats():
+    profile = Profile(1, "GET", "/api/readings/", "", interval=0.001)
+    profile.samples[(("main", "app.py", 1), ("list_readings", "views.py", 10))] = 3
+    profile.samples[(AWAITING,)] = 2
+
+    assert profile.collapsed() == "main (app.py:1);list_readings (views.py:10) 3\n(awaiting) 2\n"
+    speedscope = profile.speedscope()
+    assert [frame["name"] for frame in speedscope["shared"]["frames"]] == ["main", "list_readings", "(awaiting)"]
+    assert speedscope["profiles"][0]["samples"] == [[0, 1], [2]]
+    assert speedscope["profiles"][0]["weights"] == [3.0, 2.0]
+
+
+def test_profiled_request(monkeypatch):
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+    with TestClient(get_app()) as client:
+        assert "x-profile-id" not in client.get("/api/admin/ingest/").headers
+
+        response = client.get("/api/admin/ingest/", headers={"X-Profile": "1"})
+        profile_id = response.headers["x-profile-id"]
+
+        assert client.get("/api/admin/profiles/").json()["profiles"][0]["id"] == int(profile_id)
+        speedscope = client.get(f"/api/admin/profiles/{profile_id}").json()
+        assert speedscope["profiles"][0]["type"] == "sampled"
+        collapsed = client.get(f"/api/admin/profiles/{profile_id}", params={"format": "collapsed"})
+        assert collapsed.headers["content-type"].startswith("text/plain")
+        assert client.get("/api/admin/profiles/0").status_code == 404